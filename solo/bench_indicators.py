@@ -0,0 +1,54 @@
+# 对比原来逐行循环的 calculate_obv 和 indicators 模块中向量化实现的耗时
+# 用法：python solo/bench_indicators.py [bars ...]
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+import numpy as np
+import pandas as pd
+from src.data_visualization import indicators
+
+# 原来 candlestick_plot.calculate_obv 的循环实现
+def calculate_obv_loop(df):
+    obv = [0]
+    for i in range(1, len(df)):
+        if df["Close"].iloc[i] > df["Close"].iloc[i - 1]:
+            obv.append(obv[-1] + df["Volume"].iloc[i])
+        elif df["Close"].iloc[i] < df["Close"].iloc[i - 1]:
+            obv.append(obv[-1] - df["Volume"].iloc[i])
+        else:
+            obv.append(obv[-1])
+    return pd.Series(obv, index=df.index)
+
+# 生成随机游走的日线数据
+def make_bars(n, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    open_ = close * (1 + rng.normal(0, 0.005, n))
+    high = np.maximum(open_, close) * (1 + rng.random(n) * 0.01)
+    low = np.minimum(open_, close) * (1 - rng.random(n) * 0.01)
+    return pd.DataFrame({
+        "Date": pd.bdate_range("1990-01-01", periods=n),
+        "Open": open_.round(2), "High": high.round(2), "Low": low.round(2), "Close": close.round(2),
+        "Volume": rng.integers(1_000, 10_000_000, n),
+    })
+
+def best_of(func, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000]
+    for n in sizes:
+        df = make_bars(n)
+        assert np.allclose(calculate_obv_loop(df).to_numpy(dtype=float), indicators.obv(df).to_numpy())
+        loop = best_of(lambda: calculate_obv_loop(df), repeat=3)
+        vectorized = best_of(lambda: indicators.obv(df))
+        print(f"{n:>7} bars  OBV loop: {loop * 1000:9.2f} ms  vectorized: {vectorized * 1000:7.3f} ms  ({loop / vectorized:,.0f}x)")
+        for name in indicators.INDICATOR_LINES:
+            print(f"{'':>13}{name:<10} {best_of(lambda: indicators.indicator_lines(name, df)) * 1000:7.3f} ms")
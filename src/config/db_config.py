@@ -11,6 +11,16 @@ DB_CONFIG: Dict[str, Any] = {
     "port": os.getenv("DB_PORT", "5432")
 }
 
+# stock_daily 分区与迁移配置
+SCHEMA_CONFIG: Dict[str, Any] = {
+    # 没有数据时创建年度分区的起始年份
+    "partition_start_year": int(os.getenv("PARTITION_START_YEAR", "1990")),
+    # 提前创建未来几年的分区，避免新数据落入 DEFAULT 分区
+    "future_years": int(os.getenv("PARTITION_FUTURE_YEARS", "1")),
+    # 在线迁移时每个事务复制的 ticker 数
+    "migration_batch_tickers": int(os.getenv("MIGRATION_BATCH_TICKERS", "200")),
+}
+
 def update_db_config(new_config: Dict[str, Any]) -> None:
     """更新数据库配置"""
     global DB_CONFIG
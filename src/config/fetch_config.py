@@ -0,0 +1,100 @@
+import os
+from typing import Dict, Any
+
+# 数据获取相关配置，可通过环境变量覆盖
+FETCH_CONFIG: Dict[str, Any] = {
+    # 并发拉取 K 线的线程数（LongPort 行情接口同时最多 5 个并发请求）
+    "max_workers": int(os.getenv("FETCH_MAX_WORKERS", "5")),
+    # 同时在途的任务数 = max_workers * in_flight_factor，避免结果堆积在内存里
+    "in_flight_factor": int(os.getenv("FETCH_IN_FLIGHT_FACTOR", "2")),
+    # 写入阶段攒够多少个 ticker 后批量写一次 stock_daily
+    "write_batch_tickers": int(os.getenv("FETCH_WRITE_BATCH_TICKERS", "200")),
+    # 被限流时的最大重试次数和初始退避时间（秒）
+    "max_retries": int(os.getenv("FETCH_MAX_RETRIES", "3")),
+    "retry_backoff": float(os.getenv("FETCH_RETRY_BACKOFF", "1.0")),
+    # 读时复权：stock_daily 只存不复权的原始 K 线，拆股不再改写历史数据，读取时按 split_factors 复权。
+    # 只在 stock_daily 为空时生效：第一次使用时存储口径被记录到 stock_daily_storage 表，之后以记录为准，
+    # 避免已有的前复权数据和新写入的原始数据混在一起、读时再被复权一次。
+    # 切换口径：TRUNCATE stock_daily、DELETE FROM stock_daily_storage（或换一个空库），设置该变量后重新拉取
+    "adjust_on_read": os.getenv("STOCKLI_ADJUST_ON_READ", "0") == "1",
+    # symbol_mapping 中经 LongPort 验证的 WARRANT 映射的有效期（天），过期后重新验证
+    "symbol_revalidate_days": int(os.getenv("SYMBOL_REVALIDATE_DAYS", "30")),
+    # 关闭窗口时等待刷新流水线在安全点退出的最长时间（秒），超时后才强制终止线程
+    "shutdown_timeout": float(os.getenv("FETCH_SHUTDOWN_TIMEOUT", "30")),
+}
+
+def update_fetch_config(new_config: Dict[str, Any]) -> None:
+    """更新数据获取配置"""
+    global FETCH_CONFIG
+    FETCH_CONFIG.update(new_config)
+
+# LongPort 行情接口配额（次/秒），所有调用方共享
+# 官方限制：每秒不超过 10 次请求，同时并发不超过 5 个
+LONGPORT_QUOTAS: Dict[str, Any] = {
+    "global_rate": float(os.getenv("LONGPORT_GLOBAL_RATE", "10")),
+    "max_concurrency": int(os.getenv("LONGPORT_MAX_CONCURRENCY", "5")),
+    "endpoints": {
+        "candlesticks": float(os.getenv("LONGPORT_CANDLESTICKS_RATE", "8")),
+        "trading_days": float(os.getenv("LONGPORT_TRADING_DAYS_RATE", "1")),
+        "trading_session": float(os.getenv("LONGPORT_TRADING_SESSION_RATE", "1")),
+        "default": float(os.getenv("LONGPORT_DEFAULT_RATE", "2")),
+    },
+    # 被限流后速率下限，以及每次成功调用恢复的速率
+    "min_rate": 0.5,
+    "recover_step": 0.1,
+    # LongPort 返回的限流错误码
+    "throttle_codes": {301606, 429},
+}
+
+# LongPort QuoteContext 连接池配置
+LONGPORT_POOL: Dict[str, Any] = {
+    # 最多同时存在的长连接数：一个 QuoteContext 即可并发请求，LongPort 还限制每个账号的长连接数，
+    # 默认只用一个共享连接，需要时再显式调大
+    "size": int(os.getenv("LONGPORT_POOL_SIZE", "1")),
+    # 空闲超过该秒数的连接在借出前先做健康检查
+    "health_interval": float(os.getenv("LONGPORT_POOL_HEALTH_INTERVAL", "60")),
+}
+
+# 交易日历缓存配置
+TRADING_CALENDAR_CONFIG: Dict[str, Any] = {
+    # 磁盘缓存的有效期（小时），过期或不再覆盖今天时重新向 LongPort 获取
+    "ttl_hours": float(os.getenv("TRADING_CALENDAR_TTL_HOURS", "12")),
+    # 每次获取的交易日范围（向前的天数，LongPort 单次查询不超过一个月）
+    "lookback_days": 30,
+}
+
+# 可视化页面 K 线缓存配置
+FRAME_CACHE_CONFIG: Dict[str, Any] = {
+    # 缓存的 DataFrame 总大小上限（字节）
+    "max_bytes": int(float(os.getenv("FRAME_CACHE_MB", "256")) * 1024 * 1024),
+}
+
+# 可视化页面预取配置
+PREFETCH_CONFIG: Dict[str, Any] = {
+    # 加载 / 预取共用线程池的线程数
+    "threads": int(os.getenv("PREFETCH_THREADS", "2")),
+    # 当前 ticker 前后各预取几个
+    "neighbours": int(os.getenv("PREFETCH_NEIGHBOURS", "2")),
+    # 每次最多预取的 ticker 数
+    "max_tickers": int(os.getenv("PREFETCH_MAX_TICKERS", "6")),
+    # 记录的最近浏览 ticker 数
+    "history_size": 20,
+}
+
+# 股票代码搜索配置
+SEARCH_CONFIG: Dict[str, Any] = {
+    # 输入搜索文本时选择器最多显示的结果数
+    "max_results": int(os.getenv("SEARCH_MAX_RESULTS", "500")),
+    # ticker / 名称快照的有效期（天），过期后启动时重新查询 tickers_fundamental
+    "snapshot_ttl_days": float(os.getenv("SEARCH_SNAPSHOT_TTL_DAYS", "7")),
+}
+
+# Polygon.io 参考数据接口配置
+POLYGON_CONFIG: Dict[str, Any] = {
+    # 订阅计划：basic / starter / developer / advanced，决定默认请求速率（其他值按 basic 处理并记录警告）
+    "plan": os.getenv("POLYGON_PLAN", "basic"),
+    # 手动指定速率（次/秒），优先于 plan
+    "rate": float(os.getenv("POLYGON_RATE")) if os.getenv("POLYGON_RATE") else None,
+    "timeout": float(os.getenv("POLYGON_TIMEOUT", "30")),
+    "max_retries": int(os.getenv("POLYGON_MAX_RETRIES", "3")),
+}
@@ -16,11 +16,13 @@ RESOURCES_DIR = os.path.join(BASE_DIR, "resources")
 ERRORstock_DIR = os.path.join(RESOURCES_DIR, "csv")
 CSV_DIR = os.path.join(RESOURCES_DIR, "csv")
 ICONS_DIR = os.path.join(RESOURCES_DIR, "icons")
+# 本地缓存目录（交易日历等）
+CACHE_DIR = os.path.join(RESOURCES_DIR, "cache")
 # 日志文件路径
 LOG_PATH = os.path.join(BASE_DIR, "logs")
 
 # 创建必要的目录
-for directory in [RESOURCES_DIR, ERRORstock_DIR, CSV_DIR, ICONS_DIR, LOG_PATH]:
+for directory in [RESOURCES_DIR, ERRORstock_DIR, CSV_DIR, ICONS_DIR, CACHE_DIR, LOG_PATH]:
     if not os.path.exists(directory):
         os.makedirs(directory, mode=0o777, exist_ok=True)
 
@@ -28,4 +30,6 @@ for directory in [RESOURCES_DIR, ERRORstock_DIR, CSV_DIR, ICONS_DIR, LOG_PATH]:
 STOCK_LIST_PATH = os.path.join(CSV_DIR, "stock_list.csv")
 ICON_PATH = os.path.join(ICONS_DIR, "ChatGPT Image Jun 15, 2025, 09_49_44 PM.png")
 DOWNLOAD_ICON_PATH = os.path.join(ICONS_DIR, "download_icon.png")
-ERRORstock_PATH = os.path.join(ERRORstock_DIR, "error_log_enriched_errorout.csv")
\ No newline at end of file
+ERRORstock_PATH = os.path.join(ERRORstock_DIR, "error_log_enriched_errorout.csv")
+TRADING_CALENDAR_PATH = os.path.join(CACHE_DIR, "trading_calendar.json")
+TICKER_SEARCH_PATH = os.path.join(CACHE_DIR, "ticker_search.json")
\ No newline at end of file
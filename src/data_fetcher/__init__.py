@@ -1,8 +1,8 @@
 from .batch_fetcher import BatchDataFetcher
-from .data_loader import DataLoader  # 导入 DataLoader
+from .prefetcher import FramePrefetcher  # 导入 FramePrefetcher
 
 # 定义包的公开接口
 __all__ = [
     "BatchDataFetcher",
-    "DataLoader",
-]
\ No newline at end of file
+    "FramePrefetcher",
+]
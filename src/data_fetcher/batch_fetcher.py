@@ -1,18 +1,27 @@
 # 执行获取股票数据
 from PySide6.QtCore import QThread, Signal
-from longport.openapi import QuoteContext, Config, Period, AdjustType, OpenApiException
+from longport.openapi import Period, AdjustType, OpenApiException
 import os
 import time
 from datetime import datetime
-from src.database.db_operations import save_to_table, fetch_table_names, clean_symbol_for_postgres
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from src.database.db_operations import bulk_save_to_table, should_skip_save, fetch_table_names, clean_symbol_for_postgres, candle_to_row
 from src.utils.logger import setup_logger
 from src.config.paths import ERRORstock_PATH
 from src.database.db_connection import get_engine
+from src.database.freshness_index import freshness_index
+from src.database.ticker_registry import count_registered_tickers, fetch_latest_timestamp
+from src.database.symbol_mapping import symbol_mapping
+from src.database.indicator_state import advance_indicator_states
+from src.database.price_adjustment import storage_adjust_type
 from sqlalchemy.sql import text
 from src.config.db_config import DB_CONFIG
+from src.config.fetch_config import FETCH_CONFIG
 import psycopg2
 from pytz import timezone
 from src.utils.time_teller import get_latest_date_from_longport
+from src.utils.quote_pool import quote_pool
+from src.data_fetcher.pipeline import StageCancelled, raise_if_cancelled
 
 logger = setup_logger("batch_fetcher")
 
@@ -24,53 +33,60 @@ class BatchDataFetcher(QThread):
     progress_updated = Signal(dict)
     fetch_complete = Signal(str)
     error_occurred = Signal(str)
+    # 一批 ticker 的新 K 线写入 stock_daily 后发出，参数为 ticker 列表
+    data_written = Signal(list)
 
-    def __init__(self, stock_symbols):
+    def __init__(self, stock_symbols, max_workers=None):
         super().__init__()
         self.stock_symbols = stock_symbols
         self.error_log_path = ERRORstock_PATH
         self.start_time = None
+        self.cancel_event = None
+        self.max_workers = max_workers or FETCH_CONFIG["max_workers"]
 
     def run(self):
+        try:
+            self.fetch_all()
+        except Exception as e:
+            self.error_occurred.emit(f"批量获取数据失败: {e}")
+
+    # 执行完整的批量增量更新；也可以作为流水线阶段在其他线程中直接调用
+    # cancel_event 被设置后不再提交新的 ticker，已拉取的结果照常写库，之后抛出 StageCancelled；
+    # 其他失败记录日志后重新抛出，由流水线把阶段标记为 failed 并跳过下游阶段
+    def fetch_all(self, cancel_event=None):
+        self.cancel_event = cancel_event
         try:
             self.start_time = time.time()
-            config = Config.from_env()
-            ctx = QuoteContext(config)
             self.error_count = 0
 
             # 获取 LongPort 最新数据日期,同时检查是否在交易时间内
             latest_date = get_latest_date_from_longport()
             if not latest_date:
-                logger.error("无法从 Longport 获取最新数据日期")
-                return
+                raise RuntimeError("无法从 Longport 获取最新数据日期")
 
             # 获取所有 ticker 的最新日期
             ticker_latest_dates = self.get_ticker_latest_dates_from_db()
             ticker_details = self.fetch_ticker_details(self.stock_symbols)
             
-            self.incremental_update(ctx, latest_date, ticker_latest_dates, ticker_details)
+            self.incremental_update(latest_date, ticker_latest_dates, ticker_details)
 
+        except StageCancelled:
+            raise
         except Exception as e:
             logger.error(f"批量获取数据失败: {e}")
-            print(e)
+            raise
+        finally:
+            # freshness index 只在本轮更新内有效，结束后清空，之后的写入回退到数据库查询，
+            # 避免用过期快照判断其他进程写入的数据
+            freshness_index.invalidate()
 
-    # 新增：批量获取每个 ticker 的最新日期
+    # 批量获取每个 ticker 的最新日期（同时加载 freshness index，供 save_to_table 复用）
     def get_ticker_latest_dates_from_db(self):
-        try:
-            engine = get_engine()
-            if engine is None:
-                logger.error("数据库引擎未初始化，无法获取每个 ticker 的最新日期")
-                return {}
-            with engine.connect() as conn:
-                result = conn.execute(text("""
-                    SELECT ticker, MAX(timestamp) as latest_date
-                    FROM stock_daily
-                    GROUP BY ticker
-                """))
-                return {row[0]: row[1] for row in result.fetchall()}
-        except Exception as e:
-            logger.error(f"获取每个 ticker 的最新日期失败: {e}")
+        engine = get_engine()
+        if engine is None:
+            logger.error("数据库引擎未初始化，无法获取每个 ticker 的最新日期")
             return {}
+        return freshness_index.load(engine)
                 
     # 从数据库查询 ticker 的 type 和 primary_exchange
     def fetch_ticker_details(self, tickers):
@@ -93,74 +109,154 @@ class BatchDataFetcher(QThread):
         ticker_details = {row[0]: (row[1], row[2]) for row in results}
         return ticker_details
 
-    # 修改：incremental_update 根据每个 ticker 的最新日期决定更新
-    def incremental_update(self, ctx, latest_date, ticker_latest_dates, ticker_details):
+    # 工作线程：只负责网络请求（连接从 quote_pool 借出，限流和退避由 longport_quota 处理），返回 (symbol, cleaned_symbol, db_latest_date, resp)，无需更新时返回 None
+    def fetch_task(self, symbol, latest_date, ticker_latest_dates, ticker_details):
+        if symbol not in ticker_details:
+            logger.warning(f"No details found for {symbol}")
+            return None
+
+        ticker_type, primary_exchange = ticker_details[symbol]
+        cleaned_symbol = clean_symbol_for_postgres(symbol, ticker_type, primary_exchange)
+        db_latest_date = ticker_latest_dates.get(cleaned_symbol)
+
+        # 如果数据库中没有数据或 LongPort 数据更新，则更新
+        if db_latest_date is not None and latest_date <= db_latest_date:
+            logger.debug(f"{cleaned_symbol} 数据已是最新，无需更新")
+            return None
+        delta_days = (latest_date - (db_latest_date or datetime.min)).days
+        if delta_days <= 0:
+            return None
+
+        print(f"Fetching data for {cleaned_symbol} with delta_days={delta_days}")
+        with quote_pool.connection() as ctx:
+            resp = ctx.candlesticks(f"{cleaned_symbol}.US", Period.Day, delta_days, storage_adjust_type())
+        return symbol, cleaned_symbol, db_latest_date, resp
+
+    # 写入阶段：在 QThread 中串行消费工作线程的结果，攒批后写入 stock_daily
+    def write_result(self, result, latest_date, engine, conn, cursor):
+        symbol, cleaned_symbol, db_latest_date, resp = result
+        if not resp or not hasattr(resp[0], "timestamp"):
+            logger.warning(f"No data returned for {cleaned_symbol}")
+            return
+
+        # 有数据，处理 timestamp
+        ts = resp[-1].timestamp
+        if isinstance(ts, datetime):
+            ts_cmp = ts.strftime("%Y-%m-%d")
+        else:
+            ts_clean = ts.replace("T", " ").replace("Z", "")
+            ts_cmp = datetime.strptime(ts_clean, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d")
+
+        print(f"Ticker: {cleaned_symbol}, lates_longport_data_timestamp: {ts_cmp}")
+
+        # 判断是否能获取正常更新时间的数据
+        if ts_cmp != latest_date.strftime("%Y-%m-%d"):
+            cursor.execute("SELECT active FROM tickers_fundamental WHERE ticker = %s", (symbol,))
+            active_status = cursor.fetchone()[0]
+            if active_status is None:
+                logger.warning(f"{cleaned_symbol} 在 tickers_fundamental 中没有 active 状态，无法判断是否退市")
+                cursor.execute("UPDATE tickers_fundamental SET active = FALSE WHERE ticker = %s", (symbol,))
+                conn.commit()
+                return
+
+        # 其余情况都保存数据（freshness index 已加载，跳过判断不会再查库）
+        if should_skip_save(resp, cleaned_symbol, engine):
+            logger.info(f"跳过保存 {cleaned_symbol}，数据已是最新")
+            return
+        self.pending_writes[cleaned_symbol] = (symbol, resp)
+        if len(self.pending_writes) >= FETCH_CONFIG["write_batch_tickers"]:
+            self.flush_writes(engine)
+
+    # 将攒下的多个 ticker 一次性写入 stock_daily
+    def flush_writes(self, engine):
+        if not self.pending_writes:
+            return
+        batch, self.pending_writes = self.pending_writes, {}
+        try:
+            bulk_save_to_table({cleaned_symbol: resp for cleaned_symbol, (_, resp) in batch.items()}, engine)
+        except Exception as e:
+            for symbol, _ in batch.values():
+                self.record_error(symbol, e)
+            return
+        # 用新 K 线推进增量指标状态，无需重算全量历史（还没有状态的 ticker 用已写入的历史初始化）；
+        # 在通知之前完成，收到 data_written 后重新读取的图表能拿到最新的状态
+        try:
+            advance_indicator_states({
+                cleaned_symbol: [(row[1], row[5], row[6]) for row in (candle_to_row(cleaned_symbol, c) for c in resp)]
+                for cleaned_symbol, (_, resp) in batch.items()
+            })
+        except Exception as e:
+            logger.error(f"推进指标状态失败: {e}")
+        self.data_written.emit(list(batch.keys()))
+
+    # 记录单个 ticker 的失败信息
+    def record_error(self, symbol, error):
+        self.error_count += 1
+        error_message = f"更新 {symbol} 数据失败: {str(error)}"
+        logger.error(error_message)
+        with open(self.error_log_path, mode="a", newline="", encoding="utf-8") as file:
+            file.write(f"{symbol},{error_message}\n")
+
+    # incremental_update 根据每个 ticker 的最新日期决定更新
+    # 工作线程池并发拉取 K 线，当前 QThread 作为写入阶段串行写库
+    def incremental_update(self, latest_date, ticker_latest_dates, ticker_details):
         total = len(self.stock_symbols)
+        max_in_flight = self.max_workers * FETCH_CONFIG["in_flight_factor"]
+        submitted = 0
+        completed = 0
+        self.pending_writes = {}
+        engine = get_engine()
         conn = get_db_connection()
         cursor = conn.cursor()
         try:
-            for i, symbol in enumerate(self.stock_symbols, 1):
-                try:
-                    if symbol not in ticker_details:
-                        logger.warning(f"No details found for {symbol}")
-                        continue
-
-                    ticker_type, primary_exchange = ticker_details[symbol]
-                    cleaned_symbol = clean_symbol_for_postgres(symbol, ticker_type, primary_exchange)
-                    db_latest_date = ticker_latest_dates.get(cleaned_symbol)
-                    
-                    # 如果数据库中没有数据或 LongPort 数据更新，则更新
-                    if db_latest_date is None or latest_date > db_latest_date:
-                        delta_days = (latest_date - (db_latest_date or datetime.min)).days
-                        if delta_days <= 0:
-                            continue
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="candlesticks") as executor:
+                pending = {}
+
+                # 保持在途任务数不超过 max_in_flight
+                def submit_next():
+                    nonlocal submitted
+                    if submitted >= total or self.cancel_event is not None and self.cancel_event.is_set():
+                        return False
+                    symbol = self.stock_symbols[submitted]
+                    submitted += 1
+                    future = executor.submit(self.fetch_task, symbol, latest_date, ticker_latest_dates, ticker_details)
+                    pending[future] = symbol
+                    return True
+
+                while len(pending) < max_in_flight and submit_next():
+                    pass
 
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        symbol = pending.pop(future)
+                        completed += 1
+                        message = f"{symbol} 无需更新"
+                        try:
+                            result = future.result()
+                            if result is not None:
+                                message = f"正在更新 {symbol} 的增量数据（最新至 {result[2] or '无数据'}）..."
+                                self.write_result(result, latest_date, engine, conn, cursor)
+                        except Exception as e:
+                            message = f"更新 {symbol} 失败"
+                            self.record_error(symbol, e)
+                        # 已是最新而跳过的 ticker 同样计入进度，进度条才能走到 total
                         self.progress_updated.emit({
-                            'current': i,
+                            'current': completed,
                             'total': total,
                             'start_time': self.start_time,
-                            'message': f"正在更新 {symbol} 的增量数据（最新至 {db_latest_date or '无数据'}）..."
+                            'message': message
                         })
-                        print(f"Fetching data for {cleaned_symbol} with delta_days={delta_days}")
-                        engine = get_engine()
-                        resp = ctx.candlesticks(f"{cleaned_symbol}.US", Period.Day, delta_days, AdjustType.ForwardAdjust)                        
-                        if not resp or not hasattr(resp[0], "timestamp"):
-                            logger.warning(f"No data returned for {cleaned_symbol}")
-                            continue
-
-                        # 有数据，处理 timestamp
-                        ts = resp[-1].timestamp
-                        if isinstance(ts, datetime):
-                            ts_cmp = ts.strftime("%Y-%m-%d")
-                        else:
-                            ts_clean = ts.replace("T", " ").replace("Z", "")
-                            ts_cmp = datetime.strptime(ts_clean, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d")
-
-                        print(f"Ticker: {cleaned_symbol}, lates_longport_data_timestamp: {ts_cmp}")
-
-                        # 判断是否能获取正常更新时间的数据
-                        if ts_cmp != latest_date.strftime("%Y-%m-%d"):
-                            cursor.execute("SELECT active FROM tickers_fundamental WHERE ticker = %s", (symbol,))
-                            active_status = cursor.fetchone()[0]
-                            if active_status is None:
-                                logger.warning(f"{cleaned_symbol} 在 tickers_fundamental 中没有 active 状态，无法判断是否退市")
-                                cursor.execute("UPDATE tickers_fundamental SET active = FALSE WHERE ticker = %s", (symbol,))
-                                conn.commit()
-                                continue
-
-                        # 其余情况都保存数据
-                        save_to_table(resp, cleaned_symbol, engine)
-                    else:
-                        logger.debug(f"{cleaned_symbol} 数据已是最新，无需更新")
-                except Exception as e:
-                    self.error_count += 1
-                    error_message = f"更新 {symbol} 数据失败: {str(e)}"
-                    logger.error(error_message)
-                    with open(self.error_log_path, mode="a", newline="", encoding="utf-8") as file:
-                        file.write(f"{symbol},{error_message}\n")
+                        submit_next()
+            self.flush_writes(engine)
+            # 把本轮新计算的 ticker 映射写回 symbol_mapping
+            symbol_mapping.flush()
         finally:
             cursor.close()
             conn.close()
+        # 还有 ticker 没有提交就被取消
+        if submitted < total:
+            raise_if_cancelled(self.cancel_event, f"日线更新已取消，已完成 {completed}/{total}")
         table_count = self.get_table_count_from_db()
         self.fetch_complete.emit(f"最新最全数据，当前有 {table_count} 个股票截至 {latest_date} 的数据")
         self.progress_updated.emit({
@@ -176,9 +272,7 @@ class BatchDataFetcher(QThread):
             if engine is None:
                 logger.error("数据库引擎未初始化，无法获取数据库最新日期")
                 return None
-            with engine.connect() as conn:
-                result = conn.execute(text("SELECT MAX(timestamp) FROM stock_daily"))
-                return result.fetchone()[0]
+            return fetch_latest_timestamp(engine)
         except Exception as e:
             logger.error(f"获取数据库最新日期失败: {e}")
             return None
@@ -189,9 +283,7 @@ class BatchDataFetcher(QThread):
             if engine is None:
                 logger.error("数据库引擎未初始化，无法获取 ticker 数量")
                 return 0
-            with engine.connect() as conn:
-                result = conn.execute(text("SELECT COUNT(DISTINCT ticker) FROM stock_daily"))
-                return result.fetchone()[0]
+            return count_registered_tickers(engine)
         except Exception as e:
             logger.error(f"获取数据库 ticker 数量失败: {e}")
             return 0
@@ -5,13 +5,18 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import psycopg2
+from psycopg2.extras import execute_values
 import requests
 import time
 from datetime import datetime
+from collections import defaultdict
 from src.config.db_config import DB_CONFIG
 from longport.openapi import QuoteContext, Config, OpenApiException
 from src.data_fetcher.batch_fetcher import BatchDataFetcher
 from src.database.db_connection import get_engine
+from src.database.indicator_state import invalidate_indicator_states
+from src.database.ticker_registry import refresh_last_close
+from src.data_fetcher.pipeline import raise_if_cancelled
 from PySide6.QtWidgets import QApplication
 from PySide6.QtCore import QThread
 
@@ -25,12 +30,12 @@ def fetch_ms_tickers(start_timestamp, end_timestamp):
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute("""
-        SELECT ss.ticker, ss.execution_date, ss.split_from, ss.split_to
+        SELECT ss.id, ss.ticker, ss.execution_date, ss.split_from, ss.split_to
         FROM stock_splits ss
         WHERE ss.execution_date BETWEEN %s AND %s
           AND ss.ticker IN (
-              SELECT DISTINCT sd.ticker
-              FROM stock_daily sd
+              SELECT r.ticker
+              FROM ticker_registry r
           )
         ORDER BY ss.execution_date ASC;
     """, (start_timestamp,end_timestamp))
@@ -57,46 +62,221 @@ def fetch_all_rows(ticker):
 
     return rows  # 每行是一个 tuple: (id, timestamp, open, high, low, close, volume)
 
+# 将拆股记录合成为按时间分段的累计调整因子
+def build_split_segments(tickers_info):
+    """
+    将 (ticker, execution_date, split_from, split_to) 合成为 (ticker, seg_start, seg_end, factor) 分段
+
+    execution_date 之前的行按 ratio = split_to / split_from 调整；同一 ticker 有多次拆股时，
+    [上一次拆股, 本次拆股) 区间内的行的因子为本次及之后所有拆股 ratio 的乘积，
+    这样每一行只会被一条分段命中、只更新一次。seg_start 为 None 表示从最早的数据开始。
+    """
+    splits_by_ticker = defaultdict(list)
+    for ticker, execution_date, split_from, split_to in tickers_info:
+        splits_by_ticker[ticker].append((execution_date, split_to / split_from))
+
+    segments = []
+    for ticker, splits in splits_by_ticker.items():
+        splits.sort()
+        factor = 1.0
+        # 从最近一次拆股往前累乘
+        for i in range(len(splits) - 1, -1, -1):
+            execution_date, ratio = splits[i]
+            factor *= ratio
+            seg_start = splits[i - 1][0] if i > 0 else None
+            if seg_start == execution_date:
+                continue  # 同一天的多次拆股，因子已累乘到更早的分段
+            segments.append((ticker, seg_start, execution_date, factor))
+    return segments
+
+# 以集合方式批量调整拆股前的历史数据
+def apply_split_adjustments(tickers_info, conn=None, page_size=500):
+    """
+    在一个事务内对多个 ticker 的拆股前历史数据做调整
+
+    Args:
+        tickers_info: [(ticker, execution_date, split_from, split_to), ...]
+        conn: 可选的 psycopg2 连接，传入时由调用方负责提交
+        page_size: 每条 UPDATE 语句包含的分段数
+
+    Returns:
+        被调整的行数
+    """
+    segments = build_split_segments(tickers_info)
+    if not segments:
+        return 0
+
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    cursor = conn.cursor()
+    updated = 0
+    try:
+        for i in range(0, len(segments), page_size):
+            # volume 反向变换，split_from 较大则 volume 应变大
+            execute_values(cursor, """
+                UPDATE stock_daily AS sd
+                SET open = ROUND((sd.open / v.factor)::numeric, 3),
+                    high = ROUND((sd.high / v.factor)::numeric, 3),
+                    low = ROUND((sd.low / v.factor)::numeric, 3),
+                    close = ROUND((sd.close / v.factor)::numeric, 3),
+                    volume = ROUND((sd.volume * v.factor)::numeric)::bigint
+                FROM (VALUES %s) AS v(ticker, seg_start, seg_end, factor)
+                WHERE sd.ticker = v.ticker
+                  AND (v.seg_start IS NULL OR sd.timestamp >= v.seg_start)
+                  AND sd.timestamp < v.seg_end;
+            """, segments[i:i + page_size], template="(%s, %s::timestamp, %s::timestamp, %s::float8)", page_size=page_size)
+            updated += cursor.rowcount
+        # 调整范围包含最新一根 K 线时同步 ticker_registry 的最新收盘价
+        refresh_last_close(cursor, {segment[0] for segment in segments})
+        if own_conn:
+            conn.commit()
+        return updated
+    except Exception:
+        if own_conn:
+            conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        if own_conn:
+            conn.close()
+
 def reverse_historical(ticker, execution_date, split_from, split_to):
-    ratio = split_to / split_from  # 比如 1 / 15
-    rows = fetch_all_rows(ticker)
+    return apply_split_adjustments([(ticker, execution_date, split_from, split_to)])
 
-    # 只调整 execution_date 之前的行
-    execution_date_dt = datetime.combine(execution_date, datetime.min.time())
-    to_update = [row for row in rows if row[1] < execution_date_dt]
-    
+# 创建拆股调整台账表：记录已应用的拆股和每个 ticker 的水位
+def ensure_split_ledger(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS split_adjustment_ledger (
+            split_id TEXT PRIMARY KEY,
+            ticker TEXT NOT NULL,
+            execution_date DATE NOT NULL,
+            split_from FLOAT NOT NULL,
+            split_to FLOAT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS split_adjustment_watermark (
+            ticker TEXT PRIMARY KEY,
+            last_execution_date DATE NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS stock_splits_ticker_date_idx ON stock_splits (ticker, execution_date);")
+
+# 只应用台账中尚未记录的拆股，每批 ticker 一个事务，崩溃后重跑可从断点继续
+def apply_pending_splits(splits, tickers_per_txn=100, progress_callback=None, cancel_event=None):
+    """
+    幂等地应用拆股调整
+
+    Args:
+        splits: [(split_id, ticker, execution_date, split_from, split_to), ...]
+        tickers_per_txn: 每个事务处理的 ticker 数，调整数据、写台账、更新水位在同一事务内
+        progress_callback: 可选回调 (current, total, message)，每个事务提交后调用
+        cancel_event: 可选 threading.Event，被设置后在事务之间抛出 StageCancelled，下次运行从断点继续
+
+    Returns:
+        本次实际应用的拆股数
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
+    try:
+        ensure_split_ledger(cursor)
+        conn.commit()
 
-    for row in to_update:
-        row_id, ts, o, h, l, c, v = row
+        split_ids = [split[0] for split in splits]
+        cursor.execute("SELECT split_id FROM split_adjustment_ledger WHERE split_id = ANY(%s)", (split_ids,))
+        applied_ids = {row[0] for row in cursor.fetchall()}
 
-        new_o = round(o / ratio, 3)
-        new_h = round(h / ratio, 3)
-        new_l = round(l / ratio, 3)
-        new_c = round(c / ratio, 3)
-        new_v = int(round(v * ratio))  # volume 反向变换，split_from 较大则 volume 应变大
-        # print(new_o,ts)
-        cursor.execute("""
-            UPDATE stock_daily
-            SET open = %s, high = %s, low = %s, close = %s, volume = %s
-            WHERE id = %s;
-        """, (new_o, new_h, new_l, new_c, new_v, row_id))
+        pending_by_ticker = defaultdict(list)
+        for split in splits:
+            if split[0] not in applied_ids:
+                pending_by_ticker[split[1]].append(split)
+        skipped = len(splits) - sum(len(v) for v in pending_by_ticker.values())
+        if skipped:
+            print(f"跳过 {skipped} 条已应用的拆股记录")
 
-    conn.commit()
-    cursor.close()
-    conn.close()
+        tickers = sorted(pending_by_ticker)
+        applied = 0
+        for i in range(0, len(tickers), tickers_per_txn):
+            # 已提交的事务保留，下次运行从断点继续
+            raise_if_cancelled(cancel_event, f"拆股调整已取消，已完成 {i}/{len(tickers)} tickers")
+            batch = [split for ticker in tickers[i:i + tickers_per_txn] for split in pending_by_ticker[ticker]]
+            try:
+                updated = apply_split_adjustments([split[1:] for split in batch], conn=conn)
+                # 历史价格被改写，对应 ticker 的增量指标状态作废
+                invalidate_indicator_states(cursor, {split[1] for split in batch})
+                execute_values(cursor, """
+                    INSERT INTO split_adjustment_ledger (split_id, ticker, execution_date, split_from, split_to)
+                    VALUES %s
+                    ON CONFLICT (split_id) DO NOTHING;
+                """, batch)
+                execute_values(cursor, """
+                    INSERT INTO split_adjustment_watermark (ticker, last_execution_date)
+                    SELECT ticker, MAX(execution_date::date) FROM (VALUES %s) AS v(ticker, execution_date)
+                    GROUP BY ticker
+                    ON CONFLICT (ticker) DO UPDATE
+                    SET last_execution_date = GREATEST(split_adjustment_watermark.last_execution_date, EXCLUDED.last_execution_date),
+                        updated_at = NOW();
+                """, [(split[1], split[2]) for split in batch])
+                conn.commit()
+                applied += len(batch)
+                done = min(i + tickers_per_txn, len(tickers))
+                print(f"已应用 {len(batch)} 条拆股，更新 {updated} 行 ({done}/{len(tickers)} tickers)")
+                if progress_callback:
+                    progress_callback(done, len(tickers), f"已调整 {done}/{len(tickers)} 个 ticker 的拆股数据")
+            except Exception:
+                conn.rollback()
+                raise
+        return applied
+    finally:
+        cursor.close()
+        conn.close()
 
-def revese_all_histroical_before_ms(tickers_info):
-    for ticker, execution_date, split_from, split_to in tickers_info:
+# 从 stock_splits 中找出尚未应用的拆股并应用，可只处理单个 ticker
+def process_pending_splits(ticker=None, since=None):
+    """
+    Args:
+        ticker: 只处理该 ticker（走 stock_splits 的 ticker 索引，不扫描全表）
+        since: 只处理 execution_date 晚于该日期的拆股，早于该日期的数据视为已是复权后的数据
+               未指定时，单个 ticker 使用其水位之后的拆股
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        ensure_split_ledger(cursor)
+        conn.commit()
+        if since is None and ticker is not None:
+            cursor.execute("SELECT last_execution_date FROM split_adjustment_watermark WHERE ticker = %s", (ticker,))
+            row = cursor.fetchone()
+            since = row[0] if row else None
+        cursor.execute("""
+            SELECT ss.id, ss.ticker, ss.execution_date, ss.split_from, ss.split_to
+            FROM stock_splits ss
+            LEFT JOIN split_adjustment_ledger l ON l.split_id = ss.id
+            WHERE l.split_id IS NULL
+              AND (%(ticker)s::text IS NULL OR ss.ticker = %(ticker)s)
+              AND (%(since)s::date IS NULL OR ss.execution_date > %(since)s)
+            ORDER BY ss.ticker, ss.execution_date;
+        """, {"ticker": ticker, "since": since})
+        splits = [(row[0], row[1], row[2], float(row[3]), float(row[4])) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+        conn.close()
+    return apply_pending_splits(splits)
+
+def revese_all_histroical_before_ms(tickers_info, progress_callback=None, cancel_event=None):
+    for split_id, ticker, execution_date, split_from, split_to in tickers_info:
         print(f"调整 {ticker} 的拆股数据（{split_from} -> {split_to}）...")
-        reverse_historical(ticker, execution_date, split_from, split_to)
+    applied = apply_pending_splits(tickers_info, progress_callback=progress_callback, cancel_event=cancel_event)
+    print(f"拆股调整完成，共应用 {applied} 条拆股")
 
 if __name__== "__main__":
     
     # 获取哪些进行过ms
     tickers_info = fetch_ms_tickers('2024-12-01','2025-03-01')
-    tickers = list({row[0] for row in tickers_info})
+    tickers = list({row[1] for row in tickers_info})
     print(tickers_info)
     
     # 将所有历史数据都reverse回来
@@ -0,0 +1,182 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from PySide6.QtCore import QThread, Signal
+from src.utils.logger import setup_logger
+
+logger = setup_logger("pipeline")
+
+class StageCancelled(Exception):
+    """耗时操作在安全点发现已请求取消、还有工作没做完时抛出，调度器据此把阶段标记为 cancelled"""
+
+
+# 安全点检查：已请求取消时抛出 StageCancelled
+def raise_if_cancelled(cancel_event, message="已取消"):
+    if cancel_event is not None and cancel_event.is_set():
+        raise StageCancelled(message)
+
+
+class StageJob:
+    """
+    传给阶段函数的运行句柄，用于汇报进度和检查取消。
+
+    阶段函数把 job.report 作为 progress_callback、把 job.cancel_event 传给耗时操作，
+    操作在安全点检查 cancel_event，还有工作没做完就抛出 StageCancelled；
+    取消请求之后才正常做完的阶段仍记为 done。
+    """
+    def __init__(self, name, cancel_event, on_progress=None):
+        self.name = name
+        self.cancel_event = cancel_event
+        self._on_progress = on_progress
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        raise_if_cancelled(self.cancel_event, f"阶段 {self.name} 已取消")
+
+    def report(self, current, total, message=""):
+        if self._on_progress:
+            self._on_progress(self.name, current, total, message)
+
+
+class PipelineStage:
+    """
+    流水线中的一个阶段。
+
+    :param name: 阶段名称
+    :param func: 阶段函数 func(results, job)，results 为已完成阶段的结果字典 {name: result}，job 为 StageJob
+    :param depends_on: 依赖的阶段名称，全部成功后才会开始
+    """
+    def __init__(self, name, func, depends_on=()):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+
+
+class PipelineScheduler:
+    """
+    按依赖关系调度阶段：依赖都已完成的阶段并发执行，
+    某阶段失败时其所有下游阶段被跳过，互不依赖的阶段照常执行。
+    调用 cancel() 后不再启动新阶段，运行中的阶段在下一个安全点退出。
+    """
+    def __init__(self, stages, max_workers=4):
+        self.stages = {stage.name: stage for stage in stages}
+        self.max_workers = max_workers
+        self.results = {}
+        self.timings = {}
+        self.status = {}
+        self.cancel_event = threading.Event()
+        self.validate()
+
+    def cancel(self):
+        """请求取消流水线"""
+        self.cancel_event.set()
+
+    def validate(self):
+        """检查依赖是否存在以及是否有环"""
+        for stage in self.stages.values():
+            for dep in stage.depends_on:
+                if dep not in self.stages:
+                    raise ValueError(f"阶段 {stage.name} 依赖了不存在的阶段 {dep}")
+        visiting, visited = set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"流水线存在循环依赖: {name}")
+            visiting.add(name)
+            for dep in self.stages[name].depends_on:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+        for name in self.stages:
+            visit(name)
+
+    def run_stage(self, stage, on_stage_started=None, on_stage_progress=None):
+        if on_stage_started:
+            on_stage_started(stage.name)
+        start = time.time()
+        try:
+            return stage.func(self.results, StageJob(stage.name, self.cancel_event, on_stage_progress))
+        finally:
+            self.timings[stage.name] = time.time() - start
+
+    def run(self, on_stage_started=None, on_stage_finished=None, on_stage_progress=None):
+        """
+        执行整个流水线
+
+        :param on_stage_started: 回调 (name)
+        :param on_stage_finished: 回调 (name, seconds, status)，status 为 done / failed / skipped / cancelled
+        :param on_stage_progress: 回调 (name, current, total, message)，total 为 0 表示总数未知
+        :return: {name: (status, seconds)}
+        """
+        pending = dict(self.stages)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pipeline") as executor:
+            while pending or running:
+                # 已取消：尚未开始的阶段全部标记为取消
+                if self.cancel_event.is_set():
+                    for name in list(pending):
+                        del pending[name]
+                        self.status[name] = "cancelled"
+                        self.timings[name] = 0.0
+                        if on_stage_finished:
+                            on_stage_finished(name, 0.0, "cancelled")
+                # 上游失败或被跳过的阶段直接跳过
+                for name, stage in list(pending.items()):
+                    if any(self.status.get(dep) in ("failed", "skipped", "cancelled") for dep in stage.depends_on):
+                        del pending[name]
+                        self.status[name] = "skipped"
+                        self.timings[name] = 0.0
+                        logger.warning(f"阶段 {name} 因上游失败被跳过")
+                        if on_stage_finished:
+                            on_stage_finished(name, 0.0, "skipped")
+                # 提交所有依赖已完成的阶段
+                for name, stage in list(pending.items()):
+                    if all(self.status.get(dep) == "done" for dep in stage.depends_on):
+                        del pending[name]
+                        running[executor.submit(self.run_stage, stage, on_stage_started, on_stage_progress)] = name
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        self.results[name] = future.result()
+                        self.status[name] = "done"
+                    except StageCancelled as e:
+                        self.status[name] = "cancelled"
+                        logger.info(f"阶段 {name} 被中断: {e}")
+                    except Exception as e:
+                        self.status[name] = "failed"
+                        logger.error(f"阶段 {name} 失败: {e}")
+                    logger.info(f"阶段 {name} {self.status[name]}，耗时 {self.timings[name]:.1f}s")
+                    if on_stage_finished:
+                        on_stage_finished(name, self.timings[name], self.status[name])
+        return {name: (self.status[name], self.timings[name]) for name in self.stages}
+
+
+class RefreshPipelineThread(QThread):
+    """在后台线程中运行 PipelineScheduler，并把阶段进度转成 Qt 信号"""
+    stage_started = Signal(str)
+    stage_progress = Signal(str, int, int, str)
+    stage_finished = Signal(str, float, str)
+    pipeline_finished = Signal(dict)
+
+    def __init__(self, stages, max_workers=4):
+        super().__init__()
+        self.scheduler = PipelineScheduler(stages, max_workers)
+
+    def cancel(self):
+        """请求取消，运行中的阶段在安全点退出后 pipeline_finished 照常发出"""
+        self.scheduler.cancel()
+
+    def run(self):
+        start = time.time()
+        summary = self.scheduler.run(self.stage_started.emit, self.stage_finished.emit, self.stage_progress.emit)
+        cancelled = any(status == "cancelled" for status, _ in summary.values())
+        summary["total"] = ("cancelled" if cancelled else "done", time.time() - start)
+        self.pipeline_finished.emit(summary)
@@ -4,10 +4,9 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import psycopg2
-import requests
-import time
 from datetime import datetime
 from src.config.db_config import DB_CONFIG
+from src.data_fetcher.polygon_client import fetch_reference, watermark_stop
 
 # 数据库连接函数
 def get_db_connection():
@@ -60,76 +59,11 @@ def insert_tickers_to_db(tickers):
     cursor.close()
     conn.close()
 
-# 获取所有 Polygon.io tickers 数据，带重试机制
+# 获取所有 Polygon.io tickers 数据，翻页直到 listing_date 不晚于 2025-01-02
 def fetch_tickers_from_polygon(base_url, params, polygon_api_key, max_retries=3):
-    
-    all_tickers = []
-    page_count = 0
-    url = base_url
-    
-    while True:
-        retries = 0
-        while retries < max_retries:
-            response = None
-            try:
-                print(f"Fetching page {page_count + 1} at {datetime.now()} from {url}")
-                response = requests.get(
-                    url,
-                    params=params if page_count == 0 else None,
-                    timeout=30  # 设置 30 秒超时
-                )
-                response.raise_for_status()
-                
-                data = response.json()
-                page_tickers = data.get("results", [])
-                all_tickers.extend(page_tickers)
-                page_count += 1
-                
-                print(f"Page {page_count}: Fetched {len(page_tickers)} tickers.")
-                print(f"Total tickers so far: {len(all_tickers)}")
-                
-                need_next_page = False
-                
-                if page_tickers:
-                    # 找到当前页最后一个ticker的listing_date
-                    last_ticker = page_tickers[-1]
-                    listing_date = last_ticker.get("listing_date")
-                    print(f"Last ticker's listing_date: {listing_date}")
-                    if listing_date is not None and listing_date > "2025-01-02":
-                        print(f"Continuing to next page.")
-                        need_next_page = True
-                    
-                if need_next_page:
-                    next_url = data.get("next_url")
-                else:
-                    print("No more pages to fetch based on listing_date condition.")
-                    next_url = []
-                    
-                if next_url:
-                    url = f"{next_url}&apiKey={polygon_api_key}"
-                    print(f"Next URL: {url}")
-                else:
-                    print("No more pages to fetch.")
-                    return all_tickers
-                
-                print("Sleeping for 12 seconds to respect API rate limit...")
-                time.sleep(12)
-                break  # 成功后跳出重试循环
-            
-            except requests.exceptions.RequestException as e:
-                retries += 1
-                if response and response.status_code == 429:
-                    print(f"Rate limit exceeded (429 error) at {datetime.now()}. Waiting 120 seconds...")
-                    time.sleep(61)
-                elif isinstance(e, requests.exceptions.SSLError):
-                    print(f"SSL error: {e}. Retrying {retries}/{max_retries} after 30 seconds...")
-                    time.sleep(30)
-                else:
-                    print(f"Request error: {e}. Retrying {retries}/{max_retries} after 30 seconds...")
-                    time.sleep(30)
-                if retries == max_retries:
-                    print(f"Max retries ({max_retries}) exceeded. Stopping.")
-                    return all_tickers
+    params = {k: v for k, v in params.items() if k != "apiKey"}
+    return fetch_reference(base_url, params, watermark_stop("listing_date", "2025-01-02"),
+                           api_key=polygon_api_key, max_retries=max_retries)
 
 # 获取 delisted tickers 数据 
 def fetch_delisted_tickers_from_polygon(polygon_api_key, max_retries=3):
@@ -0,0 +1,208 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+import httpx
+from src.config.fetch_config import POLYGON_CONFIG
+from src.utils.rate_limiter import TokenBucket
+from src.data_fetcher.pipeline import raise_if_cancelled
+from src.utils.logger import setup_logger
+
+logger = setup_logger("polygon_client")
+
+# 各订阅计划的请求速率（次/秒），Basic 为每分钟 5 次
+POLYGON_PLAN_RATES = {
+    "basic": 5 / 60,
+    "starter": 50,
+    "developer": 50,
+    "advanced": 50,
+}
+
+def plan_rate_limiter(plan: Optional[str] = None, rate: Optional[float] = None) -> TokenBucket:
+    """按订阅计划创建令牌桶，rate 优先于 plan；未知的计划按最保守的 basic 限速"""
+    if not rate:
+        plan = (plan or POLYGON_CONFIG["plan"]).strip().lower()
+        if plan not in POLYGON_PLAN_RATES:
+            logger.warning(f"未知的 Polygon 订阅计划 {plan!r}（可选: {', '.join(POLYGON_PLAN_RATES)}），按 basic 限速")
+            plan = "basic"
+        rate = POLYGON_PLAN_RATES[plan]
+    return TokenBucket(rate)
+
+# 进程内共享的 Polygon 限流器：令牌桶是线程安全的，不同线程里的事件循环也共用同一配额
+polygon_rate_limiter = plan_rate_limiter(rate=POLYGON_CONFIG["rate"])
+
+def watermark_stop(field: str, watermark: Optional[str]) -> Optional[Callable[[List[dict]], bool]]:
+    """
+    按水位停止翻页：结果按 field 倒序，当前页最后一条的 field 不晚于 watermark 时停止。
+
+    :param field: listing_date / delisted_utc / execution_date 等字段
+    :param watermark: 上次更新的日期字符串，None 表示一直翻到最后一页
+    """
+    if watermark is None:
+        return None
+
+    def stop(page: List[dict]) -> bool:
+        if not page:
+            return True
+        value = page[-1].get(field)
+        print(f"Last ticker's {field}: {value}, watermark: {watermark}")
+        return value is None or value <= watermark
+    return stop
+
+
+class PolygonClient:
+    """
+    基于连接池的异步 Polygon.io 客户端。
+
+    用法：
+        async with PolygonClient(api_key) as client:
+            results = await client.fetch_all("/vX/reference/ipos", params, stop)
+
+    传入 cancel_event 时，限流和重试的等待以及翻页之间都会检查取消，被设置后抛出 StageCancelled。
+    """
+    BASE_URL = "https://api.polygon.io"
+    # 等待期间检查取消的间隔（秒）
+    CANCEL_POLL_INTERVAL = 0.5
+
+    def __init__(self, api_key: Optional[str] = None, rate_limiter: Optional[TokenBucket] = None,
+                 max_retries: Optional[int] = None, timeout: Optional[float] = None, cancel_event=None):
+        self.api_key = api_key or os.getenv("POLYGON_API_KEY")
+        self.rate_limiter = rate_limiter or polygon_rate_limiter
+        self.max_retries = max_retries if max_retries is not None else POLYGON_CONFIG["max_retries"]
+        self.timeout = timeout or POLYGON_CONFIG["timeout"]
+        self.cancel_event = cancel_event
+        self._session: Optional[httpx.AsyncClient] = None
+
+    async def __aenter__(self):
+        self._session = httpx.AsyncClient(
+            base_url=self.BASE_URL,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._session.aclose()
+        self._session = None
+
+    async def sleep(self, seconds: float) -> None:
+        """可被 cancel_event 打断的等待"""
+        deadline = time.monotonic() + seconds
+        while True:
+            raise_if_cancelled(self.cancel_event, "Polygon 请求已取消")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(remaining, self.CANCEL_POLL_INTERVAL))
+
+    async def get_json(self, url: str, params: Optional[Dict] = None) -> dict:
+        """
+        请求一页数据，遵守限流并在失败时重试。next_url 不带 apiKey，这里统一补上。
+
+        :param url: 路径或 next_url
+        :param params: 查询参数（仅第一页需要）
+        """
+        params = dict(params or {})
+        params["apiKey"] = self.api_key
+        # max_retries 为 0 时也至少请求一次
+        attempts = max(self.max_retries, 1)
+        for attempt in range(1, attempts + 1):
+            await self.sleep(self.rate_limiter.reserve())
+            try:
+                print(f"Fetching {url} at {datetime.now()}")
+                response = await self._session.get(url, params=params)
+                response.raise_for_status()
+                return response.json()
+            except httpx.HTTPError as e:
+                status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                # 429 以外的 4xx（如 401/403 密钥无效、404）重试也不会成功，直接抛出
+                if attempt == attempts or (status is not None and 400 <= status < 500 and status != 429):
+                    raise
+                wait = 61 if status == 429 else 30
+                print(f"Request error: {e}. Retrying {attempt}/{attempts} after {wait} seconds...")
+                await self.sleep(wait)
+
+    async def paginate(self, path: str, params: Optional[Dict] = None,
+                       stop: Optional[Callable[[List[dict]], bool]] = None):
+        """
+        沿 next_url 翻页的异步生成器，每次产出一页 results。
+
+        产出当前页之前就已开始请求下一页，调用方处理当前页时下一页在后台预取。
+        stop(page) 返回 True 时不再翻页；还有下一页但已请求取消时抛出 StageCancelled。
+        """
+        task = asyncio.create_task(self.get_json(path, params))
+        page_count = 0
+        while task is not None:
+            data = await task
+            page = data.get("results", [])
+            page_count += 1
+            print(f"Page {page_count}: Fetched {len(page)} tickers.")
+            next_url = data.get("next_url")
+            task = None
+            if next_url and not (stop and stop(page)):
+                raise_if_cancelled(self.cancel_event, f"Polygon 翻页已取消（已获取 {page_count} 页）")
+                task = asyncio.create_task(self.get_json(next_url))
+            try:
+                yield page
+            except GeneratorExit:
+                if task is not None:
+                    task.cancel()
+                raise
+
+    async def fetch_all(self, path: str, params: Optional[Dict] = None,
+                        stop: Optional[Callable[[List[dict]], bool]] = None,
+                        progress_callback: Optional[Callable[[int, int, str], None]] = None) -> List[dict]:
+        """
+        拉取所有页并合并；重试耗尽时返回已获取的部分，取消时抛出 StageCancelled（不返回部分结果）
+
+        :param progress_callback: 每页回调 (页数, 0, message)，总页数未知
+        """
+        results = []
+        try:
+            pages = 0
+            async for page in self.paginate(path, params, stop):
+                results.extend(page)
+                pages += 1
+                if progress_callback:
+                    progress_callback(pages, 0, f"{path}: 已获取 {len(results)} 条")
+        except httpx.HTTPError as e:
+            print(f"Max retries ({self.max_retries}) exceeded. Stopping. {e}")
+            logger.error(f"{path} 翻页失败，返回已获取的 {len(results)} 条: {e}")
+        print(f"Total tickers fetched from {path}: {len(results)}")
+        return results
+
+
+def run_coroutine_sync(coro):
+    """在同步代码中运行协程；当前线程已有运行中的事件循环（如 qasync 主线程）时放到独立线程执行"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+def fetch_reference(path: str, params: Optional[Dict] = None,
+                    stop: Optional[Callable[[List[dict]], bool]] = None,
+                    api_key: Optional[str] = None, max_retries: Optional[int] = None,
+                    progress_callback: Optional[Callable[[int, int, str], None]] = None,
+                    cancel_event=None) -> List[dict]:
+    """同步接口：拉取一个 Polygon 参考数据接口的所有页"""
+    async def _run():
+        async with PolygonClient(api_key, max_retries=max_retries, cancel_event=cancel_event) as client:
+            return await client.fetch_all(path, params, stop, progress_callback)
+    return run_coroutine_sync(_run())
+
+def fetch_references_concurrently(requests: Dict[str, tuple], api_key: Optional[str] = None) -> Dict[str, List[dict]]:
+    """
+    同步接口：在同一个连接池里并发拉取多个参考数据接口。
+
+    :param requests: {name: (path, params, stop)}
+    :return: {name: results}
+    """
+    async def _run():
+        async with PolygonClient(api_key) as client:
+            results = await asyncio.gather(*(client.fetch_all(*request) for request in requests.values()))
+            return dict(zip(requests.keys(), results))
+    return run_coroutine_sync(_run())
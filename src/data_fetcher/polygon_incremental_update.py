@@ -4,17 +4,25 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from src.utils.time_teller import get_latest_date_from_longport
 import psycopg2
-import requests
 import time
 from datetime import datetime, timedelta, date
 from src.config.db_config import DB_CONFIG
-from longport.openapi import QuoteContext, Config, Period, AdjustType
+from longport.openapi import Period, AdjustType
 from src.database.db_operations import clean_symbol_for_postgres,save_to_table
 from src.database.db_connection import get_engine
+from src.database.symbol_mapping import symbol_mapping
+from src.database.indicator_state import seed_indicator_states
+from src.database.price_adjustment import storage_adjust_type, refresh_split_factors, adjust_on_read
+from src.config.fetch_config import FETCH_CONFIG
 from src.utils.logger import setup_logger
+from src.utils.quote_pool import quote_pool
 import traceback
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extras import execute_values
 from .incremental_ms import revese_all_histroical_before_ms
+from .polygon_client import fetch_reference, watermark_stop
+from .pipeline import raise_if_cancelled
 from PySide6.QtCore import QThread, Signal
 
 
@@ -141,19 +149,25 @@ def get_last_stock_splits_updated_utc():
         return None
     
 
-def fetch_data_from_longprot_to_stock_daily(ipo_filtered_tickers):
-    config = Config.from_env()
-    ctx = QuoteContext(config=config)
-    for ticker in ipo_filtered_tickers:
+def fetch_data_from_longprot_to_stock_daily(ipo_filtered_tickers, progress_callback=None, cancel_event=None):
+    total = len(ipo_filtered_tickers)
+    latest_date = datetime.strptime(get_latest_date_from_longport().strftime("%Y-%m-%d"), "%Y-%m-%d")
+    for i, ticker in enumerate(ipo_filtered_tickers, 1):
+        if cancel_event is not None and cancel_event.is_set():
+            symbol_mapping.flush()
+            raise_if_cancelled(cancel_event, f"IPO 数据回填已取消，已完成 {i - 1}/{total}")
+        if progress_callback:
+            progress_callback(i, total, f"正在回填 {ticker[0]} 的 IPO 数据")
         symbol = ticker[0]
         ticker_type = ticker[2]
         primary_exchange = ticker[4]
         listing_date = ticker[5]
         try:
             cleaned_symbol = clean_symbol_for_postgres(symbol, ticker_type, primary_exchange)
-            latched_days = (datetime.strptime(get_latest_date_from_longport().strftime("%Y-%m-%d"), "%Y-%m-%d") - datetime.strptime(listing_date, "%Y-%m-%d")).days + 1
+            latched_days = (latest_date - datetime.strptime(listing_date, "%Y-%m-%d")).days + 1
             print(f"{symbol}'s listing date : {listing_date} Latched time : {latched_days}")
-            resp = ctx.candlesticks(f"{cleaned_symbol}.US", Period.Day, latched_days, AdjustType.ForwardAdjust)
+            with quote_pool.connection() as ctx:
+                resp = ctx.candlesticks(f"{cleaned_symbol}.US", Period.Day, latched_days, storage_adjust_type())
             if not resp:
                 logger.error(f"{cleaned_symbol}数据从longport获取失败，可能是因为没有数据或API错误。")
                 continue
@@ -162,163 +176,40 @@ def fetch_data_from_longprot_to_stock_daily(ipo_filtered_tickers):
         except Exception as e:
             logger.error(f"{symbol} 获取数据异常: {e}")
             continue
+        # 回填后用完整历史重新初始化指标状态（已有的状态只覆盖了回填前的部分历史）
+        try:
+            seed_indicator_states([cleaned_symbol], overwrite=True)
+        except Exception as e:
+            logger.error(f"{cleaned_symbol} 初始化指标状态失败: {e}")
+    symbol_mapping.flush()
         
     
-# 获取所有 Polygon.io tickers 数据，带重试机制
-def fetch_ipo_tickers_from_polygon(polygon_api_key, last_updated_time, max_retries=3):
-    base_url = "https://api.polygon.io/vX/reference/ipos"
+# 获取截至上次更新的所有 IPO 数据
+def fetch_ipo_tickers_from_polygon(polygon_api_key, last_updated_time, max_retries=3, progress_callback=None, cancel_event=None):
     params = {
         "order": "desc",
         "limit": 1000,
         "sort": "listing_date",
-        "apiKey": polygon_api_key
     }
-    
-    all_tickers = []
-    page_count = 0
-    url = base_url
-    
-    while True:
-        retries = 0
-        while retries < max_retries:
-            response = None
-            try:
-                print(f"Fetching page {page_count + 1} at {datetime.now()} from {url}")
-                response = requests.get(
-                    url,
-                    params=params if page_count == 0 else None,
-                    timeout=30  # 设置 30 秒超时
-                )
-                response.raise_for_status()
-                
-                data = response.json()
-                page_tickers = data.get("results", [])
-                all_tickers.extend(page_tickers)
-                page_count += 1
-                
-                print(f"Page {page_count}: Fetched {len(page_tickers)} tickers.")
-                print(f"Total tickers so far: {len(all_tickers)}")
-                
-                need_next_page = False
-                
-                if page_tickers:
-                    # 找到当前页最后一个ticker的listing_date
-                    last_ticker = page_tickers[-1]
-                    listing_date = last_ticker.get("listing_date")
-                    print(f"Last ticker's listing_date: {listing_date}")
-                    print(f"Last updated UTC: {last_updated_time}")
-                    if listing_date is not None and listing_date > last_updated_time:
-                        print(f"Continuing to next page.")
-                        need_next_page = True
-                    
-                if need_next_page:
-                    next_url = data.get("next_url")
-                    url = f"{next_url}&apiKey={polygon_api_key}"
-                    print(f"Next URL: {url}")  
-                else:
-                    print("No more pages to fetch based on listing_date condition.")
-                    next_url = []
-                    return all_tickers                      
-                
-                print("Sleeping for 12 seconds to respect API rate limit...")
-                time.sleep(12)
-                break  # 成功后跳出重试循环
-            
-            except requests.exceptions.RequestException as e:
-                retries += 1
-                if response and response.status_code == 429:
-                    print(f"Rate limit exceeded (429 error) at {datetime.now()}. Waiting 120 seconds...")
-                    time.sleep(61)
-                elif isinstance(e, requests.exceptions.SSLError):
-                    print(f"SSL error: {e}. Retrying {retries}/{max_retries} after 30 seconds...")
-                    time.sleep(30)
-                else:
-                    print(f"Request error: {e}. Retrying {retries}/{max_retries} after 30 seconds...")
-                    time.sleep(30)
-                if retries == max_retries:
-                    print(f"Max retries ({max_retries}) exceeded. Stopping.")
-                    return all_tickers
+    return fetch_reference("/vX/reference/ipos", params, watermark_stop("listing_date", last_updated_time),
+                           api_key=polygon_api_key, max_retries=max_retries,
+                           progress_callback=progress_callback, cancel_event=cancel_event)
 
 # 获取截至上次更新的所有退市股票数据
-# 通过 Polygon.io API 获取退市股票数据，带重试机制
-def fetch_delisted_tickers_from_polygon(polygon_api_key, last_updated_time, max_retries=3):
-    base_url = "https://api.polygon.io/v3/reference/tickers"
+def fetch_delisted_tickers_from_polygon(polygon_api_key, last_updated_time, max_retries=3, progress_callback=None, cancel_event=None):
     params = {
         "market": "stocks",
         "active": "False",
         "order": "desc",
         "limit": 1000,
         "sort": "delisted_utc",
-        "apiKey": polygon_api_key
     }
-    
-    all_tickers = []
-    page_count = 0
-    url = base_url
-    
-    while True:
-        retries = 0
-        while retries < max_retries:
-            response = None
-            try:
-                print(f"Fetching page {page_count + 1} at {datetime.now()} from {url}")
-                response = requests.get(
-                    url,
-                    params=params if page_count == 0 else None,
-                    timeout=30  # 设置 30 秒超时
-                )
-                response.raise_for_status()
-                
-                data = response.json()
-                page_tickers = data.get("results", [])
-                all_tickers.extend(page_tickers)
-                page_count += 1
-                
-                print(f"Page {page_count}: Fetched {len(page_tickers)} tickers.")
-                print(f"Total tickers so far: {len(all_tickers)}")
-                
-                need_next_page = False
-                
-                if page_tickers:
-                    # 找到当前页最后一个ticker的listing_date
-                    last_ticker = page_tickers[-1]
-                    delisted_utc = last_ticker.get("delisted_utc")
-                    print(f"Last ticker's listing_date: {delisted_utc}")
-                    print(f"Last updated UTC: {last_updated_time}")
-                    if delisted_utc is not None and delisted_utc > last_updated_time:
-                        print(f"Continuing to next page.")
-                        need_next_page = True
-                    
-                if need_next_page:
-                    next_url = data.get("next_url")
-                    url = f"{next_url}&apiKey={polygon_api_key}"
-                    print(f"Next URL: {url}")  
-                else:
-                    print("No more pages to fetch based on delisted_utc condition.")
-                    next_url = []
-                    return all_tickers                      
-                
-                print("Sleeping for 12 seconds to respect API rate limit...")
-                time.sleep(12)
-                break  # 成功后跳出重试循环
-            
-            except requests.exceptions.RequestException as e:
-                retries += 1
-                if response and response.status_code == 429:
-                    print(f"Rate limit exceeded (429 error) at {datetime.now()}. Waiting 120 seconds...")
-                    time.sleep(61)
-                elif isinstance(e, requests.exceptions.SSLError):
-                    print(f"SSL error: {e}. Retrying {retries}/{max_retries} after 30 seconds...")
-                    time.sleep(30)
-                else:
-                    print(f"Request error: {e}. Retrying {retries}/{max_retries} after 30 seconds...")
-                    time.sleep(30)
-                if retries == max_retries:
-                    print(f"Max retries ({max_retries}) exceeded. Stopping.")
-                    return all_tickers
+    return fetch_reference("/v3/reference/tickers", params, watermark_stop("delisted_utc", last_updated_time),
+                           api_key=polygon_api_key, max_retries=max_retries,
+                           progress_callback=progress_callback, cancel_event=cancel_event)
 
 # 增量更新退市股票数据
-def delisted_incremental_update(limit_date):
+def delisted_incremental_update(limit_date, progress_callback=None, cancel_event=None):
     # last_updated_time = get_last_tickers_fundamental_updated_utc().strftime("%Y-%m-%d")
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -334,7 +225,8 @@ def delisted_incremental_update(limit_date):
         last_updated_time = '2025-03-08'
     print(f"Last updated time for delisted tickers: {last_updated_time}")
     
-    delisted_tickers = fetch_delisted_tickers_from_polygon(polygon_api_key, last_updated_time)
+    delisted_tickers = fetch_delisted_tickers_from_polygon(polygon_api_key, last_updated_time,
+                                                           progress_callback=progress_callback, cancel_event=cancel_event)
     # 只保留有 listing_date 且大于 上次更新日期 的
     delisted_filtered = [
         t for t in delisted_tickers
@@ -351,8 +243,6 @@ def detect_delisted_tickers(tickers):
     days_to_delist_count = defaultdict(list)
     before_nominate = defaultdict(list)
     after_nominate = defaultdict(list)
-    config = Config.from_env()
-    ctx = QuoteContext(config=config)
     active = 0
     delisted = 0
     for ticker in tickers:
@@ -360,7 +250,8 @@ def detect_delisted_tickers(tickers):
         # print(ticker["market"])
         try:
             cleaned_symbol = clean_symbol_for_postgres(symbol, ticker["type"], ticker["primary_exchange"])
-            resp = ctx.candlesticks(f"{cleaned_symbol}.US", Period.Day, 1000, AdjustType.ForwardAdjust)
+            with quote_pool.connection() as ctx:
+                resp = ctx.candlesticks(f"{cleaned_symbol}.US", Period.Day, 1000, AdjustType.ForwardAdjust)
             # print(resp)
             if resp and hasattr(resp[0], "timestamp"):
                 # 假设timestamp为字符串或datetime对象
@@ -442,211 +333,189 @@ def detect_delisted_tickers(tickers):
         print('没有检测到退市股票')
         print(sorted(detect_delisted_tickers.still_active_tickers, key=lambda x: x[1]))
 
-def fetch_ms_tickers_from_polygon(max_retries=3):
-    base_url = "https://api.polygon.io/v3/reference/splits"
+# 获取截至上次更新的所有拆股数据，没有上一次更新时翻到最后一页做全量初始化
+def fetch_ms_tickers_from_polygon(max_retries=3, progress_callback=None, cancel_event=None):
     params = {
         "order": "desc",
         "limit": 1000,
         "sort": "execution_date",
-        "apiKey": polygon_api_key
     }
-    
-    all_tickers = []
-    page_count = 0
-    url = base_url
+    last_ms_update = get_last_stock_splits_updated_utc()
+    last_ms_ticker_date = last_ms_update.strftime("%Y-%m-%d") if last_ms_update else None
+    return fetch_reference("/v3/reference/splits", params, watermark_stop("execution_date", last_ms_ticker_date),
+                           api_key=polygon_api_key, max_retries=max_retries,
+                           progress_callback=progress_callback, cancel_event=cancel_event)
+    
+def parse_delisted_utc(value):
+    """把 Polygon 返回的 'YYYY-MM-DDTHH:MM:SSZ' 字符串或数据库中的 TIMESTAMP 统一为 datetime"""
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    return datetime.strptime(value.replace('Z', ''), "%Y-%m-%dT%H:%M:%S")
 
-    last_ms_ticker_date = get_last_stock_splits_updated_utc().strftime("%Y-%m-%d")
-    # print(f"Last MS ticker date in database: {last_ms_ticker_date}")
-    
-    while True:
-        retries = 0
-        while retries < max_retries:
-            response = None
-            try:
-                print(f"Fetching page {page_count + 1} at {datetime.now()} from {url}")
-                response = requests.get(
-                    url,
-                    params=params if page_count == 0 else None,
-                    timeout=30  # 设置 30 秒超时
-                )
-                response.raise_for_status()
-                
-                data = response.json()
-                page_tickers = data.get("results", [])
-                all_tickers.extend(page_tickers)
-                page_count += 1
-                
-                print(f"Page {page_count}: Fetched {len(page_tickers)} tickers.")
-                print(f"Total tickers so far: {len(all_tickers)}")
-                
-                if page_tickers:
-                        # 找到当前页最后一个ticker的execution date
-                        last_ticker = page_tickers[-1]
-                        execution_date = last_ticker.get("execution_date")
-                        print(f"Last ticker's excution date: {execution_date}")
-
-                # 如果没有上一次更新，则初始化更新翻页直到最后一页
-                if last_ms_ticker_date is None:    
-                    next_url = data.get("next_url")
-                    
-                    if next_url:
-                        print(f"Next URL: {url}")  
-                        url = f"{next_url}&apiKey={polygon_api_key}"
-                    else:
-                        print("No more pages to fetch.")
-                        return all_tickers                          
-                # 如果有上一次更新，则增量更新
-                else:
-                    need_next_page = False
-                    
-                    print(f"Last updated UTC: {last_ms_ticker_date}")
-                    if execution_date is not None and execution_date > last_ms_ticker_date:
-                        print(f"Continuing to next page.")
-                        need_next_page = True
-                        
-                    if need_next_page:
-                        next_url = data.get("next_url")
-                        url = f"{next_url}&apiKey={polygon_api_key}"
-                        print(f"Next URL: {url}")  
-                    else:
-                        print("No more pages to fetch based on delisted_utc condition.")
-                        next_url = []
-                        return all_tickers                      
-                                    
-                    
-                print("Sleeping for 12 seconds to respect API rate limit...")
-                time.sleep(12)
-                break  # 成功后跳出重试循环
-            
-            except requests.exceptions.RequestException as e:
-                retries += 1
-                if response and response.status_code == 429:
-                    print(f"Rate limit exceeded (429 error) at {datetime.now()}. Waiting 120 seconds...")
-                    time.sleep(61)
-                elif isinstance(e, requests.exceptions.SSLError):
-                    print(f"SSL error: {e}. Retrying {retries}/{max_retries} after 30 seconds...")
-                    time.sleep(30)
-                else:
-                    print(f"Request error: {e}. Retrying {retries}/{max_retries} after 30 seconds...")
-                    time.sleep(30)
-                if retries == max_retries:
-                    print(f"Max retries ({max_retries}) exceeded. Stopping.")
-                    return all_tickers
-    
-def delisted_confirm(new_tickers=None):
+# 一次查询出所有候选 ticker 的拆股匹配和退市后 K 线情况
+def classify_delisted_candidates(cursor, candidates):
+    """
+    Args:
+        cursor: psycopg2 游标
+        candidates: [(ticker, delisted_utc), ...]
+
+    Returns:
+        [(ticker, delisted_utc, has_split, has_bars_after, known, pending, primary_exchange, type), ...]
+    """
+    if not candidates:
+        return []
+    return execute_values(cursor, """
+        WITH candidates (ticker, delisted_utc) AS (VALUES %s)
+        SELECT c.ticker, c.delisted_utc,
+               EXISTS (SELECT 1 FROM stock_splits s
+                       WHERE s.ticker = c.ticker AND s.execution_date = c.delisted_utc) AS has_split,
+               COALESCE(r.last_timestamp >= c.delisted_utc, FALSE) AS has_bars_after,
+               tf.ticker IS NOT NULL AS known,
+               tf.active IS NULL AS pending,
+               tf.primary_exchange, tf.type
+        FROM candidates c
+        LEFT JOIN tickers_fundamental tf ON tf.ticker = c.ticker
+        LEFT JOIN ticker_registry r ON r.ticker = c.ticker
+    """, candidates, template="(%s, %s::timestamp)", page_size=1000, fetch=True)
+
+def delisted_confirm(new_tickers=None, max_workers=None):
     """
-    确认退市股票的状态，并更新数据库
+    确认退市股票的状态，并批量更新数据库
+
+    1. 一条联合查询得到所有候选的拆股匹配和退市后 K 线数量；
+    2. 在 stock_splits 中的视为仍然活跃，退市后没有 K 线的标记为非活跃；
+    3. 只有退市后仍有 K 线的 ticker 需要并发查询 LongPort 判断是否还有退市前的数据；
+    4. 状态变更按类型批量写回 tickers_fundamental。
     """
     conn = get_db_connection()
     cursor = conn.cursor()
-    
-    cursor.execute("""select ticker, last_updated_utc from tickers_fundamental where active is null""")
-    pending_tickers = cursor.fetchall()
-    
-    combined_tickers = []
-    seen = set()
-    
-    if new_tickers:
-        for t in new_tickers:
-            if t['ticker'] not in seen:
-                combined_tickers.append((t['ticker'], t['delisted_utc']))
-                seen.add(t['ticker'])
-
-    for row in pending_tickers:
-        ticker, delisted_utc = row
-        if ticker not in seen:
-            combined_tickers.append((ticker, delisted_utc))
-            seen.add(ticker)
-    
-    for symbol, delisted_utc in combined_tickers:
-        logger.info(f"Confirming delisted status for {symbol} with delisted_utc: {delisted_utc}")
-        
-        # 检查是否在 stock_splits 中
-        cursor.execute("SELECT COUNT(*) FROM stock_splits WHERE ticker = %s AND execution_date = %s", (symbol, delisted_utc))
-        count = cursor.fetchone()[0]
-        
-        if count > 0:
-            logger.info(f"{symbol} is in stock_splits, marking as active.")
-            # do nothing, as it is still active
-        else:
-            logger.info(f"{symbol} is not in stock_splits, checking if it is still active.")
-            cursor.execute("SELECT COUNT(*) FROM stock_daily WHERE ticker = %s AND timestamp >= %s", (symbol, delisted_utc))
-            count = cursor.fetchone()[0]
-            if count > 0:
-                # 判断longport是否还能返回delisted_utc之前的K线数据
-                past_data = check_ticker_past(symbol, delisted_utc, cursor)
-                # 如果没有过去的数据，则标记为非活跃
-                if not past_data:
-                    logger.info(f"{symbol} has no historical data before delisted_utc, marking as OTC.")
-                    cursor.execute("UPDATE tickers_fundamental SET primary_exchange = 'OTCP' WHERE ticker = %s", (symbol,))
-                # 如果有过去的数据，则继续判断其是否处于标记观察状态
-                else:
-                    # 判断是否之前就被标记为观察状态
-                    cursor.execute("select active from tickers_fundamental where ticker = %s", (symbol,))
-                    active_status = cursor.fetchone()[0]
-                    # 如果 active 是 null，说明需要下次再检查
-                    if active_status is None:
-                        continue    
-                    # 如果 active 不是 null，说明需要更新其状态为观察状态，同时将 last_updated_utc 更新为 delisted_utc
-                    else:
-                        logger.info(f"{symbol} has historical data after delisted_utc, marking as active.")
-                        # set active to null, meaning it needs to be checked next time
-                        cursor.execute("UPDATE tickers_fundamental SET active = null WHERE ticker = %s", (symbol,))
-                        cursor.execute("UPDATE tickers_fundamental SET last_updated_utc = %s WHERE ticker = %s", (delisted_utc, symbol))
+    try:
+        cursor.execute("""select ticker, last_updated_utc from tickers_fundamental where active is null""")
+        pending_tickers = cursor.fetchall()
+
+        combined_tickers = []
+        seen = set()
+
+        if new_tickers:
+            for t in new_tickers:
+                if t['ticker'] not in seen:
+                    combined_tickers.append((t['ticker'], parse_delisted_utc(t['delisted_utc'])))
+                    seen.add(t['ticker'])
+
+        for ticker, delisted_utc in pending_tickers:
+            if ticker not in seen and delisted_utc is not None:
+                combined_tickers.append((ticker, parse_delisted_utc(delisted_utc)))
+                seen.add(ticker)
+
+        rows = classify_delisted_candidates(cursor, combined_tickers)
+        inactive, ambiguous = [], []
+        for ticker, delisted_utc, has_split, has_bars_after, known, pending, primary_exchange, ticker_type in rows:
+            if has_split:
+                logger.info(f"{ticker} is in stock_splits, keeping it active.")
+            elif not has_bars_after:
+                logger.info(f"{ticker} has no data after delisted_utc, marking as inactive.")
+                inactive.append((ticker,))
+            elif not known:
+                logger.warning(f"Ticker {ticker} not found in tickers_fundamental.")
             else:
-                logger.info(f"{symbol} has no data after delisted_utc, marking as inactive.")
-                cursor.execute("UPDATE tickers_fundamental SET active = FALSE WHERE ticker = %s", (symbol,))
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
-    
+                ambiguous.append((ticker, delisted_utc, pending, primary_exchange, ticker_type))
+        print(f"退市确认: 共 {len(rows)} 个候选，{len(inactive)} 个标记为非活跃，{len(ambiguous)} 个需要查询 LongPort")
+
+        # 只对需要判断的 ticker 并发查询 LongPort，连接从 quote_pool 借出
+        otc, watch = [], []
+        if ambiguous:
+            with ThreadPoolExecutor(max_workers=max_workers or FETCH_CONFIG["max_workers"]) as executor:
+                past_data = executor.map(
+                    lambda item: has_history_before(item[0], item[4], item[3], item[1]), ambiguous)
+                for (ticker, delisted_utc, pending, _, _), has_past in zip(ambiguous, past_data):
+                    if not has_past:
+                        # 没有退市前的数据，标记为 OTC
+                        logger.info(f"{ticker} has no historical data before delisted_utc, marking as OTC.")
+                        otc.append((ticker,))
+                    elif not pending:
+                        # 有退市前的数据且之前未被观察，设为观察状态（active = null），下次再检查
+                        logger.info(f"{ticker} has historical data after delisted_utc, marking for review.")
+                        watch.append((ticker, delisted_utc))
+
+        if inactive:
+            execute_values(cursor, """
+                UPDATE tickers_fundamental t SET active = FALSE
+                FROM (VALUES %s) AS v (ticker) WHERE t.ticker = v.ticker
+            """, inactive)
+        if otc:
+            execute_values(cursor, """
+                UPDATE tickers_fundamental t SET primary_exchange = 'OTCP'
+                FROM (VALUES %s) AS v (ticker) WHERE t.ticker = v.ticker
+            """, otc)
+        if watch:
+            execute_values(cursor, """
+                UPDATE tickers_fundamental t SET active = NULL, last_updated_utc = v.delisted_utc
+                FROM (VALUES %s) AS v (ticker, delisted_utc) WHERE t.ticker = v.ticker
+            """, watch, template="(%s, %s::timestamp)")
+        conn.commit()
+        logger.info(f"delisted_confirm: inactive={len(inactive)}, otc={len(otc)}, review={len(watch)}")
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"确认退市状态失败: {e}")
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+def has_history_before(symbol, ticker_type, primary_exchange, delisted_utc):
+    """
+    检查 ticker 在 delisted_utc 之前（至少 3 天）是否还能从 LongPort 取到 K 线
+    """
+    cleaned_symbol = symbol
+    try:
+        cleaned_symbol = clean_symbol_for_postgres(symbol, ticker_type, primary_exchange)
+        with quote_pool.connection() as ctx:
+            resp = ctx.candlesticks(f"{cleaned_symbol}.US", Period.Day, 1000, AdjustType.ForwardAdjust)
+        cutoff = parse_delisted_utc(delisted_utc) - timedelta(days=3)
+        for candle in resp or []:
+            ts = getattr(candle, "timestamp", None)
+            if ts:
+                if not isinstance(ts, datetime):
+                    ts = datetime.strptime(ts.replace("T", " ").replace("Z", ""), "%Y-%m-%d %H:%M:%S")
+                if ts.replace(tzinfo=None) <= cutoff:
+                    return True
+        print(f"Ticker {cleaned_symbol} has renewed trading after delisted.")
+        return False
+    except Exception as e:
+        print(f"Error checking past data for {cleaned_symbol}: {e}")
+        return False
+
 def check_ticker_past(symbol, delisted_utc, cursor):
     """
     检查 ticker 在 delisted_utc 之前是否有历史数据
     """
-    config = Config.from_env()
-    ctx = QuoteContext(config=config)
-
     cursor.execute("SELECT primary_exchange, type FROM tickers_fundamental WHERE ticker = %s", (symbol,))
     result = cursor.fetchone()
-    
+
     if not result:
         print(f"[WARN] ticker {symbol} not found in tickers_fundamental.")
         logger.warning(f"Ticker {symbol} not found in tickers_fundamental.")
         return False
     primary_exchange, ticker_type = result
-    
-    try:
-        cleaned_symbol = clean_symbol_for_postgres(symbol, ticker_type, primary_exchange)
-        resp = ctx.candlesticks(f"{cleaned_symbol}.US", Period.Day, 1000, AdjustType.ForwardAdjust)
-        delisted_utc_str = delisted_utc.replace('Z', '')
-        delisted_utc_dt = datetime.strptime(delisted_utc_str, "%Y-%m-%dT%H:%M:%S")
-        if resp and hasattr(resp[0], "timestamp"):
-            found = False
-            for candle in resp:
-                ts = getattr(candle, "timestamp", None)
-                # print(f"Ticker: {cleaned_symbol}, delisted_utc: {ticker['delisted_utc']}, {ts}")
-                if ts:
-                    if isinstance(ts, datetime):
-                        ts_dt = ts
-                    else:
-                        ts_dt = datetime.strptime(ts.replace("T", " ").replace("Z", ""), "%Y-%m-%d %H:%M:%S")
-                    # 判断是否有timestamp早于delisted_utc_dt至少3天
-                    if ts_dt <= delisted_utc_dt - timedelta(days=3):
-                        # print(f"Ticker {cleaned_symbol} is still active after delisting on {delisted_utc}.")
-                        found = True
-            if not found:          
-                print(f"Ticker {cleaned_symbol} has renewed trading after delisted.")
-                return False
-            else:
-                # print(f"Ticker {cleaned_symbol} has historical data before delisted.")
-                return True
-    except Exception as e:
-        print(f"Error checking past data for {cleaned_symbol}: {e}")
-        return False
-            
+    return has_history_before(symbol, ticker_type, primary_exchange, delisted_utc)
+
 # 1.
+def process_ms(limit_date, progress_callback=None, cancel_event=None):
+    # ms_tickers为增量更新获取ms股票数据
+    ms_tickers = fetch_ms_tickers_from_polygon(progress_callback=progress_callback, cancel_event=cancel_event)
+    
+    # 只保留有 listing_date 且大于 上次更新日期 的
+    ms_update = get_last_stock_splits_updated_utc()
+    ms_update_utc = ms_update.strftime("%Y-%m-%d") if ms_update else ""
+    
+    ms_filtered = [
+        t for t in ms_tickers
+        if "execution_date" in t and t["execution_date"] > ms_update_utc and t["execution_date"] <= limit_date
+    ]
+    logger.debug(f"New MS tickers fetched: {ms_filtered}")
+    insert_ms_to_stock_splits(ms_filtered) # 将 MS 数据插入数据库stock_splits表
+    return ms_filtered
+
 class MsProcessThread(QThread):
     finished_with_result = Signal(object)
 
@@ -656,20 +525,7 @@ class MsProcessThread(QThread):
 
     def run(self):
         try:
-            # ms_tickers为增量更新获取ms股票数据
-            ms_tickers = fetch_ms_tickers_from_polygon()
-            
-            # 只保留有 listing_date 且大于 上次更新日期 的
-            ms_update_utc = get_last_stock_splits_updated_utc().strftime("%Y-%m-%d")
-            
-            ms_filtered = [
-                t for t in ms_tickers
-                if "execution_date" in t and t["execution_date"] > ms_update_utc and t["execution_date"] <= self.limit_date
-            ]
-            logger.debug(f"New MS tickers fetched: {ms_filtered}")
-            insert_ms_to_stock_splits(ms_filtered) # 将 MS 数据插入数据库stock_splits表
-
-            self.finished_with_result.emit(ms_filtered)
+            self.finished_with_result.emit(process_ms(self.limit_date))
         except Exception as e:
             print(f"process_ms failed: {e}")
             self.finished_with_result.emit([])
@@ -698,9 +554,11 @@ class DelistedProcessThread(QThread):
             print(f"process_delisted failed: {e}")
         self.finished.emit()
         
-def process_delisted(limit_date):
+def process_delisted(limit_date, progress_callback=None, cancel_event=None):
     # 获取截至上一更新日期到今天最新的退市股票的列表
-    delisted_tickers = delisted_incremental_update(limit_date)
+    delisted_tickers = delisted_incremental_update(limit_date, progress_callback, cancel_event)
+    # 确认退市状态前最后一次检查取消
+    raise_if_cancelled(cancel_event, "退市更新已取消")
     logger.debug(f"New delisted fetched: {delisted_tickers}")
     # 检测从polygon.io API获取到的delisted_tickers股票的具体退市状态
     ###### detect_delisted_tickers(delisted_tickers)
@@ -710,7 +568,7 @@ def process_delisted(limit_date):
 # 3.stock_daily
 
 # 4.
-def process_delisted_reverse(ms_filtered):
+def process_delisted_reverse(ms_filtered, progress_callback=None, cancel_event=None):
     if not ms_filtered:
         print("ms_filtered 为空，跳过 reverse split 处理")
         return
@@ -719,23 +577,30 @@ def process_delisted_reverse(ms_filtered):
     
     converted_tickers_info = [
         (
+            item['id'],
             item['ticker'],
             execution_date,
             float(item['split_from']),
             float(item['split_to'])
         )
         for item in ms_filtered
-        if (execution_date := datetime.strptime(item['execution_date'], "%Y-%m-%d").date()) >= cutoff_date
+        if item.get('id') and (execution_date := datetime.strptime(item['execution_date'], "%Y-%m-%d").date()) >= cutoff_date
     ]
     print(f"Total converted tickers for reverse split: {converted_tickers_info}")
-    revese_all_histroical_before_ms(converted_tickers_info)
-# 4.最后一步 更新IPO数据 #### ipo_incremental_update()
-def ipo_incremental_update(limit_date):
+    # 拆股因子表只依赖 stock_splits，每次都刷新
+    refresh_split_factors({item['ticker'] for item in ms_filtered})
+    # 读时复权模式下不再改写 stock_daily 的历史数据（以 stock_daily 实际的存储口径为准）
+    if adjust_on_read():
+        return
+    revese_all_histroical_before_ms(converted_tickers_info, progress_callback, cancel_event)
+# 5.更新IPO数据：从 Polygon 获取新上市股票并写入 tickers_fundamental，返回待回填的 ticker
+def ipo_reference_update(limit_date, progress_callback=None, cancel_event=None):
     
     last_updated_time = get_last_tickers_fundamental_updated_utc().strftime("%Y-%m-%d")
     
     print("Starting to fetch all ipo tickers from Polygon.io using HTTP...")
-    ipo_tickers = fetch_ipo_tickers_from_polygon(polygon_api_key, last_updated_time)
+    ipo_tickers = fetch_ipo_tickers_from_polygon(polygon_api_key, last_updated_time,
+                                                 progress_callback=progress_callback, cancel_event=cancel_event)
     
     # 只保留有 listing_date 且大于 上次更新日期 的
     ipo_filtered = [
@@ -772,7 +637,17 @@ def ipo_incremental_update(limit_date):
     if ipo_filtered_tickers:
         # print(f"Total tickers to insert: {tickers}")
         insert_tickers_to_tickers_fundamental(ipo_filtered_tickers) # 将 IPO 数据插入数据库tickers_fundamental表
-        fetch_data_from_longprot_to_stock_daily(ipo_filtered_tickers) # 从 LongPort 获取 IPO 数据并保存到 stock_daily 表
+    return ipo_filtered_tickers
+
+# 6.回填 IPO 股票的历史数据
+def ipo_backfill(ipo_filtered_tickers, progress_callback=None, cancel_event=None):
+    if ipo_filtered_tickers:
+        # 从 LongPort 获取 IPO 数据并保存到 stock_daily 表
+        fetch_data_from_longprot_to_stock_daily(ipo_filtered_tickers, progress_callback, cancel_event)
+
+# 最后一步 更新IPO数据 #### ipo_incremental_update()
+def ipo_incremental_update(limit_date):
+    ipo_backfill(ipo_reference_update(limit_date))
 
 # if __name__ == "__main__":
     
@@ -0,0 +1,182 @@
+import threading
+from collections import deque
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+from src.config.fetch_config import PREFETCH_CONFIG
+from src.database.db_operations import fetch_data_from_db
+from src.database.indicator_state import fetch_indicator_states
+from src.utils.frame_cache import frame_cache
+from src.utils.logger import setup_logger
+
+logger = setup_logger("prefetcher")
+
+# 前台加载优先于预取任务
+LOAD_PRIORITY = 1
+PREFETCH_PRIORITY = 0
+
+# 读取一个 ticker 的 K 线并写入帧缓存，缓存中已有部分数据时只查询缺少的更早部分
+def load_frame(ticker, engine, limit=None, adjust="raw", cache=frame_cache):
+    """
+    Returns:
+        最近 limit 根 K 线的 DataFrame（不会返回 None），没有数据时返回空 DataFrame（不写入缓存）
+    """
+    df = cache.get(ticker, adjust, limit)
+    if df is not None:
+        return df
+    gap = cache.missing(ticker, adjust, limit)
+    if gap is not None:
+        before, count = gap
+        older = fetch_data_from_db(ticker, engine, count, adjust, before)
+        # 返回的行数少于请求数（或请求全部）说明已到该 ticker 的最早数据
+        # 查询期间条目被失效或淘汰时 extend 丢弃这段更早的数据，改为从最新一根 K 线重新查询
+        if cache.extend(ticker, adjust, older, count is None or len(older) < count, before):
+            df = cache.get(ticker, adjust, limit)
+            if df is not None:
+                return df
+    df = fetch_data_from_db(ticker, engine, limit, adjust)
+    if not df.empty:
+        cache.put(ticker, adjust, df, limit is None or len(df) < limit)
+    # 直接返回查询结果：写入的条目可能已被并发的失效操作移除，不能再从缓存读取
+    return df
+
+
+class LoadSignals(QObject):
+    # (ticker, adjust, limit), df
+    data_loaded = Signal(object, object)
+    error_occurred = Signal(str)
+
+
+class FrameLoadTask(QRunnable):
+    """
+    在共享线程池中执行的加载任务。
+
+    generation 不为空时为预取任务：开始执行时如果预取器已进入新的一轮（用户切换了 ticker），直接放弃。
+    """
+    def __init__(self, prefetcher, ticker, limit, adjust, generation=None):
+        super().__init__()
+        self.prefetcher = prefetcher
+        self.ticker = ticker
+        self.limit = limit
+        self.adjust = adjust
+        self.generation = generation
+        self.signals = LoadSignals()
+
+    def run(self):
+        if self.generation is not None and self.generation != self.prefetcher.generation:
+            return
+        try:
+            df = load_frame(self.ticker, self.prefetcher.engine, self.limit, self.adjust, self.prefetcher.cache)
+            if self.adjust == "raw" and not df.empty:
+                self.prefetcher.load_states(self.ticker)
+            if self.generation is not None:
+                return
+            if df.empty:
+                self.signals.error_occurred.emit(f"数据框为空，无法绘制图表 (ticker: {self.ticker})")
+            else:
+                self.signals.data_loaded.emit((self.ticker, self.adjust, self.limit), df)
+        except Exception as e:
+            if self.generation is not None:
+                logger.debug(f"预取 {self.ticker} 失败: {e}")
+            else:
+                self.signals.error_occurred.emit(f"数据加载失败: {e}")
+
+
+class FramePrefetcher(QObject):
+    """
+    可视化页面的 K 线加载器：前台加载和后台预取共用一个小线程池，结果都写入帧缓存。
+
+    每次加载后根据选择框顺序（当前 ticker 的前后几个，下一个优先）、搜索结果和最近浏览记录
+    预测接下来可能查看的 ticker 并提前加载；切换 ticker 时旧一轮还没开始的预取任务会被放弃。
+
+    按存储口径（raw）加载时同时读取该 ticker 的增量指标状态，指标子图通过 states_for 取用以接上完整历史；
+    状态在线程池中读取、在界面线程中读取和丢弃，访问都经过锁，读取期间被丢弃的旧结果不会再放回。
+    """
+    data_loaded = Signal(object, object)
+    error_occurred = Signal(str)
+
+    def __init__(self, engine, cache=frame_cache, threads=None):
+        super().__init__()
+        self.engine = engine
+        self.cache = cache
+        self.generation = 0
+        self._states = {}
+        self._states_version = 0
+        self._states_lock = threading.Lock()
+        self.history = deque(maxlen=PREFETCH_CONFIG["history_size"])
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(threads or PREFETCH_CONFIG["threads"])
+
+    def load_states(self, ticker):
+        """读取（必要时初始化）一个 ticker 的增量指标状态，已读取过的不再查询"""
+        with self._states_lock:
+            if ticker in self._states:
+                return
+            version = self._states_version
+        try:
+            states = tuple(fetch_indicator_states(ticker))
+        except Exception as e:
+            logger.warning(f"读取 {ticker} 的指标状态失败: {e}")
+            return
+        with self._states_lock:
+            # 读取期间状态被丢弃过（新数据写入），这次读到的可能已过期，等下次加载时重新读取
+            if version == self._states_version:
+                self._states[ticker] = states
+
+    def states_for(self, ticker):
+        """返回已读取的指标状态（元组，不可修改），没有时返回空元组"""
+        with self._states_lock:
+            return self._states.get(ticker, ())
+
+    def forget_states(self, tickers=None):
+        """数据写入或历史被改写后丢弃已读取的指标状态，tickers 为 None 时全部丢弃"""
+        with self._states_lock:
+            self._states_version += 1
+            if tickers is None:
+                self._states.clear()
+            else:
+                for ticker in tickers:
+                    self._states.pop(ticker, None)
+
+    def remember(self, ticker):
+        """记录一次浏览，用于预测"""
+        if ticker in self.history:
+            self.history.remove(ticker)
+        self.history.append(ticker)
+
+    def load(self, ticker, limit=None, adjust="raw"):
+        """前台加载，完成后发出 data_loaded((ticker, adjust, limit), df)"""
+        task = FrameLoadTask(self, ticker, limit, adjust)
+        task.signals.data_loaded.connect(self.data_loaded)
+        task.signals.error_occurred.connect(self.error_occurred)
+        self.pool.start(task, LOAD_PRIORITY)
+
+    def predict(self, current, selector_symbols, search_results=()):
+        """按优先级返回接下来可能查看的 ticker（不含当前 ticker）"""
+        neighbours = PREFETCH_CONFIG["neighbours"]
+        candidates = []
+        try:
+            index = selector_symbols.index(current)
+        except ValueError:
+            index = None
+        if index is not None:
+            for offset in range(1, neighbours + 1):
+                candidates.extend(selector_symbols[i] for i in (index + offset, index - offset) if 0 <= i < len(selector_symbols))
+        candidates.extend(search_results[:neighbours])
+        candidates.extend(reversed(self.history))
+
+        predicted = []
+        for ticker in candidates:
+            if ticker != current and ticker not in predicted:
+                predicted.append(ticker)
+        return predicted[:PREFETCH_CONFIG["max_tickers"]]
+
+    def prefetch(self, tickers, limit=None, adjust="raw"):
+        """开始新一轮预取，之前排队中的预取任务作废"""
+        self.generation += 1
+        for ticker in tickers:
+            if self.cache.contains(ticker, adjust, limit):
+                continue
+            self.pool.start(FrameLoadTask(self, ticker, limit, adjust, self.generation), PREFETCH_PRIORITY)
+
+    def cancel(self):
+        """放弃所有尚未开始的预取"""
+        self.generation += 1
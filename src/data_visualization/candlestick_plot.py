@@ -1,90 +1,292 @@
 import pyqtgraph as pg
 import numpy as np
-from PySide6.QtWidgets import QGraphicsRectItem, QToolTip
+from PySide6.QtGui import QPicture, QPainter
 from PySide6.QtCore import Qt, QRectF, QPointF
 from pyqtgraph import SignalProxy
 import pandas as pd
+from src.data_visualization import indicators
+
+# K 线实体宽度（相邻两根 K 线间距为 1）
+CANDLE_WIDTH = 0.4
+# 细节层级：日线以及按自然周、月、季、年聚合
+LOD_LEVELS = ("D", "W", "M", "Q", "Y")
+
+class CandlestickItem(pg.GraphicsObject):
+    """
+    用一个图元绘制全部 K 线。
+
+    实体和影线由 NumPy 数组一次性生成为 QPainterPath（涨、跌各一条），结果缓存在 QPicture 中，
+    平移缩放时直接重放 QPicture，只有 setData 之后才重新生成。
+    width 可以是标量，也可以是与 x 等长的数组（聚合后的 K 线宽度随包含的天数变化）。
+    """
+    def __init__(self, x, open_, high, low, close, width=CANDLE_WIDTH, up_color='g', down_color='r'):
+        super().__init__()
+        self.up_color = up_color
+        self.down_color = down_color
+        self.picture = None
+        self._bounds = QRectF()
+        self.setData(x, open_, high, low, close, width)
+
+    def setData(self, x, open_, high, low, close, width=CANDLE_WIDTH):
+        self.x = np.asarray(x, dtype=float)
+        self.open = np.asarray(open_, dtype=float)
+        self.high = np.asarray(high, dtype=float)
+        self.low = np.asarray(low, dtype=float)
+        self.close = np.asarray(close, dtype=float)
+        self.width = np.broadcast_to(np.asarray(width, dtype=float), self.x.shape)
+        self.prepareGeometryChange()
+        if len(self.x):
+            x_min, x_max = self.x.min() - self.width.max(), self.x.max() + self.width.max()
+            y_min, y_max = np.nanmin(self.low), np.nanmax(self.high)
+            self._bounds = QRectF(x_min, y_min, x_max - x_min, y_max - y_min)
+        else:
+            self._bounds = QRectF()
+        self.picture = None
+        self.update()
+
+    def _wick_path(self, mask):
+        # 每根影线是 (x, low) -> (x, high) 一段，connect='pairs' 让相邻两点成对连接
+        xs = np.repeat(self.x[mask], 2)
+        ys = np.column_stack((self.low[mask], self.high[mask])).ravel()
+        return pg.arrayToQPath(xs, ys, connect='pairs')
+
+    def _body_path(self, mask):
+        # 每个实体是 5 个点的闭合矩形，connect 在每个矩形末尾断开
+        half = self.width[mask] / 2
+        x = self.x[mask]
+        top = np.maximum(self.open[mask], self.close[mask])
+        bottom = np.minimum(self.open[mask], self.close[mask])
+        xs = np.column_stack((x - half, x + half, x + half, x - half, x - half)).ravel()
+        ys = np.column_stack((bottom, bottom, top, top, bottom)).ravel()
+        connect = np.ones(len(xs), dtype=bool)
+        connect[4::5] = False
+        return pg.arrayToQPath(xs, ys, connect=connect)
+
+    def generatePicture(self):
+        self.picture = QPicture()
+        painter = QPainter(self.picture)
+        up = self.close >= self.open
+        for mask, color in ((up, self.up_color), (~up, self.down_color)):
+            if not mask.any():
+                continue
+            painter.setPen(pg.mkPen(color))
+            painter.setBrush(pg.mkBrush(color))
+            painter.drawPath(self._wick_path(mask))
+            painter.drawPath(self._body_path(mask))
+        painter.end()
+
+    def paint(self, painter, *args):
+        if self.picture is None:
+            self.generatePicture()
+        self.picture.play(painter)
+
+    def boundingRect(self):
+        return self._bounds
+
+# 按细节层级计算每个聚合区间的起始下标
+def bucket_starts(dates, level):
+    """
+    :param dates: 升序的 DatetimeIndex
+    :param level: LOD_LEVELS 中的一个
+    :return: 每个区间第一根 K 线的下标
+    """
+    if level == "D":
+        return np.arange(len(dates))
+    if level == "W":
+        keys = (dates - pd.Timestamp("1970-01-05")).days // 7  # 1970-01-05 为周一
+    elif level == "M":
+        keys = dates.year * 12 + dates.month
+    elif level == "Q":
+        keys = dates.year * 4 + (dates.month - 1) // 3
+    else:
+        keys = dates.year
+    keys = np.asarray(keys)
+    return np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+
+# 把连续的 K 线按区间聚合为一根 OHLC
+def aggregate_ohlc(starts, x, open_, high, low, close):
+    ends = np.append(starts[1:], len(x)) - 1
+    return {
+        "x": (x[starts] + x[ends]) / 2,
+        "open": open_[starts],
+        "high": np.maximum.reduceat(high, starts),
+        "low": np.minimum.reduceat(low, starts),
+        "close": close[ends],
+        "width": (ends - starts + 1) * CANDLE_WIDTH,
+    }
+
+
+class CandlestickLOD:
+    """
+    随视口缩放自动切换 K 线的细节层级。
+
+    每根 K 线至少占 min_pixels 像素：视口内的日线放不下时依次改用周线、月线、季线、年线。
+    各层级的聚合结果按需计算后缓存；每次只把视口左右各多一屏范围内的 K 线交给 CandlestickItem，
+    sigRangeChanged 时只有层级变化或视口移出已绘制范围才重新分箱。
+    """
+    def __init__(self, item, view_box, dates, open_, high, low, close, min_pixels=3):
+        self.item = item
+        self.view_box = view_box
+        self.dates = pd.DatetimeIndex(pd.to_datetime(dates))
+        self.x = np.arange(len(self.dates), dtype=float)
+        self.ohlc = tuple(np.asarray(a, dtype=float) for a in (open_, high, low, close))
+        self.min_pixels = min_pixels
+        self.levels = {}
+        self.level = None
+        self.window = (0.0, -1.0)
+        self.view_box.sigRangeChanged.connect(self.on_range_changed)
+        self.view_box.sigResized.connect(self.on_resized)
+
+    def level_data(self, level):
+        if level not in self.levels:
+            if level == "D":
+                open_, high, low, close = self.ohlc
+                self.levels[level] = {"x": self.x, "open": open_, "high": high, "low": low, "close": close,
+                                      "width": np.full(len(self.x), CANDLE_WIDTH)}
+            else:
+                self.levels[level] = aggregate_ohlc(bucket_starts(self.dates, level), self.x, *self.ohlc)
+        return self.levels[level]
+
+    def choose_level(self, visible_bars, pixels):
+        max_bars = max(pixels / self.min_pixels, 1)
+        for level in LOD_LEVELS:
+            bars_per_bucket = len(self.x) / max(len(self.level_data(level)["x"]), 1)
+            if visible_bars / bars_per_bucket <= max_bars:
+                return level
+        return LOD_LEVELS[-1]
+
+    def refresh(self, x_range):
+        x0, x1 = x_range
+        visible = max(x1 - x0, 1)
+        level = self.choose_level(visible, max(self.view_box.width(), 1))
+        if level == self.level and self.window[0] <= x0 and x1 <= self.window[1]:
+            return
+        self.level = level
+        self.window = (x0 - visible, x1 + visible)
+        data = self.level_data(level)
+        i0 = np.searchsorted(data["x"], self.window[0], side="left")
+        i1 = np.searchsorted(data["x"], self.window[1], side="right")
+        self.item.setData(*(data[key][i0:i1] for key in ("x", "open", "high", "low", "close", "width")))
+
+    def on_range_changed(self, view_box, ranges, *args):
+        self.refresh(ranges[0])
+
+    def on_resized(self, *args):
+        self.refresh(self.view_box.viewRange()[0])
+
+    def detach(self):
+        try:
+            self.view_box.sigRangeChanged.disconnect(self.on_range_changed)
+            self.view_box.sigResized.disconnect(self.on_resized)
+        except (TypeError, RuntimeError):
+            pass
+
+
+class IndexDateAxis(pg.AxisItem):
+    """横轴为 K 线下标，刻度文字显示对应日期；刻度间隔由 pyqtgraph 根据缩放自动决定"""
+    def __init__(self, labels, **kwargs):
+        super().__init__(orientation='bottom', **kwargs)
+        self.labels = labels
+
+    def tickStrings(self, values, scale, spacing):
+        n = len(self.labels)
+        return [self.labels[int(v)] if 0 <= int(v) < n and float(v).is_integer() else "" for v in values]
+
+class CandlestickHover:
+    """
+    K 线图的十字光标和数据标签。
+
+    绘图时一次性把 OHLCV 转成连续的 NumPy 数组并格式化好每根 K 线的标签文字，
+    鼠标移动时只做一次坐标换算和数组下标访问，复用同一个 TextItem，下标不变时不重设文字。
+    """
+    def __init__(self, main_plot, df):
+        self.plot = main_plot
+        self.view_box = main_plot.getViewBox()
+        dates = pd.to_datetime(df["Date"]).dt.strftime('%Y-%m-%d').tolist()
+        opens, highs, lows, closes = (df[column].to_numpy(dtype=float) for column in ("Open", "High", "Low", "Close"))
+        volumes = df["Volume"].to_numpy(dtype=np.int64)
+        self.labels = [
+            f"Date: {d}\nOpen: {o:.2f}  Close: {c:.2f}\nHigh: {h:.2f}  Low: {l:.2f}\nVolume: {v:,}"
+            for d, o, h, l, c, v in zip(dates, opens.tolist(), highs.tolist(), lows.tolist(), closes.tolist(), volumes.tolist())
+        ]
+        self.count = len(self.labels)
+        self.last_index = None
+
+        pen = pg.mkPen('gray', style=Qt.PenStyle.DashLine)
+        self.v_line = pg.InfiniteLine(angle=90, movable=False, pen=pen)
+        self.h_line = pg.InfiniteLine(angle=0, movable=False, pen=pen)
+        self.label = pg.TextItem(color='k', fill=pg.mkBrush(255, 255, 255, 200), anchor=(0, 1))
+        for item in (self.v_line, self.h_line, self.label):
+            item.setZValue(10)
+            item.hide()
+            main_plot.addItem(item, ignoreBounds=True)
+        self.proxy = SignalProxy(main_plot.scene().sigMouseMoved, rateLimit=60, slot=self.on_mouse_moved)
+
+    def on_mouse_moved(self, event):
+        pos = event[0]
+        if not self.plot.sceneBoundingRect().contains(pos):
+            self.hide()
+            return
+        point = self.view_box.mapSceneToView(pos)
+        index = int(round(point.x()))
+        if not 0 <= index < self.count:
+            self.hide()
+            return
+        if index != self.last_index:
+            self.label.setText(self.labels[index])
+            self.last_index = index
+        self.v_line.setPos(index)
+        self.h_line.setPos(point.y())
+        self.label.setPos(index, point.y())
+        for item in (self.v_line, self.h_line, self.label):
+            item.show()
+
+    def hide(self):
+        for item in (self.v_line, self.h_line, self.label):
+            item.hide()
+
+    def detach(self):
+        self.proxy.disconnect()
+        for item in (self.v_line, self.h_line, self.label):
+            if item.scene() is not None:
+                self.plot.removeItem(item)
+
+# 开启或关闭 K 线图的鼠标悬停显示，不需要重绘 K 线
+def set_candlestick_hover(main_plot, df, enable_hover):
+    if hasattr(main_plot, 'hover'):
+        main_plot.hover.detach()
+        del main_plot.hover
+    if enable_hover and not df.empty:
+        main_plot.hover = CandlestickHover(main_plot, df)
 
 def plot_candlestick(main_plot, df, enable_hover, auto_range=True):
     if df.empty:
         return
     
     main_plot.clear()
+    if hasattr(main_plot, 'lod'):
+        main_plot.lod.detach()
     
     x = np.arange(len(df))
+    dates = pd.to_datetime(df["Date"])
 
-    axis = pg.DateAxisItem(orientation='bottom')
+    axis = IndexDateAxis(dates.dt.strftime('%Y%m%d').to_numpy())
     main_plot.setAxisItems({'bottom': axis})
 
-    for i in range(len(df)):
-        open_price = df["Open"].iloc[i]
-        close_price = df["Close"].iloc[i]
-        high = df["High"].iloc[i]
-        low = df["Low"].iloc[i]
-
-        color = 'g' if close_price >= open_price else 'r'
-        body = QGraphicsRectItem(QRectF(x[i] - 0.2, min(open_price, close_price), 0.4, abs(close_price - open_price)))
-        body.setBrush(pg.mkBrush(color))
-        body.setPen(pg.mkPen(color))
-        main_plot.addItem(body)
-
-        shadow = pg.PlotCurveItem([x[i], x[i]], [low, high], pen=pg.mkPen(color))
-        main_plot.addItem(shadow)
+    ohlc = [df[column].to_numpy(dtype=float) for column in ("Open", "High", "Low", "Close")]
+    main_plot.candlesticks = CandlestickItem(x[:0], *(a[:0] for a in ohlc))
+    main_plot.addItem(main_plot.candlesticks)
+    # 先按整段数据选择细节层级，长历史不会在第一次绘制时画出全部日线
+    main_plot.lod = CandlestickLOD(main_plot.candlesticks, main_plot.getViewBox(), dates, *ohlc)
+    main_plot.lod.refresh((0, len(df)))
 
     main_plot.setLabel('bottom', 'Date')
     main_plot.setLabel('left', 'Price')
 
     if auto_range:
         main_plot.getPlotItem().vb.autoRange()
-
-    ticks = [(x[i], df["Date"].iloc[i].strftime('%Y%m%d')) for i in range(0, len(df), 5)]
-    axis.setTicks([ticks]) 
     
-    if enable_hover:
-        print("Hover enabled")
-        def on_mouse_hover(event):
-            pos = event[0]
-            if main_plot.sceneBoundingRect().contains(pos):
-                mouse_point = main_plot.getViewBox().mapSceneToView(pos)
-                index = int(mouse_point.x())
-                if 0 <= index < len(df):
-                    date = df["Date"].iloc[index]
-                    open_price = df["Open"].iloc[index]
-                    close_price = df["Close"].iloc[index]
-                    high = df["High"].iloc[index]
-                    low = df["Low"].iloc[index]
-                    volume = df["Volume"].iloc[index]
-                    
-                    main_plot.setTitle(
-                        f"Date: {date}\n"
-                        f"Open: {open_price:.2f}, Close: {close_price:.2f}\n"
-                        f"High: {high:.2f}, Low: {low:.2f}\n"
-                        f"Volume: {volume:,}"
-                    )
-                    
-                    tooltip_text = (
-                        f"Date: {date}\n"
-                        f"Open: {open_price:.2f}\n"
-                        f"Close: {close_price:.2f}\n"
-                        f"High: {high:.2f}\n"
-                        f"Low: {low:.2f}\n"
-                        f"Volume: {volume:,}"
-                    )
-                    QToolTip.showText(main_plot.mapToGlobal(pos.toPoint()), tooltip_text, main_plot)
-                else:
-                    main_plot.setTitle("")
-                    QToolTip.hideText()
-            else:
-                main_plot.setTitle("")
-                QToolTip.hideText()
-                
-        main_plot.proxy = SignalProxy(main_plot.scene().sigMouseMoved, rateLimit=60, slot=on_mouse_hover)
-    else:
-        if hasattr(main_plot, 'proxy'):
-            main_plot.proxy.disconnect()
-            del main_plot.proxy
-        main_plot.setTitle("")
-        QToolTip.hideText()
+    set_candlestick_hover(main_plot, df, enable_hover)
 
 def plot_volume(subplot, df):
     subplot.clear()
@@ -96,24 +298,28 @@ def plot_volume(subplot, df):
     subplot.getAxis('bottom').setStyle(showValues=False)
 
 def calculate_obv(df):
-    # Assuming this function calculates OBV correctly based on your DataFrame
-    # Replace with your actual OBV calculation logic if different
-    obv = [0]  # Starting value
-    for i in range(1, len(df)):
-        if df["Close"].iloc[i] > df["Close"].iloc[i - 1]:
-            obv.append(obv[-1] + df["Volume"].iloc[i])
-        elif df["Close"].iloc[i] < df["Close"].iloc[i - 1]:
-            obv.append(obv[-1] - df["Volume"].iloc[i])
-        else:
-            obv.append(obv[-1])
-    return pd.Series(obv, index=df.index)
+    return indicators.obv(df)
 
 def plot_obv(subplot, df):
+    plot_indicator(subplot, df, "OBV")
+
+# 指标曲线的颜色，按顺序使用
+INDICATOR_COLORS = ('b', (255, 140, 0), (148, 0, 211), (0, 150, 0), 'r')
+
+# 按 indicators.INDICATOR_LINES 绘制一个指标子图，MACD 柱状图画成柱形
+# anchors 为 indicators.state_anchors 的结果，用存储的指标状态把窗口内的曲线接到完整历史上
+def plot_indicator(subplot, df, name, anchors=None):
     subplot.clear()
-    obv = calculate_obv(df)
+    subplot.addLegend(offset=(10, 10))
     x = np.arange(len(df))
-    obv_line = pg.PlotCurveItem(x, obv.values, pen='b')  # Convert Series to NumPy array
-    subplot.addItem(obv_line)
-    subplot.setLabel('left', 'OBV')
+    lines = indicators.indicator_lines(name, df, anchors)
+    for i, (label, series) in enumerate(lines.items()):
+        values = series.to_numpy(dtype=float)
+        color = INDICATOR_COLORS[i % len(INDICATOR_COLORS)]
+        if label == "Histogram":
+            subplot.addItem(pg.BarGraphItem(x=x, height=np.nan_to_num(values), width=CANDLE_WIDTH, brush=color, name=label))
+        else:
+            subplot.plot(x, values, pen=pg.mkPen(color), name=label, connect="finite")
+    subplot.setLabel('left', name)
     subplot.enableAutoRange('y', True)
-    subplot.getAxis('bottom').setStyle(showValues=False)
\ No newline at end of file
+    subplot.getAxis('bottom').setStyle(showValues=False)
@@ -0,0 +1,302 @@
+import numpy as np
+import pandas as pd
+
+# 技术指标：全部基于 NumPy / pandas 的向量运算，输入为 fetch_data_from_db 返回的
+# 包含 Date/Open/High/Low/Close/Volume 列的 DataFrame，输出与 df 同索引的 Series 或 DataFrame
+#
+# OBV / EMA / RSI / MACD 从 df 的第一根 K 线起算；df 只是最近一段 K 线时，可以传入 anchor
+# （完整历史在最后一根 K 线上的值，来自存储的增量指标状态）把曲线接到完整历史上
+
+# 反推时误差的最大放大倍数
+_ANCHOR_MAX_GAIN = 1e6
+
+# 同一递推式的两条指数平滑序列之差每根 K 线乘以 (1 - alpha)，由最后一根 K 线上的差值往前反推。
+# 每往前一根 K 线差值放大 1 / (1 - alpha)，只修正放大倍数不超过 _ANCHOR_MAX_GAIN 的最近 reach 根；
+# 更早的部分浮点误差会被放大到不可用：离窗口开头超过 reach 根的窗口值已经收敛（误差缩小到 1 / _ANCHOR_MAX_GAIN），
+# 保留原值；两者都不满足的窗口开头部分设为 NaN，不画出错误的值
+def _anchor_smoothed(series, alpha, anchor):
+    if anchor is None or series.empty:
+        return series
+    steps = np.arange(len(series) - 1, -1, -1)
+    reach = int(np.log(_ANCHOR_MAX_GAIN) / -np.log(1 - alpha))
+    gain = np.where(steps <= reach, (1 - alpha) ** -np.minimum(steps, reach), 0.0)
+    unreliable = (steps > reach) & (steps[::-1] < reach)
+    return (series + (anchor - series.iloc[-1]) * gain).mask(unreliable)
+
+# 能量潮 OBV（anchor 不为空时整体平移，使最后一根 K 线的值等于 anchor）
+def obv(df, anchor=None):
+    close = df["Close"].to_numpy(dtype=float)
+    volume = df["Volume"].to_numpy(dtype=float)
+    direction = np.sign(np.diff(close, prepend=close[:1]))
+    values = np.cumsum(direction * volume)
+    if anchor is not None and len(values):
+        values = values + (anchor - values[-1])
+    return pd.Series(values, index=df.index, name="OBV")
+
+# 简单移动平均
+def sma(series, window=20):
+    return series.rolling(window, min_periods=window).mean()
+
+# 指数移动平均（与增量计算的 RunningEMA 一致：以第一根 K 线为初始值）
+def ema(series, span=20, anchor=None):
+    return _anchor_smoothed(series.ewm(span=span, adjust=False).mean(), 2 / (span + 1), anchor)
+
+# Wilder 平滑
+def _wilder(series, period, anchor=None):
+    smoothed = series.ewm(alpha=1 / period, adjust=False, min_periods=period).mean()
+    return _anchor_smoothed(smoothed, 1 / period, anchor)
+
+# 相对强弱指数 RSI（Wilder 平滑），anchor 为 (平均涨幅, 平均跌幅)
+def rsi(close, period=14, anchor=None):
+    delta = close.diff()
+    gain_anchor, loss_anchor = anchor if anchor is not None else (None, None)
+    gain = _wilder(delta.clip(lower=0), period, gain_anchor)
+    loss = _wilder(-delta.clip(upper=0), period, loss_anchor)
+    rs = gain / loss
+    return (100 - 100 / (1 + rs)).where(loss != 0, 100.0).rename("RSI")
+
+# MACD：快慢 EMA 之差、信号线和柱状图
+# 快慢 EMA 可以接到完整历史上；信号线没有存储状态，从窗口第一根 K 线起算，之后逐渐收敛
+def macd(close, fast=12, slow=26, signal=9, fast_anchor=None, slow_anchor=None):
+    line = ema(close, fast, fast_anchor) - ema(close, slow, slow_anchor)
+    signal_line = ema(line, signal)
+    return pd.DataFrame({"MACD": line, "Signal": signal_line, "Histogram": line - signal_line})
+
+# 布林带
+def bollinger(close, window=20, num_std=2.0):
+    middle = sma(close, window)
+    std = close.rolling(window, min_periods=window).std(ddof=0)
+    return pd.DataFrame({"Middle": middle, "Upper": middle + num_std * std, "Lower": middle - num_std * std})
+
+# 平均真实波幅 ATR（Wilder 平滑）
+def atr(df, period=14):
+    high, low, close = df["High"], df["Low"], df["Close"]
+    prev_close = close.shift(1)
+    true_range = pd.concat([high - low, (high - prev_close).abs(), (low - prev_close).abs()], axis=1).max(axis=1)
+    return true_range.ewm(alpha=1 / period, adjust=False, min_periods=period).mean().rename("ATR")
+
+# 成交量加权平均价 VWAP（日线数据上从第一根 K 线开始累计）
+def vwap(df):
+    typical = (df["High"] + df["Low"] + df["Close"]) / 3
+    volume = df["Volume"].astype(float)
+    return ((typical * volume).cumsum() / volume.cumsum().replace(0, np.nan)).rename("VWAP")
+
+# 可在 subplot_selector 中选择的指标：名称 -> 返回 {曲线名: Series} 的函数
+# 函数的第二个参数为 {增量指标名: anchor}（见 state_anchors），没有对应 anchor 时从窗口起算
+INDICATOR_LINES = {
+    "OBV": lambda df, anchors: {"OBV": obv(df, anchors.get("OBV"))},
+    "SMA": lambda df, anchors: {"Close": df["Close"], "SMA20": sma(df["Close"], 20), "SMA50": sma(df["Close"], 50)},
+    "EMA": lambda df, anchors: {"Close": df["Close"], "EMA12": ema(df["Close"], 12, anchors.get("EMA12")),
+                                "EMA26": ema(df["Close"], 26, anchors.get("EMA26"))},
+    "RSI": lambda df, anchors: {"RSI": rsi(df["Close"], 14, anchors.get("RSI14"))},
+    "MACD": lambda df, anchors: dict(macd(df["Close"], fast_anchor=anchors.get("EMA12"),
+                                          slow_anchor=anchors.get("EMA26")).items()),
+    "Bollinger": lambda df, anchors: {"Close": df["Close"], **dict(bollinger(df["Close"]).items())},
+    "ATR": lambda df, anchors: {"ATR": atr(df)},
+    "VWAP": lambda df, anchors: {"Close": df["Close"], "VWAP": vwap(df)},
+}
+
+# 计算一个指标的全部曲线
+def indicator_lines(name, df, anchors=None):
+    return INDICATOR_LINES[name](df, anchors or {})
+
+
+class RunningIndicator:
+    """
+    可增量更新的指标状态：每来一根新 K 线 O(1) 前进一步，状态可序列化后与 ticker 数据一起保存。
+
+    from_frame 用向量化结果初始化状态，之后 update 只处理新的 K 线；
+    时间戳不晚于 last_timestamp 的 K 线会被忽略，重复写入同一根 K 线不会重复累计。
+    """
+    name = None
+
+    def __init__(self, last_timestamp=None):
+        self.last_timestamp = last_timestamp
+
+    def update(self, timestamp, close, volume=0):
+        """处理一根新 K 线并返回最新指标值"""
+        timestamp = pd.Timestamp(timestamp)
+        if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+            return self.value
+        self.last_timestamp = timestamp
+        return self.step(float(close), float(volume))
+
+    def step(self, close, volume):
+        raise NotImplementedError
+
+    @property
+    def value(self):
+        raise NotImplementedError
+
+    @property
+    def anchor(self):
+        """传给向量化指标函数的 anchor，还没有值时为 None"""
+        return self.value
+
+    def state(self):
+        """指标自身的状态字段（不含公共字段）"""
+        raise NotImplementedError
+
+    def to_dict(self):
+        return {
+            "type": type(self).__name__,
+            "last_timestamp": self.last_timestamp.isoformat() if self.last_timestamp is not None else None,
+            **self.state(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        indicator_cls = RUNNING_INDICATORS[data.pop("type")]
+        last_timestamp = data.pop("last_timestamp")
+        indicator = indicator_cls(**data)
+        indicator.last_timestamp = pd.Timestamp(last_timestamp) if last_timestamp else None
+        return indicator
+
+
+class RunningOBV(RunningIndicator):
+    name = "OBV"
+
+    def __init__(self, obv=0.0, prev_close=None, last_timestamp=None):
+        super().__init__(last_timestamp)
+        self.obv = obv
+        self.prev_close = prev_close
+
+    def step(self, close, volume):
+        if self.prev_close is not None:
+            self.obv += float(np.sign(close - self.prev_close)) * volume
+        self.prev_close = close
+        return self.obv
+
+    @property
+    def value(self):
+        return self.obv
+
+    def state(self):
+        return {"obv": self.obv, "prev_close": self.prev_close}
+
+    @classmethod
+    def from_frame(cls, df):
+        if df.empty:
+            return cls()
+        return cls(float(obv(df).iloc[-1]), float(df["Close"].iloc[-1]), pd.Timestamp(df["Date"].iloc[-1]))
+
+
+class RunningEMA(RunningIndicator):
+    def __init__(self, span=20, ema=None, last_timestamp=None):
+        super().__init__(last_timestamp)
+        self.span = span
+        self.alpha = 2 / (span + 1)
+        self.ema = ema
+
+    @property
+    def name(self):
+        return f"EMA{self.span}"
+
+    def step(self, close, volume):
+        self.ema = close if self.ema is None else self.alpha * close + (1 - self.alpha) * self.ema
+        return self.ema
+
+    @property
+    def value(self):
+        return self.ema
+
+    def state(self):
+        return {"span": self.span, "ema": self.ema}
+
+    @classmethod
+    def from_frame(cls, df, span=20):
+        if df.empty:
+            return cls(span)
+        return cls(span, float(ema(df["Close"], span).iloc[-1]), pd.Timestamp(df["Date"].iloc[-1]))
+
+
+class RunningRSI(RunningIndicator):
+    def __init__(self, period=14, avg_gain=None, avg_loss=None, prev_close=None, count=0, last_timestamp=None):
+        super().__init__(last_timestamp)
+        self.period = period
+        self.avg_gain = avg_gain
+        self.avg_loss = avg_loss
+        self.prev_close = prev_close
+        self.count = count
+
+    @property
+    def name(self):
+        return f"RSI{self.period}"
+
+    def step(self, close, volume):
+        if self.prev_close is not None:
+            delta = close - self.prev_close
+            gain, loss = max(delta, 0.0), max(-delta, 0.0)
+            if self.avg_gain is None:
+                self.avg_gain, self.avg_loss = gain, loss
+            else:
+                alpha = 1 / self.period
+                self.avg_gain = alpha * gain + (1 - alpha) * self.avg_gain
+                self.avg_loss = alpha * loss + (1 - alpha) * self.avg_loss
+            self.count += 1
+        self.prev_close = close
+        return self.value
+
+    @property
+    def value(self):
+        if self.count < self.period:
+            return None
+        if self.avg_loss == 0:
+            return 100.0
+        return 100 - 100 / (1 + self.avg_gain / self.avg_loss)
+
+    @property
+    def anchor(self):
+        if self.count < self.period:
+            return None
+        return (self.avg_gain, self.avg_loss)
+
+    def state(self):
+        return {"period": self.period, "avg_gain": self.avg_gain, "avg_loss": self.avg_loss,
+                "prev_close": self.prev_close, "count": self.count}
+
+    @classmethod
+    def from_frame(cls, df, period=14):
+        if df.empty:
+            return cls(period)
+        delta = df["Close"].diff()
+        alpha = 1 / period
+        avg_gain = delta.clip(lower=0).ewm(alpha=alpha, adjust=False).mean().iloc[-1]
+        avg_loss = (-delta.clip(upper=0)).ewm(alpha=alpha, adjust=False).mean().iloc[-1]
+        return cls(
+            period,
+            None if pd.isna(avg_gain) else float(avg_gain),
+            None if pd.isna(avg_loss) else float(avg_loss),
+            float(df["Close"].iloc[-1]),
+            len(df) - 1,
+            pd.Timestamp(df["Date"].iloc[-1]),
+        )
+
+# 可序列化的增量指标类型
+RUNNING_INDICATORS = {cls.__name__: cls for cls in (RunningOBV, RunningEMA, RunningRSI)}
+
+# 默认为每个 ticker 维护的增量指标
+def default_running_indicators(df):
+    return [
+        RunningOBV.from_frame(df),
+        RunningEMA.from_frame(df, 12),
+        RunningEMA.from_frame(df, 26),
+        RunningRSI.from_frame(df, 14),
+    ]
+
+# 存储的增量指标状态与 df 的最后一根 K 线对齐时返回 {指标名: anchor}，否则返回空 dict
+def state_anchors(df, states):
+    """
+    Args:
+        df: 按 stock_daily 存储口径读取的最近一段 K 线（读时复权后的数据不能使用存储的状态）
+        states: [RunningIndicator, ...]
+    """
+    if df.empty or not states:
+        return {}
+    last_timestamp = pd.Timestamp(df["Date"].iloc[-1])
+    return {
+        indicator.name: indicator.anchor
+        for indicator in states
+        if indicator.last_timestamp == last_timestamp and indicator.anchor is not None
+    }
@@ -1,34 +1,43 @@
+import io
+import csv
 import pandas as pd
 from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 from src.utils.logger import setup_logger
 from src.database.db_connection import DatabaseConnectionError
+from src.database.freshness_index import freshness_index
+from src.database.ticker_registry import ensure_ticker_registry, registry_upsert_sql, fetch_registered_tickers
+from src.database.schema import ensure_current_partitions
+from src.database.symbol_mapping import symbol_mapping
+from src.database.price_adjustment import fetch_split_factors, adjust_prices
 import pytz
 from src.config.db_config import DB_CONFIG  # 数据库配置
 import psycopg2
-from longport.openapi import QuoteContext, Config, Period, AdjustType, OpenApiException
+from longport.openapi import Period, AdjustType, OpenApiException
+from src.utils.quote_pool import quote_pool
+from src.utils.rate_limiter import is_throttled
 
 logger = setup_logger("db_operations")
 ny_tz = pytz.timezone('America/New_York')
 
-# LongPort API 配置
-config = Config.from_env()  # 从环境变量加载 LongPort 配置
-print("LongPort API Config:", config)
-ctx = QuoteContext(config)
-
 # 数据库连接函数
 def get_db_connection():
     return psycopg2.connect(**DB_CONFIG)
 
 # 测试 LongPort API 是否能获取数据
 def test_ticker_api(ticker):
+    """
+    Returns:
+        (成功状态, 数据条数或错误信息, 结果是否确定)；限流、网络等临时错误时结果不确定
+    """
     try:
-        resp = ctx.candlesticks(f"{ticker}.US", Period.Day, 1, AdjustType.ForwardAdjust)
-        return True, len(resp)  # 返回成功状态和数据条数
+        with quote_pool.connection() as ctx:
+            resp = ctx.candlesticks(f"{ticker}.US", Period.Day, 1, AdjustType.ForwardAdjust)
+        return True, len(resp), True  # 返回成功状态和数据条数
     except OpenApiException as e:
-        return False, f"OpenApiException: {e}"
+        return False, f"OpenApiException: {e}", not is_throttled(e)
     except Exception as e:
-        return False, f"Unexpected error: {e}"
+        return False, f"Unexpected error: {e}", False
     
 # 检查数据库中是否存在某个 ticker
 def check_ticker_exists(ticker):
@@ -41,8 +50,25 @@ def check_ticker_exists(ticker):
     return count > 0
 
 # 清洗 ticker 名称以适应 PostgreSQL和 LongPort API
+# 已知 ticker 直接命中 symbol_mapping 缓存，只有新 ticker 或 type / 交易所变化时才重新计算
 def clean_symbol_for_postgres(ticker, ticker_type, primary_exchange):
+    cached = symbol_mapping.get(ticker, ticker_type, primary_exchange)
+    if cached is not None:
+        return cached
+    cleaned_ticker, validated = normalize_symbol(ticker, ticker_type, primary_exchange)
+    # WARRANT 验证遇到临时错误时的回退结果只在本进程内使用，不写库，下次运行重新验证
+    symbol_mapping.put(ticker, cleaned_ticker, ticker_type, primary_exchange,
+                       validated=(ticker_type == "WARRANT"), persist=validated)
+    return cleaned_ticker
+
+# 按规则计算 LongPort 代码（WARRANT 需要访问 LongPort 和数据库验证）
+def normalize_symbol(ticker, ticker_type, primary_exchange):
+    """
+    Returns:
+        (LongPort 代码, 结果是否确定)；WARRANT 的 LongPort 验证因限流、网络等临时错误失败时不确定
+    """
     cleaned_ticker = ticker
+    validated = True
     
     # 规则 1：如果交易所类型是 XNAS，删除 "."
     if primary_exchange == "XNAS":
@@ -51,7 +77,7 @@ def clean_symbol_for_postgres(ticker, ticker_type, primary_exchange):
     # 规则 2：如果类型是 WARRANT
     if ticker_type == "WARRANT":
         # 先测试原始 ticker 是否有效
-        success, _ = test_ticker_api(cleaned_ticker)
+        success, _, validated = test_ticker_api(cleaned_ticker)
         if success:
             cleaned_ticker = cleaned_ticker  # 如果有效，不做变化
         # 如果失败，执行后续逻辑
@@ -78,25 +104,32 @@ def clean_symbol_for_postgres(ticker, ticker_type, primary_exchange):
     if ticker_type == "RIGHT" and "r" in cleaned_ticker.lower():
         cleaned_ticker = cleaned_ticker.replace("r", ".RT")
     
-    return cleaned_ticker
+    return cleaned_ticker, validated
 
 # 从 stock_daily 表读取指定 ticker 的数据
-def fetch_data_from_db(ticker, engine, limit=None):
-    """从 stock_daily 表读取指定 ticker 的数据，返回 DataFrame"""
+def fetch_data_from_db(ticker, engine, limit=None, adjust="raw", before=None):
+    """
+    从 stock_daily 表读取指定 ticker 的数据，返回 DataFrame，adjust 为 raw / forward / backward
+    before 不为空时只读取该日期之前的数据（用于在已缓存数据前补齐更早的 K 线）
+    """
     try:
         query = """
         SELECT timestamp, open, high, low, close, volume
         FROM stock_daily
         WHERE ticker = :ticker
-        ORDER BY timestamp DESC
         """
+        params = {"ticker": ticker}
+        if before is not None:
+            query += " AND timestamp < :before"
+            params["before"] = before
+        query += " ORDER BY timestamp DESC"
         if limit is not None:
-            query += f" LIMIT {limit}"
+            query += f" LIMIT {int(limit)}"
         query += ";"
         df = pd.read_sql_query(
             text(query),
             engine,
-            params={"ticker": ticker}
+            params=params
         )
         df.rename(
             columns={
@@ -111,6 +144,8 @@ def fetch_data_from_db(ticker, engine, limit=None):
         )
         df["Date"] = pd.to_datetime(df["Date"])
         df = df.sort_values(by="Date")
+        if adjust != "raw":
+            df = adjust_prices(df, fetch_split_factors(ticker, engine), adjust)
         if not df.empty:
             logger.info(df.iloc[-1])
         return df
@@ -121,33 +156,40 @@ def fetch_data_from_db(ticker, engine, limit=None):
 
 # 获取 stock_daily 中的所有 ticker
 def fetch_table_names(engine):
-    """获取 stock_daily 中的所有 ticker"""
-    try:
-        with engine.connect() as conn:
-            result = conn.execute(text("""
-                SELECT DISTINCT ticker
-                FROM stock_daily
-            """))
-            return [row[0] for row in result.fetchall()]
-    except SQLAlchemyError as e:
-        logger.error(f"Error fetching tickers: {e}")
-        return []
+    """获取 stock_daily 中有数据的所有 ticker（读取 ticker_registry，不扫描 stock_daily）"""
+    return fetch_registered_tickers(engine)
+
+# 获取有数据的 ticker 及 tickers_fundamental 中的公司名称（用于搜索索引）
+def fetch_ticker_names(engine, tickers=None):
+    """获取 (ticker, name)，tickers 为 None 时返回全部"""
+    ensure_ticker_registry()
+    query = """
+        SELECT r.ticker, tf.name
+        FROM ticker_registry r
+        LEFT JOIN tickers_fundamental tf ON tf.ticker = r.ticker
+    """
+    params = {}
+    if tickers is not None:
+        query += " WHERE r.ticker = ANY(:tickers)"
+        params["tickers"] = list(tickers)
+    with engine.connect() as conn:
+        result = conn.execute(text(query), params)
+        return [(row[0], row[1]) for row in result.fetchall()]
 
 # 获取 stock_daily 中指定 ticker 的最新时间戳
 def get_latest_timestamp(ticker, engine):
     """获取 stock_daily 中指定 ticker 的最新时间戳"""
     try:
+        ensure_ticker_registry()
         with engine.connect() as conn:
             result = conn.execute(text("""
-                SELECT timestamp 
-                FROM stock_daily
+                SELECT last_timestamp
+                FROM ticker_registry
                 WHERE ticker = :ticker
-                ORDER BY timestamp DESC
-                LIMIT 1
             """), {"ticker": ticker})
             row = result.fetchone()
             return row[0] if row else None
-    except SQLAlchemyError as e:
+    except (SQLAlchemyError, psycopg2.Error) as e:
         logger.error(f"获取 {ticker} 最新日期失败: {e}")
         return None
 
@@ -160,54 +202,125 @@ def should_skip_save(api_data, ticker, engine):
     api_latest = max(candlestick.timestamp for candlestick in api_data)
     api_latest_ny = api_latest.astimezone(ny_tz).replace(hour=0, minute=0, second=0, microsecond=0)
     
-    db_latest = get_latest_timestamp(ticker, engine)
+    # 优先使用内存中的 freshness index，未加载时才查询数据库
+    if freshness_index.loaded:
+        db_latest = freshness_index.get(ticker)
+    else:
+        db_latest = get_latest_timestamp(ticker, engine)
     if db_latest is None:
         return False
     
     db_latest_ny = db_latest.astimezone(ny_tz).replace(hour=0, minute=0, second=0, microsecond=0)
     return api_latest_ny.date() == db_latest_ny.date()
 
+# 将单根 K 线转换为 stock_daily 的一行
+def candle_to_row(ticker, candlestick):
+    return (
+        ticker,
+        candlestick.timestamp.astimezone(ny_tz).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None),
+        float(candlestick.open),
+        float(candlestick.high),
+        float(candlestick.low),
+        float(candlestick.close),
+        candlestick.volume,
+        float(candlestick.turnover)
+    )
+
+# 批量保存多个 ticker 的数据到 stock_daily 表（COPY 到临时表后一次性合并）
+def bulk_save_to_table(candles_by_ticker, engine, batch_size=50000, overwrite=False):
+    """
+    将多个 ticker 的 K 线通过 COPY 批量写入 stock_daily
+
+    每 batch_size 行执行一次 COPY 到临时表 stock_daily_staging，再用一条
+    INSERT ... SELECT ... ON CONFLICT 合并到 stock_daily，同一条语句把实际写入的行汇总到
+    ticker_registry，整个调用在一个事务内完成。
+
+    Args:
+        candles_by_ticker: {ticker: [candlestick, ...]}
+        engine: SQLAlchemy 引擎
+        batch_size: 每次 COPY 的行数
+        overwrite: 为 True 时覆盖已存在的 (ticker, timestamp) 行，否则保留原数据
+
+    Returns:
+        新写入（或覆盖）的行数
+    """
+    rows = [
+        candle_to_row(ticker, candlestick)
+        for ticker, data in candles_by_ticker.items()
+        for candlestick in (data or [])
+    ]
+    if not rows:
+        return 0
+
+    conflict_clause = "DO NOTHING"
+    if overwrite:
+        conflict_clause = """DO UPDATE SET open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low,
+                close = EXCLUDED.close, volume = EXCLUDED.volume, turnover = EXCLUDED.turnover"""
+
+    total_inserted = 0
+    ensure_current_partitions()
+    ensure_ticker_registry()
+    raw_conn = engine.raw_connection()
+    try:
+        cursor = raw_conn.cursor()
+        cursor.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS stock_daily_staging (
+                ticker TEXT,
+                timestamp TIMESTAMP,
+                open DOUBLE PRECISION,
+                high DOUBLE PRECISION,
+                low DOUBLE PRECISION,
+                close DOUBLE PRECISION,
+                volume BIGINT,
+                turnover DOUBLE PRECISION
+            ) ON COMMIT DELETE ROWS
+        """)
+        for i in range(0, len(rows), batch_size):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows[i:i + batch_size])
+            buffer.seek(0)
+            cursor.copy_expert("""
+                COPY stock_daily_staging (ticker, timestamp, open, high, low, close, volume, turnover)
+                FROM STDIN WITH (FORMAT csv)
+            """, buffer)
+            # DISTINCT ON 去掉同一批次内重复的 (ticker, timestamp)；xmax = 0 表示新插入而不是覆盖
+            cursor.execute(f"""
+                WITH written AS (
+                    INSERT INTO stock_daily (ticker, timestamp, open, high, low, close, volume, turnover)
+                    SELECT DISTINCT ON (ticker, timestamp) ticker, timestamp, open, high, low, close, volume, turnover
+                    FROM stock_daily_staging
+                    ORDER BY ticker, timestamp
+                    ON CONFLICT (ticker, timestamp) {conflict_clause}
+                    RETURNING ticker, timestamp, close, (xmax = 0) AS is_new
+                ), registry AS (
+                    {registry_upsert_sql("written")}
+                    RETURNING 1
+                )
+                SELECT COUNT(*) FROM written
+            """)
+            total_inserted += cursor.fetchone()[0]
+            cursor.execute("TRUNCATE stock_daily_staging")
+        raw_conn.commit()
+        cursor.close()
+
+        latest_by_ticker = {}
+        for row in rows:
+            if row[0] not in latest_by_ticker or row[1] > latest_by_ticker[row[0]]:
+                latest_by_ticker[row[0]] = row[1]
+        freshness_index.update_many(latest_by_ticker)
+        logger.info(f"Bulk inserted {total_inserted}/{len(rows)} records for {len(candles_by_ticker)} tickers")
+        return total_inserted
+    except Exception as e:
+        raw_conn.rollback()
+        logger.error(f"批量保存数据失败 ({len(candles_by_ticker)} tickers): {e}")
+        raise DatabaseConnectionError(f"批量保存数据失败: {e}")
+    finally:
+        raw_conn.close()
+
 # 保存数据到 stock_daily 表 
-def save_to_table(data, ticker, engine, batch_size=1000):
+def save_to_table(data, ticker, engine, batch_size=50000):
     """将数据保存到 stock_daily，按 ticker 和 timestamp 处理"""
     if should_skip_save(data, ticker, engine):
         logger.info(f"跳过保存 {ticker}，数据已是最新")
         return
-    
-    # logger.debug(f"开始保存数据到 stock_daily (ticker: {ticker})")s
-    try:
-        values = [
-            (
-                ticker,
-                candlestick.timestamp.astimezone(ny_tz).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None),
-                float(candlestick.open),
-                float(candlestick.high),
-                float(candlestick.low),
-                float(candlestick.close),
-                candlestick.volume,
-                float(candlestick.turnover)
-            )
-            for candlestick in data
-        ]
-
-        total_inserted = 0
-        with engine.connect() as conn:
-            for i in range(0, len(values), batch_size):
-                batch = values[i:i + batch_size]
-                conn.execute(
-                    text("""
-                        INSERT INTO stock_daily 
-                        (ticker, timestamp, open, high, low, close, volume, turnover)
-                        VALUES (:ticker, :timestamp, :open, :high, :low, :close, :volume, :turnover)
-                        ON CONFLICT (ticker, timestamp) DO NOTHING
-                    """),
-                    [{"ticker": row[0], "timestamp": row[1], "open": row[2], "high": row[3], 
-                      "low": row[4], "close": row[5], "volume": row[6], "turnover": row[7]} 
-                     for row in batch]
-                )
-                conn.commit()
-                total_inserted += len(batch)
-                logger.info(f"Inserted/Updated {len(batch)} records for {ticker} (total: {total_inserted})")
-    except SQLAlchemyError as e:
-        logger.error(f"保存数据失败 (ticker: {ticker}): {e}")
-        raise DatabaseConnectionError(f"保存数据失败: {e}")
\ No newline at end of file
+    bulk_save_to_table({ticker: data}, engine, batch_size)
@@ -0,0 +1,68 @@
+import threading
+import psycopg2
+from sqlalchemy.exc import SQLAlchemyError
+from src.database.ticker_registry import fetch_last_timestamps
+from src.utils.logger import setup_logger
+
+logger = setup_logger("freshness_index")
+
+class FreshnessIndex:
+    """
+    ticker -> stock_daily 中最新一根 K 线时间戳的内存索引。
+
+    批量更新开始时从 ticker_registry 加载，之后每次写库后就地更新，结束时清空；
+    save_to_table 和 BatchDataFetcher 在本轮更新内都从这里判断数据是否最新，不再逐个 ticker 查询。
+    """
+    def __init__(self):
+        self._latest = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        """索引是否已从数据库完整加载（加载后未命中即表示该 ticker 没有数据）"""
+        return self._loaded
+
+    def load(self, engine) -> dict:
+        """
+        从 ticker_registry 加载所有 ticker 的最新时间戳。
+
+        :param engine: SQLAlchemy 引擎
+        :return: {ticker: latest_timestamp} 的快照
+        """
+        try:
+            latest = fetch_last_timestamps(engine)
+        except (SQLAlchemyError, psycopg2.Error) as e:
+            logger.error(f"加载 freshness index 失败: {e}")
+            return {}
+        with self._lock:
+            self._latest = latest
+            self._loaded = True
+        logger.info(f"Freshness index loaded for {len(latest)} tickers")
+        return dict(latest)
+
+    def get(self, ticker):
+        """返回 ticker 的最新时间戳，没有数据时返回 None"""
+        with self._lock:
+            return self._latest.get(ticker)
+
+    def update(self, ticker, timestamp) -> None:
+        """写库后更新 ticker 的最新时间戳（只会前移）"""
+        with self._lock:
+            current = self._latest.get(ticker)
+            if current is None or timestamp > current:
+                self._latest[ticker] = timestamp
+
+    def update_many(self, latest_by_ticker: dict) -> None:
+        """批量更新多个 ticker 的最新时间戳"""
+        for ticker, timestamp in latest_by_ticker.items():
+            self.update(ticker, timestamp)
+
+    def invalidate(self) -> None:
+        """清空索引，之后的查询回退到数据库"""
+        with self._lock:
+            self._latest = {}
+            self._loaded = False
+
+# 全局 freshness index 实例
+freshness_index = FreshnessIndex()
@@ -0,0 +1,196 @@
+import threading
+import pandas as pd
+import psycopg2
+from psycopg2.extras import execute_values, Json
+from src.config.db_config import DB_CONFIG
+from src.data_visualization.indicators import RunningIndicator, default_running_indicators
+from src.utils.logger import setup_logger
+
+logger = setup_logger("indicator_state")
+
+# indicator_state 每个 (ticker, 指标) 一行，保存按 stock_daily 存储口径（不做读时复权）计算到
+# last_timestamp 为止的增量指标状态。写入新 K 线或回填历史时初始化 / 推进，
+# 图表读取最近一段 K 线时用它把窗口内的 OBV / EMA / RSI / MACD 接到完整历史上。
+
+_ready = False
+_ready_lock = threading.Lock()
+
+# 数据库连接函数
+def get_db_connection():
+    return psycopg2.connect(**DB_CONFIG)
+
+# 创建增量指标状态表（每个进程只执行一次，使用独立连接并立即提交）
+def ensure_indicator_state_table():
+    global _ready
+    if _ready:
+        return
+    with _ready_lock:
+        if _ready:
+            return
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS indicator_state (
+                    ticker TEXT NOT NULL,
+                    indicator TEXT NOT NULL,
+                    state JSONB NOT NULL,
+                    last_timestamp TIMESTAMP,
+                    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                    PRIMARY KEY (ticker, indicator)
+                );
+            """)
+            conn.commit()
+            _ready = True
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+# 读取多个 ticker 的指标状态
+def load_indicator_states(tickers, cursor=None):
+    """
+    Returns:
+        {ticker: [RunningIndicator, ...]}，没有状态的 ticker 不在结果中
+    """
+    ensure_indicator_state_table()
+    own_conn = cursor is None
+    if own_conn:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT ticker, state FROM indicator_state WHERE ticker = ANY(%s)", (list(tickers),))
+        states = {}
+        for ticker, state in cursor.fetchall():
+            states.setdefault(ticker, []).append(RunningIndicator.from_dict(state))
+        if own_conn:
+            conn.commit()
+        return states
+    finally:
+        if own_conn:
+            cursor.close()
+            conn.close()
+
+# 批量保存指标状态
+def save_indicator_states(states_by_ticker, cursor=None, overwrite=True):
+    """
+    Args:
+        overwrite: 为 False 时保留已存在的状态（并发初始化同一 ticker 时不覆盖已推进过的状态）
+    """
+    rows = [
+        (ticker, indicator.name, Json(indicator.to_dict()),
+         indicator.last_timestamp.to_pydatetime() if indicator.last_timestamp is not None else None)
+        for ticker, indicators in states_by_ticker.items()
+        for indicator in indicators
+    ]
+    if not rows:
+        return 0
+    ensure_indicator_state_table()
+    conflict_clause = """DO UPDATE SET
+                state = EXCLUDED.state,
+                last_timestamp = EXCLUDED.last_timestamp,
+                updated_at = NOW()""" if overwrite else "DO NOTHING"
+    own_conn = cursor is None
+    if own_conn:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+    try:
+        execute_values(cursor, f"""
+            INSERT INTO indicator_state (ticker, indicator, state, last_timestamp)
+            VALUES %s
+            ON CONFLICT (ticker, indicator) {conflict_clause}
+        """, rows)
+        if own_conn:
+            conn.commit()
+        return len(rows)
+    finally:
+        if own_conn:
+            cursor.close()
+            conn.close()
+
+# 用 stock_daily 中的完整历史初始化指标状态（只在 ticker 第一次需要或历史被改写时扫描全量数据）
+def seed_indicator_states(tickers, cursor=None, overwrite=False):
+    """
+    Args:
+        overwrite: 为 True 时替换已有状态（如回填了更早的历史）；默认只初始化还没有状态的 ticker
+
+    Returns:
+        {ticker: [RunningIndicator, ...]}，stock_daily 中没有数据的 ticker 不在结果中
+    """
+    tickers = list(tickers)
+    if not tickers:
+        return {}
+    own_conn = cursor is None
+    if own_conn:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT ticker, timestamp, close, volume FROM stock_daily
+            WHERE ticker = ANY(%s)
+            ORDER BY ticker, timestamp
+        """, (tickers,))
+        bars = pd.DataFrame(cursor.fetchall(), columns=["Ticker", "Date", "Close", "Volume"])
+        if bars.empty:
+            return {}
+        bars["Date"] = pd.to_datetime(bars["Date"])
+        bars[["Close", "Volume"]] = bars[["Close", "Volume"]].astype(float)
+        states = {ticker: default_running_indicators(df) for ticker, df in bars.groupby("Ticker", sort=False)}
+        save_indicator_states(states, cursor, overwrite)
+        if own_conn:
+            conn.commit()
+        return states
+    finally:
+        if own_conn:
+            cursor.close()
+            conn.close()
+
+# 读取一个 ticker 的指标状态，还没有时用完整历史初始化
+def fetch_indicator_states(ticker):
+    """
+    Returns:
+        [RunningIndicator, ...]，stock_daily 中没有该 ticker 时为空列表
+    """
+    states = load_indicator_states([ticker]).get(ticker)
+    if states is None:
+        states = seed_indicator_states([ticker]).get(ticker, [])
+    return states
+
+# 新 K 线写入 stock_daily 后推进指标状态，已有状态的 ticker 每根 K 线 O(1)
+def advance_indicator_states(bars_by_ticker):
+    """
+    Args:
+        bars_by_ticker: {ticker: [(timestamp, close, volume), ...]}，时间戳与 stock_daily 一致，且已经写入 stock_daily
+
+    Returns:
+        推进或初始化了状态的 ticker 数；还没有状态的 ticker 用已写入的完整历史初始化
+    """
+    if not bars_by_ticker:
+        return 0
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        states = load_indicator_states(bars_by_ticker.keys(), cursor)
+        for ticker, indicators in states.items():
+            for timestamp, close, volume in sorted(bars_by_ticker[ticker]):
+                for indicator in indicators:
+                    indicator.update(timestamp, close, volume)
+        save_indicator_states(states, cursor)
+        seeded = seed_indicator_states([ticker for ticker in bars_by_ticker if ticker not in states], cursor)
+        conn.commit()
+        return len(states) + len(seeded)
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"推进指标状态失败: {e}")
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+# 历史数据被改写（如拆股调整）后删除对应 ticker 的状态，下次使用时重新初始化
+def invalidate_indicator_states(cursor, tickers):
+    ensure_indicator_state_table()
+    cursor.execute("DELETE FROM indicator_state WHERE ticker = ANY(%s)", (list(tickers),))
+    return cursor.rowcount
@@ -0,0 +1,237 @@
+import threading
+import numpy as np
+import pandas as pd
+import psycopg2
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from longport.openapi import AdjustType
+from src.config.db_config import DB_CONFIG
+from src.config.fetch_config import FETCH_CONFIG
+from src.utils.logger import setup_logger
+
+logger = setup_logger("price_adjustment")
+
+# 读取时支持的复权方式
+ADJUST_MODES = ("raw", "forward", "backward")
+
+_factors_ready = False
+_factors_lock = threading.Lock()
+
+# stock_daily 实际的存储口径（每个进程只读取一次）
+_storage_mode = None
+_storage_mode_lock = threading.Lock()
+
+# 数据库连接函数
+def get_db_connection():
+    return psycopg2.connect(**DB_CONFIG)
+
+# 读取（必要时记录）stock_daily 的存储口径：forward（LongPort 前复权）或 raw（不复权）
+def stock_daily_storage_mode():
+    """
+    存储口径记录在 stock_daily_storage 表中，以它为准决定写入和读取方式，而不是直接看 adjust_on_read：
+    已有前复权数据的 stock_daily 上打开 adjust_on_read 会让新旧 K 线口径混在一起，读时复权再把旧数据调整一遍。
+
+    第一次检查时还没有记录：stock_daily 为空则按 adjust_on_read 记录，否则记为 forward（之前唯一的存储方式）。
+    记录与 adjust_on_read 不一致时按记录执行并记录警告，切换方式见 FETCH_CONFIG["adjust_on_read"] 的说明。
+    """
+    global _storage_mode
+    if _storage_mode is not None:
+        return _storage_mode
+    with _storage_mode_lock:
+        if _storage_mode is not None:
+            return _storage_mode
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS stock_daily_storage (
+                    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                    mode TEXT NOT NULL CHECK (mode IN ('forward', 'raw')),
+                    recorded_at TIMESTAMP NOT NULL DEFAULT NOW()
+                );
+            """)
+            cursor.execute("SELECT mode FROM stock_daily_storage")
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute("SELECT to_regclass('stock_daily') IS NULL OR NOT EXISTS (SELECT 1 FROM stock_daily)")
+                empty = cursor.fetchone()[0]
+                mode = "raw" if empty and FETCH_CONFIG["adjust_on_read"] else "forward"
+                cursor.execute("INSERT INTO stock_daily_storage (mode) VALUES (%s) ON CONFLICT (id) DO NOTHING", (mode,))
+                cursor.execute("SELECT mode FROM stock_daily_storage")
+                row = cursor.fetchone()
+                logger.info(f"记录 stock_daily 存储口径: {row[0]}")
+            conn.commit()
+        except psycopg2.Error as e:
+            conn.rollback()
+            # 数据库不可用时按之前的前复权存储处理，下次调用重新读取
+            logger.error(f"读取 stock_daily 存储口径失败，按前复权存储处理: {e}")
+            return "forward"
+        finally:
+            cursor.close()
+            conn.close()
+        _storage_mode = row[0]
+        if (_storage_mode == "raw") != FETCH_CONFIG["adjust_on_read"]:
+            logger.warning(
+                f"STOCKLI_ADJUST_ON_READ 与 stock_daily 的存储口径（{_storage_mode}）不一致，按存储口径执行；"
+                "切换需要清空 stock_daily 后重新拉取，见 FETCH_CONFIG['adjust_on_read']"
+            )
+        return _storage_mode
+
+# stock_daily 是否只存不复权的原始 K 线（读取时按 split_factors 复权）
+def adjust_on_read():
+    return stock_daily_storage_mode() == "raw"
+
+# 写入 stock_daily 时向 LongPort 请求的复权类型
+def storage_adjust_type():
+    """读时复权模式下 stock_daily 只存不复权的原始 K 线"""
+    return AdjustType.NoAdjust if adjust_on_read() else AdjustType.ForwardAdjust
+
+# 界面默认的读取复权方式
+def default_read_adjust():
+    return "forward" if adjust_on_read() else "raw"
+
+# 界面可选的读取复权方式 [(名称, adjust)]
+def read_adjust_options():
+    """stock_daily 存的已是 LongPort 前复权 K 线时，再做读时复权会重复调整，只提供按存储读取一项"""
+    if adjust_on_read():
+        return [("Raw", "raw"), ("Forward Adjust", "forward"), ("Backward Adjust", "backward")]
+    return [("Forward Adjust (LongPort)", "raw")]
+
+# 创建累计拆股因子表
+def ensure_split_factor_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS split_factors (
+            ticker TEXT NOT NULL,
+            execution_date DATE NOT NULL,
+            ratio FLOAT NOT NULL,
+            forward_factor FLOAT NOT NULL,
+            PRIMARY KEY (ticker, execution_date)
+        );
+    """)
+
+# 重新计算 tickers（None 表示全部）的累计拆股因子
+def _build_split_factors(tickers):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        ensure_split_factor_table(cursor)
+        tickers = list(tickers) if tickers is not None else None
+        cursor.execute("DELETE FROM split_factors WHERE %(tickers)s::text[] IS NULL OR ticker = ANY(%(tickers)s)", {"tickers": tickers})
+        cursor.execute("""
+            INSERT INTO split_factors (ticker, execution_date, ratio, forward_factor)
+            SELECT ticker, execution_date, ratio,
+                   EXP(SUM(LN(ratio)) OVER (PARTITION BY ticker ORDER BY execution_date DESC
+                                            ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW))
+            FROM (
+                SELECT ticker, execution_date, EXP(SUM(LN(split_to / split_from))) AS ratio
+                FROM stock_splits
+                WHERE split_from > 0 AND split_to > 0
+                  AND (%(tickers)s::text[] IS NULL OR ticker = ANY(%(tickers)s))
+                GROUP BY ticker, execution_date
+            ) s;
+        """, {"tickers": tickers})
+        inserted = cursor.rowcount
+        conn.commit()
+        logger.info(f"Refreshed {inserted} split factors")
+        return inserted
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"刷新拆股因子失败: {e}")
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+# split_factors 不存在或为空时由 stock_splits 全量构建一次（每个进程只检查一次）
+def ensure_split_factors():
+    """增量刷新只覆盖当次拆股的 ticker，更早的拆股需要这次全量构建，否则读时复权会静默返回未复权价格"""
+    global _factors_ready
+    if _factors_ready:
+        return
+    with _factors_lock:
+        if _factors_ready:
+            return
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT to_regclass('split_factors') IS NOT NULL")
+            empty = True
+            if cursor.fetchone()[0]:
+                cursor.execute("SELECT NOT EXISTS (SELECT 1 FROM split_factors)")
+                empty = cursor.fetchone()[0]
+        finally:
+            cursor.close()
+            conn.close()
+        if empty:
+            logger.info("split_factors 为空，从 stock_splits 全量构建")
+            _build_split_factors(None)
+        _factors_ready = True
+
+# 由 stock_splits 重新计算累计拆股因子
+def refresh_split_factors(tickers=None):
+    """
+    重新计算 split_factors，复杂度只与拆股记录数有关
+
+    ratio 为同一天所有拆股 split_to / split_from 的乘积；
+    forward_factor 为该次及之后所有拆股 ratio 的乘积，execution_date 之前的 K 线价格除以它即为前复权价格。
+
+    Args:
+        tickers: 只刷新这些 ticker，None 表示全部刷新；表还没有构建过时先全量构建
+
+    Returns:
+        写入的因子行数
+    """
+    global _factors_ready
+    if tickers is not None:
+        ensure_split_factors()
+        return _build_split_factors(tickers)
+    inserted = _build_split_factors(None)
+    _factors_ready = True
+    return inserted
+
+# 读取指定 ticker 的累计拆股因子
+def fetch_split_factors(ticker, engine):
+    """返回按 execution_date 升序排列的 DataFrame(execution_date, ratio, forward_factor)"""
+    try:
+        ensure_split_factors()
+        return pd.read_sql_query(
+            text("""
+                SELECT execution_date, ratio, forward_factor
+                FROM split_factors
+                WHERE ticker = :ticker
+                ORDER BY execution_date ASC
+            """),
+            engine,
+            params={"ticker": ticker}
+        )
+    except (SQLAlchemyError, psycopg2.Error) as e:
+        logger.warning(f"读取 {ticker} 的拆股因子失败，按不复权处理（可先运行 refresh_split_factors()）: {e}")
+        return pd.DataFrame(columns=["execution_date", "ratio", "forward_factor"])
+
+# 按复权方式调整 K 线
+def adjust_prices(df, factors, adjust="raw"):
+    """
+    对 fetch_data_from_db 返回的原始 K 线做复权
+
+    Args:
+        df: 包含 Date/Open/High/Low/Close/Volume 列的 DataFrame
+        factors: fetch_split_factors 的返回值
+        adjust: raw（不复权）、forward（前复权）或 backward（后复权）
+    """
+    if adjust not in ADJUST_MODES:
+        raise ValueError(f"未知的复权方式: {adjust}")
+    if adjust == "raw" or df.empty or factors.empty:
+        return df
+
+    execution_dates = pd.to_datetime(factors["execution_date"]).values
+    forward_factors = np.append(factors["forward_factor"].to_numpy(dtype=float), 1.0)
+    # 每根 K 线对应其之后第一次拆股的累计因子，没有后续拆股则为 1
+    factor = forward_factors[np.searchsorted(execution_dates, df["Date"].values, side="right")]
+    if adjust == "backward":
+        factor = factor / forward_factors[0]
+
+    df = df.copy()
+    for column in ("Open", "High", "Low", "Close"):
+        df[column] = df[column].to_numpy(dtype=float) / factor
+    df["Volume"] = np.round(df["Volume"].to_numpy(dtype=float) * factor).astype(np.int64)
+    return df
@@ -0,0 +1,444 @@
+import sys
+import os
+# 添加项目根目录到 sys.path，确保可以作为脚本运行
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import argparse
+import threading
+import time
+from datetime import date
+import psycopg2
+from src.config.db_config import DB_CONFIG, SCHEMA_CONFIG
+from src.database.ticker_registry import ensure_ticker_registry
+from src.utils.logger import setup_logger
+
+logger = setup_logger("schema")
+
+# stock_daily 分区布局：
+# - 按 timestamp 年度 RANGE 分区（stock_daily_y2024 ...）加一个 DEFAULT 分区兜底，
+#   按日期的横截面查询（MAX(timestamp)、timestamp >= delisted_utc）只扫描相关年份；
+# - 主键 (ticker, timestamp) 满足 ON CONFLICT 写入；
+# - (ticker, timestamp DESC) INCLUDE (open, high, low, close, volume) 覆盖索引让单只 ticker 的
+#   最近 N 根 K 线只走 index-only scan，分区按时间有序，LIMIT 查询从最新的分区开始读取即可停止。
+
+MIGRATION_NAME = "stock_daily_partitioned"
+NEW_TABLE = "stock_daily_partitioned"
+LEGACY_TABLE = "stock_daily_legacy"
+SYNC_TRIGGER = "stock_daily_partition_sync"
+
+_partitions_ready_year = None
+_partitions_lock = threading.Lock()
+
+# 数据库连接函数
+def get_db_connection():
+    return psycopg2.connect(**DB_CONFIG)
+
+# stock_daily 是否已是分区表
+def is_partitioned(cursor, table="stock_daily"):
+    cursor.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            WHERE c.relname = %s AND pg_table_is_visible(c.oid)
+        )
+    """, (table,))
+    return cursor.fetchone()[0]
+
+# 年度分区名，分区名始终以 stock_daily 为前缀，迁移切换后无需重命名
+def partition_name(year):
+    return f"stock_daily_y{year}"
+
+# 创建分区父表、DEFAULT 分区和索引
+def create_partitioned_table(cursor, table="stock_daily"):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            id BIGSERIAL,
+            ticker TEXT NOT NULL,
+            timestamp TIMESTAMP NOT NULL,
+            open DOUBLE PRECISION,
+            high DOUBLE PRECISION,
+            low DOUBLE PRECISION,
+            close DOUBLE PRECISION,
+            volume BIGINT,
+            turnover DOUBLE PRECISION,
+            CONSTRAINT stock_daily_part_pkey PRIMARY KEY (ticker, timestamp)
+        ) PARTITION BY RANGE (timestamp);
+    """)
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS stock_daily_default PARTITION OF {table} DEFAULT;")
+    create_indexes(cursor, table)
+
+# 索引名以表名为前缀：索引名在整个 schema 内唯一，迁移期间新旧两张表各自需要一套索引
+def index_names(table):
+    """返回 (覆盖索引名, BRIN 索引名)"""
+    return f"{table}_ticker_ts_cover", f"{table}_ts_brin"
+
+# 覆盖索引：按 ticker 倒序读取最近 K 线；BRIN：按日期的横截面扫描
+def create_indexes(cursor, table="stock_daily", concurrently=False):
+    """
+    concurrently 为 True 时用 CREATE INDEX CONCURRENTLY 在线建索引（只适用于未分区的表，
+    且连接需要是 autocommit）
+    """
+    option = "CONCURRENTLY " if concurrently else ""
+    cover_index, brin_index = index_names(table)
+    cursor.execute(f"""
+        CREATE INDEX {option}IF NOT EXISTS {cover_index}
+        ON {table} (ticker, timestamp DESC) INCLUDE (open, high, low, close, volume);
+    """)
+    cursor.execute(f"""
+        CREATE INDEX {option}IF NOT EXISTS {brin_index}
+        ON {table} USING BRIN (timestamp);
+    """)
+
+# 表改名后把按表名命名的索引一起改名
+def rename_indexes(cursor, old_table, new_table):
+    for old_name, new_name in zip(index_names(old_table), index_names(new_table)):
+        cursor.execute(f"ALTER INDEX IF EXISTS {old_name} RENAME TO {new_name};")
+
+# 在现有的未分区 stock_daily 上在线建立同样的索引（迁移前也能先获得查询加速）
+def create_indexes_online():
+    conn = get_db_connection()
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        create_indexes(cursor, "stock_daily", concurrently=not is_partitioned(cursor))
+    finally:
+        cursor.close()
+        conn.close()
+
+# 创建 [start_year, end_year] 的年度分区（已存在的跳过）
+def ensure_year_partitions(cursor, start_year, end_year, table="stock_daily"):
+    """
+    DEFAULT 分区中如果已有某年的数据，新建该年分区前先把这些行移出再移回，
+    否则 PostgreSQL 会拒绝创建与 DEFAULT 分区数据重叠的分区。
+
+    Returns:
+        新建的分区数
+    """
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s
+    """, (table,))
+    existing = {row[0] for row in cursor.fetchall()}
+    created = 0
+    for year in range(start_year, end_year + 1):
+        name = partition_name(year)
+        if name in existing:
+            continue
+        start, end = date(year, 1, 1), date(year + 1, 1, 1)
+        cursor.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS stock_daily_default_moved (LIKE stock_daily_default) ON COMMIT DROP;
+            WITH moved AS (
+                DELETE FROM stock_daily_default WHERE timestamp >= %s AND timestamp < %s RETURNING *
+            )
+            INSERT INTO stock_daily_default_moved SELECT * FROM moved;
+        """, (start, end))
+        moved = cursor.rowcount
+        cursor.execute(f"""
+            CREATE TABLE {name} PARTITION OF {table}
+            FOR VALUES FROM (%s) TO (%s);
+        """, (start, end))
+        if moved:
+            cursor.execute(f"INSERT INTO {table} SELECT * FROM stock_daily_default_moved;")
+            cursor.execute("TRUNCATE stock_daily_default_moved;")
+            logger.info(f"从 DEFAULT 分区移入 {name}: {moved} 行")
+        created += 1
+    return created
+
+# 写入前确保当前年份和未来几年的分区存在（每个进程每年只检查一次）
+def ensure_current_partitions():
+    global _partitions_ready_year
+    year = date.today().year
+    if _partitions_ready_year == year:
+        return
+    with _partitions_lock:
+        if _partitions_ready_year == year:
+            return
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            if is_partitioned(cursor):
+                ensure_year_partitions(cursor, year, year + SCHEMA_CONFIG["future_years"])
+                conn.commit()
+            _partitions_ready_year = year
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+# 数据库中没有 stock_daily 时直接创建分区布局
+def create_schema():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT to_regclass('stock_daily') IS NOT NULL")
+        if cursor.fetchone()[0]:
+            if not is_partitioned(cursor):
+                logger.warning("stock_daily 已存在且未分区，请使用 migrate 在线迁移")
+            return False
+        create_partitioned_table(cursor)
+        year = date.today().year
+        ensure_year_partitions(cursor, SCHEMA_CONFIG["partition_start_year"], year + SCHEMA_CONFIG["future_years"])
+        conn.commit()
+        logger.info("已创建分区表 stock_daily")
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+# 迁移进度表：记录已复制到的最后一个 ticker，中断后可以继续
+def ensure_migration_progress(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migration_progress (
+            migration TEXT PRIMARY KEY,
+            last_ticker TEXT,
+            copied_rows BIGINT NOT NULL DEFAULT 0,
+            started_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            copied_at TIMESTAMP,
+            finished_at TIMESTAMP
+        );
+    """)
+
+# 迁移期间把旧表的写入和删除同步到新表
+def install_sync_trigger(cursor):
+    cursor.execute(f"""
+        CREATE OR REPLACE FUNCTION {SYNC_TRIGGER}() RETURNS trigger AS $$
+        BEGIN
+            -- 删除或修改了 (ticker, timestamp) 的更新：新表里去掉旧键对应的行
+            IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND (OLD.ticker, OLD.timestamp) IS DISTINCT FROM (NEW.ticker, NEW.timestamp)) THEN
+                DELETE FROM {NEW_TABLE} WHERE ticker = OLD.ticker AND timestamp = OLD.timestamp;
+            END IF;
+            IF TG_OP = 'DELETE' THEN
+                RETURN OLD;
+            END IF;
+            INSERT INTO {NEW_TABLE} (id, ticker, timestamp, open, high, low, close, volume, turnover)
+            VALUES (NEW.id, NEW.ticker, NEW.timestamp, NEW.open, NEW.high, NEW.low, NEW.close, NEW.volume, NEW.turnover)
+            ON CONFLICT (ticker, timestamp) DO UPDATE SET
+                open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low,
+                close = EXCLUDED.close, volume = EXCLUDED.volume, turnover = EXCLUDED.turnover;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    cursor.execute(f"DROP TRIGGER IF EXISTS {SYNC_TRIGGER} ON stock_daily;")
+    cursor.execute(f"""
+        CREATE TRIGGER {SYNC_TRIGGER}
+        AFTER INSERT OR UPDATE OR DELETE ON stock_daily
+        FOR EACH ROW EXECUTE FUNCTION {SYNC_TRIGGER}();
+    """)
+
+def drop_sync_trigger(cursor, table="stock_daily"):
+    cursor.execute(f"DROP TRIGGER IF EXISTS {SYNC_TRIGGER} ON {table};")
+    cursor.execute(f"DROP FUNCTION IF EXISTS {SYNC_TRIGGER}();")
+
+# 迁移状态
+def migration_status():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        ensure_migration_progress(cursor)
+        cursor.execute("""
+            SELECT last_ticker, copied_rows, started_at, updated_at, copied_at, finished_at
+            FROM schema_migration_progress WHERE migration = %s
+        """, (MIGRATION_NAME,))
+        row = cursor.fetchone()
+        conn.commit()
+        return {
+            "partitioned": is_partitioned(cursor),
+            "progress": dict(zip(("last_ticker", "copied_rows", "started_at", "updated_at", "copied_at", "finished_at"), row)) if row else None,
+        }
+    finally:
+        cursor.close()
+        conn.close()
+
+# 在线迁移：复制到分区新表，期间旧表照常读写
+def migrate_to_partitioned(batch_tickers=None, pause=0.0, progress_callback=None):
+    """
+    1. 创建新分区表 stock_daily_partitioned，分区覆盖 ticker_registry 中的日期范围；
+    2. 在旧表上安装触发器，迁移期间的新写入同时写入新表；
+    3. 按 ticker 分批复制，每批一个短事务并记录进度，中断后从上次的 ticker 继续；
+    4. 全部复制完成后由 swap_partitioned_table 切换表名。
+
+    Args:
+        batch_tickers: 每个事务复制的 ticker 数
+        pause: 每批之间休眠的秒数，降低对线上读写的影响
+        progress_callback: progress_callback(done, total, message)
+
+    Returns:
+        本次复制的行数
+    """
+    batch_tickers = batch_tickers or SCHEMA_CONFIG["migration_batch_tickers"]
+    ensure_ticker_registry()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        if is_partitioned(cursor):
+            logger.info("stock_daily 已是分区表，无需迁移")
+            return 0
+        ensure_migration_progress(cursor)
+        cursor.execute("SELECT MIN(first_timestamp), MAX(last_timestamp) FROM ticker_registry")
+        first, last = cursor.fetchone()
+        start_year = first.year if first else SCHEMA_CONFIG["partition_start_year"]
+        end_year = max(last.year if last else start_year, date.today().year) + SCHEMA_CONFIG["future_years"]
+        create_partitioned_table(cursor, NEW_TABLE)
+        ensure_year_partitions(cursor, start_year, end_year, NEW_TABLE)
+        install_sync_trigger(cursor)
+        cursor.execute("""
+            INSERT INTO schema_migration_progress (migration) VALUES (%s)
+            ON CONFLICT (migration) DO NOTHING
+        """, (MIGRATION_NAME,))
+        conn.commit()
+
+        cursor.execute("SELECT last_ticker FROM schema_migration_progress WHERE migration = %s", (MIGRATION_NAME,))
+        last_ticker = cursor.fetchone()[0]
+        cursor.execute("""
+            SELECT ticker FROM ticker_registry
+            WHERE %s::text IS NULL OR ticker > %s
+            ORDER BY ticker
+        """, (last_ticker, last_ticker))
+        tickers = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+
+        copied = 0
+        for i in range(0, len(tickers), batch_tickers):
+            batch = tickers[i:i + batch_tickers]
+            # 触发器已同步的行以新表为准
+            cursor.execute(f"""
+                INSERT INTO {NEW_TABLE} (id, ticker, timestamp, open, high, low, close, volume, turnover)
+                SELECT id, ticker, timestamp, open, high, low, close, volume, turnover
+                FROM stock_daily
+                WHERE ticker = ANY(%s)
+                ON CONFLICT (ticker, timestamp) DO NOTHING
+            """, (batch,))
+            batch_rows = cursor.rowcount
+            copied += batch_rows
+            cursor.execute("""
+                UPDATE schema_migration_progress
+                SET last_ticker = %s, copied_rows = copied_rows + %s, updated_at = NOW()
+                WHERE migration = %s
+            """, (batch[-1], batch_rows, MIGRATION_NAME))
+            conn.commit()
+            message = f"已复制 {min(i + batch_tickers, len(tickers))}/{len(tickers)} 个 ticker，{copied} 行"
+            logger.info(message)
+            if progress_callback:
+                progress_callback(min(i + batch_tickers, len(tickers)), len(tickers), message)
+            if pause:
+                time.sleep(pause)
+        # 全部 ticker 已复制，之后的写入由触发器同步，可以切换
+        cursor.execute("""
+            UPDATE schema_migration_progress SET copied_at = NOW(), updated_at = NOW() WHERE migration = %s
+        """, (MIGRATION_NAME,))
+        conn.commit()
+        return copied
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+# 切换：短暂锁住旧表，校验行数后交换表名
+def swap_partitioned_table(verify=True):
+    """
+    Returns:
+        True 表示已切换，旧表保留为 stock_daily_legacy，确认无误后可用 drop_legacy_table 删除
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        if is_partitioned(cursor):
+            logger.info("stock_daily 已是分区表")
+            return False
+        ensure_migration_progress(cursor)
+        cursor.execute("SELECT copied_at IS NOT NULL FROM schema_migration_progress WHERE migration = %s",
+                       (MIGRATION_NAME,))
+        row = cursor.fetchone()
+        if not row or not row[0]:
+            raise RuntimeError("尚未完成数据复制，请先运行 migrate")
+        # 阻止写入但允许读取，校验期间两张表保持一致
+        cursor.execute("LOCK TABLE stock_daily IN SHARE ROW EXCLUSIVE MODE")
+        if verify:
+            cursor.execute("SELECT COUNT(*) FROM stock_daily")
+            old_count = cursor.fetchone()[0]
+            cursor.execute(f"SELECT COUNT(*) FROM {NEW_TABLE}")
+            new_count = cursor.fetchone()[0]
+            if old_count != new_count:
+                raise RuntimeError(f"行数不一致: stock_daily={old_count}, {NEW_TABLE}={new_count}")
+        cursor.execute("LOCK TABLE stock_daily IN ACCESS EXCLUSIVE MODE")
+        drop_sync_trigger(cursor)
+        cursor.execute(f"ALTER TABLE stock_daily RENAME TO {LEGACY_TABLE}")
+        cursor.execute(f"ALTER TABLE {NEW_TABLE} RENAME TO stock_daily")
+        # 先让出旧表占用的 stock_daily_* 索引名，再把新表的索引改为 stock_daily_*
+        rename_indexes(cursor, "stock_daily", LEGACY_TABLE)
+        rename_indexes(cursor, NEW_TABLE, "stock_daily")
+        # 新表的 id 序列从旧表的最大 id 之后继续
+        cursor.execute(f"""
+            SELECT setval(pg_get_serial_sequence('stock_daily', 'id'),
+                          GREATEST((SELECT COALESCE(MAX(id), 0) FROM {LEGACY_TABLE}),
+                                   (SELECT COALESCE(MAX(id), 0) FROM stock_daily)) + 1, false)
+        """)
+        cursor.execute("""
+            UPDATE schema_migration_progress SET finished_at = NOW(), updated_at = NOW() WHERE migration = %s
+        """, (MIGRATION_NAME,))
+        conn.commit()
+        logger.info(f"已切换到分区表 stock_daily，旧表保留为 {LEGACY_TABLE}")
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+def drop_legacy_table():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"DROP TABLE IF EXISTS {LEGACY_TABLE}")
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="stock_daily 分区布局管理")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("create", help="数据库中没有 stock_daily 时创建分区表")
+    subparsers.add_parser("ensure", help="创建当前和未来年份的分区")
+    subparsers.add_parser("index", help="在线建立覆盖索引和 BRIN 索引")
+    subparsers.add_parser("status", help="查看迁移状态")
+    migrate_parser = subparsers.add_parser("migrate", help="在线复制现有数据到分区表")
+    migrate_parser.add_argument("--batch-tickers", type=int, default=None)
+    migrate_parser.add_argument("--pause", type=float, default=0.0, help="每批之间休眠的秒数")
+    migrate_parser.add_argument("--swap", action="store_true", help="复制完成后切换表名")
+    swap_parser = subparsers.add_parser("swap", help="校验并切换到分区表")
+    swap_parser.add_argument("--no-verify", action="store_true")
+    subparsers.add_parser("drop-legacy", help="删除切换后保留的旧表")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        print("已创建" if create_schema() else "未创建（stock_daily 已存在）")
+    elif args.command == "ensure":
+        ensure_current_partitions()
+    elif args.command == "index":
+        create_indexes_online()
+    elif args.command == "status":
+        print(migration_status())
+    elif args.command == "migrate":
+        print(f"复制 {migrate_to_partitioned(args.batch_tickers, args.pause)} 行")
+        if args.swap:
+            swap_partitioned_table()
+    elif args.command == "swap":
+        swap_partitioned_table(verify=not args.no_verify)
+    elif args.command == "drop-legacy":
+        drop_legacy_table()
+
+if __name__ == "__main__":
+    main()
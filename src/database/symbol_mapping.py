@@ -0,0 +1,151 @@
+import threading
+import psycopg2
+from psycopg2.extras import execute_values
+from src.config.db_config import DB_CONFIG
+from src.config.fetch_config import FETCH_CONFIG
+from src.utils.logger import setup_logger
+
+logger = setup_logger("symbol_mapping")
+
+# 数据库连接函数
+def get_db_connection():
+    return psycopg2.connect(**DB_CONFIG)
+
+# 创建 polygon ticker -> LongPort 代码的映射表
+def ensure_symbol_mapping_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS symbol_mapping (
+            ticker TEXT PRIMARY KEY,
+            longport_symbol TEXT NOT NULL,
+            ticker_type TEXT,
+            primary_exchange TEXT,
+            validated_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+    """)
+
+
+class SymbolMapping:
+    """
+    polygon ticker -> LongPort 代码的持久化映射，带进程内缓存。
+
+    第一次查询时用一条 SELECT 加载整张 symbol_mapping 表，之后已知 ticker 的查询不再访问网络或数据库。
+    缓存同时记录计算映射时的 type 和 primary_exchange，两者任一变化时视为未命中，重新计算并覆盖。
+    新映射先攒在内存里批量写库；需要 LongPort 验证得到的映射（WARRANT）立即写库，避免重复验证；
+    验证因临时错误没有得到确定结果的映射只放在进程内缓存，不写库；
+    WARRANT 映射的 validated_at 超过 symbol_revalidate_days 天后重新验证。
+    """
+    def __init__(self, flush_size=500):
+        self.flush_size = flush_size
+        self._cache = {}
+        self._pending = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def load(self):
+        """从数据库加载全部映射"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            ensure_symbol_mapping_table(cursor)
+            conn.commit()
+            # 需要 LongPort 验证的 WARRANT 映射超过有效期后不加载，下次使用时重新验证并刷新 validated_at
+            cursor.execute("""
+                SELECT ticker, longport_symbol, ticker_type, primary_exchange FROM symbol_mapping
+                WHERE ticker_type IS DISTINCT FROM 'WARRANT'
+                   OR validated_at >= NOW() - make_interval(days => %s)
+            """, (FETCH_CONFIG["symbol_revalidate_days"],))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+        with self._lock:
+            for ticker, longport_symbol, ticker_type, primary_exchange in rows:
+                self._cache.setdefault(ticker, (longport_symbol, ticker_type, primary_exchange))
+            self._loaded = True
+        logger.info(f"Symbol mapping loaded for {len(rows)} tickers")
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        # 多个工作线程同时首次查询时只加载一次
+        with self._load_lock:
+            if self._loaded:
+                return
+            try:
+                self.load()
+            except psycopg2.Error as e:
+                # 数据库不可用时只用进程内缓存，不再重复尝试加载
+                logger.error(f"加载 symbol_mapping 失败: {e}")
+                self._loaded = True
+
+    def get(self, ticker, ticker_type, primary_exchange):
+        """
+        返回缓存的 LongPort 代码
+
+        :return: 未命中或 type / primary_exchange 已变化时返回 None
+        """
+        self._ensure_loaded()
+        with self._lock:
+            entry = self._cache.get(ticker)
+        if entry is None or entry[1:] != (ticker_type, primary_exchange):
+            return None
+        return entry[0]
+
+    def put(self, ticker, longport_symbol, ticker_type, primary_exchange, validated=False, persist=True):
+        """
+        记录一条映射
+
+        :param validated: 是否经过 LongPort 验证，True 时立即写库
+        :param persist: False 时只放进进程内缓存（如验证遇到临时错误时的回退结果），下次运行重新计算
+        """
+        with self._lock:
+            self._cache[ticker] = (longport_symbol, ticker_type, primary_exchange)
+            if not persist:
+                return
+            self._pending[ticker] = (ticker, longport_symbol, ticker_type, primary_exchange)
+            should_flush = validated or len(self._pending) >= self.flush_size
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        """把尚未写库的映射批量 upsert 到 symbol_mapping"""
+        with self._lock:
+            rows = list(self._pending.values())
+            self._pending = {}
+        if not rows:
+            return 0
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            try:
+                ensure_symbol_mapping_table(cursor)
+                execute_values(cursor, """
+                    INSERT INTO symbol_mapping (ticker, longport_symbol, ticker_type, primary_exchange)
+                    VALUES %s
+                    ON CONFLICT (ticker) DO UPDATE SET
+                        longport_symbol = EXCLUDED.longport_symbol,
+                        ticker_type = EXCLUDED.ticker_type,
+                        primary_exchange = EXCLUDED.primary_exchange,
+                        validated_at = NOW()
+                """, rows)
+                conn.commit()
+            finally:
+                cursor.close()
+                conn.close()
+        except psycopg2.Error as e:
+            logger.error(f"写入 symbol_mapping 失败: {e}")
+            return 0
+        return len(rows)
+
+    def invalidate(self, ticker=None):
+        """使缓存失效：ticker 为 None 时清空全部，下次查询重新加载"""
+        with self._lock:
+            if ticker is None:
+                self._cache = {}
+                self._loaded = False
+            else:
+                self._cache.pop(ticker, None)
+
+# 全局 symbol mapping 实例
+symbol_mapping = SymbolMapping()
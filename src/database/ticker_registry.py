@@ -0,0 +1,143 @@
+import threading
+import psycopg2
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from src.config.db_config import DB_CONFIG
+from src.utils.logger import setup_logger
+
+logger = setup_logger("ticker_registry")
+
+# ticker_registry 每个 ticker 一行，汇总 stock_daily 中该 ticker 的首末 K 线时间、K 线数和最新收盘价。
+# 所有写入 stock_daily 的路径在同一事务内维护这张表，读取 ticker 列表、数量和最新日期时
+# 不再对 stock_daily 做 DISTINCT / GROUP BY 全表扫描。
+
+_ready = False
+_ready_lock = threading.Lock()
+
+# 数据库连接函数
+def get_db_connection():
+    return psycopg2.connect(**DB_CONFIG)
+
+# 用 stock_daily 的全量统计重建 ticker_registry（建表时执行一次，之后只做增量维护）
+def rebuild_ticker_registry(cursor):
+    cursor.execute("""
+        INSERT INTO ticker_registry (ticker, first_timestamp, last_timestamp, bar_count, last_close)
+        SELECT ticker, MIN(timestamp), MAX(timestamp), COUNT(*),
+               (ARRAY_AGG(close ORDER BY timestamp DESC))[1]
+        FROM stock_daily
+        GROUP BY ticker
+        ON CONFLICT (ticker) DO UPDATE SET
+            first_timestamp = EXCLUDED.first_timestamp,
+            last_timestamp = EXCLUDED.last_timestamp,
+            bar_count = EXCLUDED.bar_count,
+            last_close = EXCLUDED.last_close,
+            updated_at = NOW()
+    """)
+    logger.info(f"ticker_registry 已从 stock_daily 重建: {cursor.rowcount} 个 ticker")
+    return cursor.rowcount
+
+# 创建 ticker_registry 表，首次创建时从 stock_daily 回填（使用独立连接并立即提交）
+def ensure_ticker_registry():
+    global _ready
+    if _ready:
+        return
+    with _ready_lock:
+        if _ready:
+            return
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT to_regclass('ticker_registry') IS NOT NULL")
+            if not cursor.fetchone()[0]:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS ticker_registry (
+                        ticker TEXT PRIMARY KEY,
+                        first_timestamp TIMESTAMP NOT NULL,
+                        last_timestamp TIMESTAMP NOT NULL,
+                        bar_count BIGINT NOT NULL,
+                        last_close DOUBLE PRECISION,
+                        updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+                    );
+                """)
+                rebuild_ticker_registry(cursor)
+            conn.commit()
+            _ready = True
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+# 写入 stock_daily 的 SQL 片段：把 RETURNING 的行汇总到 ticker_registry
+def registry_upsert_sql(written_cte):
+    """
+    Args:
+        written_cte: 数据修改 CTE 的名字，需返回 ticker, timestamp, close, is_new 四列，
+            is_new 表示该行是新插入（而不是覆盖已有行）
+    """
+    return f"""
+        INSERT INTO ticker_registry (ticker, first_timestamp, last_timestamp, bar_count, last_close)
+        SELECT ticker, MIN(timestamp), MAX(timestamp), COUNT(*) FILTER (WHERE is_new),
+               (ARRAY_AGG(close ORDER BY timestamp DESC))[1]
+        FROM {written_cte}
+        GROUP BY ticker
+        ON CONFLICT (ticker) DO UPDATE SET
+            first_timestamp = LEAST(ticker_registry.first_timestamp, EXCLUDED.first_timestamp),
+            last_timestamp = GREATEST(ticker_registry.last_timestamp, EXCLUDED.last_timestamp),
+            bar_count = ticker_registry.bar_count + EXCLUDED.bar_count,
+            last_close = CASE WHEN EXCLUDED.last_timestamp >= ticker_registry.last_timestamp
+                              THEN EXCLUDED.last_close ELSE ticker_registry.last_close END,
+            updated_at = NOW()
+    """
+
+# 历史价格被改写（拆股调整）后刷新最新收盘价
+def refresh_last_close(cursor, tickers):
+    ensure_ticker_registry()
+    cursor.execute("""
+        UPDATE ticker_registry r
+        SET last_close = sd.close, updated_at = NOW()
+        FROM stock_daily sd
+        WHERE r.ticker = ANY(%s)
+          AND sd.ticker = r.ticker
+          AND sd.timestamp = r.last_timestamp
+    """, (list(tickers),))
+    return cursor.rowcount
+
+# 所有有数据的 ticker
+def fetch_registered_tickers(engine):
+    try:
+        ensure_ticker_registry()
+        with engine.connect() as conn:
+            result = conn.execute(text("SELECT ticker FROM ticker_registry ORDER BY ticker"))
+            return [row[0] for row in result.fetchall()]
+    except (SQLAlchemyError, psycopg2.Error) as e:
+        logger.error(f"读取 ticker_registry 失败: {e}")
+        return []
+
+# 有数据的 ticker 数量
+def count_registered_tickers(engine):
+    ensure_ticker_registry()
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM ticker_registry")).scalar()
+
+# 每个 ticker 的最新 K 线时间戳
+def fetch_last_timestamps(engine, tickers=None):
+    """
+    Returns:
+        {ticker: last_timestamp}，tickers 为 None 时返回全部
+    """
+    ensure_ticker_registry()
+    query = "SELECT ticker, last_timestamp FROM ticker_registry"
+    params = {}
+    if tickers is not None:
+        query += " WHERE ticker = ANY(:tickers)"
+        params["tickers"] = list(tickers)
+    with engine.connect() as conn:
+        return {row[0]: row[1] for row in conn.execute(text(query), params).fetchall()}
+
+# 全部 ticker 中最新的 K 线时间戳
+def fetch_latest_timestamp(engine):
+    ensure_ticker_registry()
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT MAX(last_timestamp) FROM ticker_registry")).scalar()
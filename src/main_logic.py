@@ -4,15 +4,21 @@ from PySide6.QtWidgets import QMessageBox, QToolTip, QWidget, QLabel, QHBoxLayou
 import pandas as pd
 import os
 import sys
-from src.database.db_operations import fetch_table_names
+from src.database.db_operations import fetch_table_names, fetch_ticker_names
 from src.utils.time_teller import get_latest_date_from_longport
 from src.data_fetcher.batch_fetcher import BatchDataFetcher
-from src.data_fetcher.data_loader import DataLoader
-from src.data_fetcher.polygon_incremental_update import ipo_incremental_update, process_delisted, process_delisted_reverse, DelistedProcessThread, MsProcessThread
+from src.data_fetcher.prefetcher import FramePrefetcher
+from src.utils.frame_cache import frame_cache
+from src.utils.ticker_search import ticker_search
+from src.config.fetch_config import FETCH_CONFIG, SEARCH_CONFIG
+from src.data_fetcher.polygon_incremental_update import process_ms, process_delisted, process_delisted_reverse, ipo_reference_update, ipo_backfill
+from src.data_fetcher.pipeline import PipelineStage, RefreshPipelineThread
 from src.config.paths import STOCK_LIST_PATH
-from src.data_visualization.candlestick_plot import plot_candlestick, plot_volume, plot_obv
+from src.data_visualization.candlestick_plot import plot_candlestick, set_candlestick_hover, plot_volume, plot_indicator
+from src.data_visualization.indicators import state_anchors
 from src.database.db_connection import get_engine, check_connection, DatabaseConnectionError
 from src.config.db_config import DB_CONFIG
+from src.database.price_adjustment import default_read_adjust, read_adjust_options
 import yfinance as yf
 import psycopg2
 from src.utils.logger import setup_logger
@@ -28,11 +34,17 @@ def get_db_connection():
 class MainWindowLogic:
     def __init__(self, ui):
         self.ui = ui
-        self.data_cache = {}
+        self.frame_cache = frame_cache
         self.all_stock_symbols = []
+        self.ticker_search = ticker_search
         self.current_fetcher = None
         self.batch_fetcher = None
-        self.loader = None
+        self.pipeline_thread = None
+        self.selector_symbols = []
+        self.search_results = []
+        self.pending_load = None
+        # 当前图表的指标 anchor（见 indicators.state_anchors）
+        self.current_anchors = {}
         try:
             self.engine = get_engine()
             if not check_connection(self.engine):
@@ -41,7 +53,13 @@ class MainWindowLogic:
             QMessageBox.critical(self.ui, "错误", f"无法连接到数据库: {str(e)}")
             sys.exit(1)
             
+        self.prefetcher = FramePrefetcher(self.engine, self.frame_cache)
         self.connect_signals()
+        adjust_selector = self.ui.visualization_tab.adjust_selector
+        for label, adjust in read_adjust_options():
+            adjust_selector.addItem(label, adjust)
+        adjust_selector.setCurrentIndex(adjust_selector.findData(default_read_adjust()))
+        adjust_selector.setEnabled(adjust_selector.count() > 1)
         self.update_stock_selector()
         self.ui.data_fetch_tab.limit_time_label.setText(f"获取数据的截至日期为：{get_latest_date_from_longport().strftime('%Y-%m-%d')}")
         
@@ -49,29 +67,43 @@ class MainWindowLogic:
     # 连接信号和槽
     def connect_signals(self):
         self.ui.data_fetch_tab.batch_fetch_button.clicked.connect(self.batch_fetch_stocks)
+        self.ui.data_fetch_tab.cancel_button.clicked.connect(self.cancel_batch_fetch)
+        self.prefetcher.data_loaded.connect(self.on_data_loaded)
+        self.prefetcher.error_occurred.connect(self.show_error)
         self.ui.visualization_tab.subplot_selector.itemSelectionChanged.connect(self.on_subplot_selection_changed)
         self.ui.visualization_tab.search_button.clicked.connect(self.confirm_search)
         self.ui.visualization_tab.load_button.clicked.connect(self.load_stock_data)
         self.ui.visualization_tab.hover_toggle.stateChanged.connect(self.toggle_hover_display)
-        self.ui.visualization_tab.search_box.textChanged.connect(self.filter_stock_selector)
         
     
     # 关闭窗口时清理资源
     def cleanup(self):
         """清理线程和资源"""
         print("Cleaning up MainWindowLogic...")
+        # 请求取消刷新流水线，等待运行中的阶段在安全点退出（写库、台账事务和映射落盘不会被打断）
+        if self.pipeline_thread and self.pipeline_thread.isRunning():
+            print("Cancelling pipeline thread...")
+            # 正在关闭窗口，不再处理完成信号（不弹出完成对话框）
+            self.pipeline_thread.pipeline_finished.disconnect(self.on_pipeline_finished)
+            self.pipeline_thread.cancel()
+            if not self.pipeline_thread.wait(int(FETCH_CONFIG["shutdown_timeout"] * 1000)):
+                # 超时仍未退出时才强制终止
+                print("Pipeline thread did not stop in time, terminating...")
+                self.pipeline_thread.terminate()
+                self.pipeline_thread.wait(1000)
+            self.pipeline_thread = None
         # 终止 batch_fetcher
         if self.batch_fetcher and self.batch_fetcher.isRunning():
             print("Terminating batch_fetcher thread...")
             self.batch_fetcher.terminate()
             self.batch_fetcher.wait(1000)  # 等待最多1秒
             self.batch_fetcher = None
-        # 终止 loader
-        if self.loader and self.loader.isRunning():
-            print("Terminating loader thread...")
-            self.loader.terminate()
-            self.loader.wait(1000)
-            self.loader = None
+        # 放弃排队中的预取并等待加载线程池结束
+        if hasattr(self, 'prefetcher'):
+            print("Waiting for loader thread pool...")
+            self.prefetcher.cancel()
+            self.prefetcher.pool.clear()
+            self.prefetcher.pool.waitForDone(1000)
         # 清理数据库连接
         if hasattr(self, 'engine'):
             if self.engine is not None:
@@ -92,27 +124,35 @@ class MainWindowLogic:
         
     # 清理股票选择器
     def filter_stock_selector(self):
-        search_text = self.ui.visualization_tab.search_box.text().strip().lower()
+        search_text = self.ui.visualization_tab.search_box.text().strip()
         if not search_text:
-            self.ui.visualization_tab.stock_selector.clear()
-            self.ui.visualization_tab.stock_selector.addItems(self.all_stock_symbols)
-            return
-        # 完全匹配
-        exact_matches = [symbol for symbol in self.all_stock_symbols if symbol.lower() == search_text]
-        # 前缀匹配（但排除完全匹配）
-        prefix_matches = [symbol for symbol in self.all_stock_symbols if symbol.lower().startswith(search_text) and symbol.lower() != search_text]
-        # 包含匹配（但排除前两种）
-        contains_matches = [symbol for symbol in self.all_stock_symbols if search_text in symbol.lower() and not symbol.lower().startswith(search_text)]
-
-        filtered_symbols = exact_matches + prefix_matches + contains_matches
-        self.ui.visualization_tab.stock_selector.clear()
-        self.ui.visualization_tab.stock_selector.addItems(filtered_symbols)
+            self.search_results = []
+            self.selector_symbols = self.all_stock_symbols
+        else:
+            # 完全匹配 > 前缀匹配 > 包含匹配，只显示前 max_results 个
+            self.search_results = self.ticker_search.search(search_text, SEARCH_CONFIG["max_results"])
+            self.selector_symbols = self.search_results
+        self.ui.visualization_tab.stock_model.set_symbols(self.selector_symbols)
+        self.ui.visualization_tab.stock_selector.setCurrentIndex(0 if self.selector_symbols else -1)
     
     # 更新股票选择器
     def update_stock_selector(self):
+        # 搜索索引启动时从快照加载一次，之后只增量加入 ticker_registry 中新出现（已有数据）的 ticker
+        if self.ticker_search.fetched_at is None:
+            try:
+                self.ticker_search.load(lambda: fetch_ticker_names(self.engine))
+            except Exception as e:
+                print(f"加载搜索索引失败: {e}")
+        # ticker 列表来自 ticker_registry；本轮更新中第一次有数据的 ticker 补进搜索索引
         self.all_stock_symbols = fetch_table_names(self.engine)
-        self.ui.visualization_tab.stock_selector.clear()
-        self.ui.visualization_tab.stock_selector.addItems(self.all_stock_symbols)
+        missing = [ticker for ticker in self.all_stock_symbols if ticker not in self.ticker_search]
+        if missing:
+            try:
+                self.ticker_search.add(fetch_ticker_names(self.engine, missing))
+            except Exception as e:
+                print(f"更新搜索索引失败: {e}")
+        self.ui.visualization_tab.stock_model.set_name_lookup(self.ticker_search.name)
+        self.filter_stock_selector()
         model = QStringListModel()
         model.setStringList(self.all_stock_symbols)
         self.ui.visualization_tab.completer.setModel(model)
@@ -131,28 +171,19 @@ class MainWindowLogic:
         
     # 搜索文字框
     def confirm_search(self):
-        search_text = self.ui.visualization_tab.search_box.text().strip().upper() # 转换为大写
+        search_text = self.ui.visualization_tab.search_box.text().strip()
         if search_text:
-            exact_matches = [symbol for symbol in self.all_stock_symbols if symbol.upper() == search_text] # 完全匹配
-            if not exact_matches:
-                partial_matches = [symbol for symbol in self.all_stock_symbols if search_text in symbol.upper()] # 部分匹配
-            if exact_matches:
-                self.ui.visualization_tab.stock_selector.setCurrentText(exact_matches[0]) # 将搜索框的内容设置为匹配的股票代码
-            elif partial_matches:
-                self.ui.visualization_tab.stock_selector.setCurrentText(partial_matches[0])
+            match = self.ticker_search.find(search_text)
+            if match:
+                self.ui.visualization_tab.stock_selector.setCurrentText(match) # 将搜索框的内容设置为匹配的股票代码
             else:
                 QMessageBox.warning(self.ui, "未找到", f"未找到匹配的股票代码: {search_text}")
 
     # 切换鼠标悬停显示
     def toggle_hover_display(self):
-        if self.ui.visualization_tab.hover_toggle.isChecked():
-            self.enable_hover = True
-        else:
-            self.enable_hover = False
-            self.ui.visualization_tab.main_plot.setTitle("")
-            QToolTip.hideText()
+        self.enable_hover = self.ui.visualization_tab.hover_toggle.isChecked()
         if hasattr(self, 'current_df') and self.current_df is not None:
-            self.plot_main_chart(self.current_df, auto_range=False)
+            set_candlestick_hover(self.ui.visualization_tab.main_plot, self.current_df, self.enable_hover)
     
     # 批量获取股票数据
     def batch_fetch_stocks(self): 
@@ -189,43 +220,80 @@ class MainWindowLogic:
             self.limit_date = get_latest_date_from_longport().strftime("%Y-%m-%d")
             print(f"Limit date for fetching IPO and delisted tickers: {self.limit_date}")
             
-            # Step 1: Run MS thread
-            self.ms_thread = MsProcessThread(self.limit_date)
-            self.ms_thread.finished_with_result.connect(self.on_ms_finished)
-            self.ms_thread.start()
+            # 日线增量更新在流水线线程中同步执行，信号仍然回到界面线程
+            self.batch_fetch_message = ""
+            self.batch_fetcher = BatchDataFetcher(self.stock_symbols)
+            self.batch_fetcher.progress_updated.connect(self.update_progress)
+            self.batch_fetcher.fetch_complete.connect(self.on_batch_fetch_complete)
+            self.batch_fetcher.error_occurred.connect(self.show_error)
+            self.batch_fetcher.data_written.connect(self.on_data_written)
+
+            # 刷新流水线：互不依赖的阶段并发执行
+            # IPO 回填写入的是已前复权的 K 线，必须排在拆股反向调整之后，否则新上市又有拆股的 ticker 会被重复调整
+            limit_date = self.limit_date
+            stages = [
+                PipelineStage("splits", lambda results, job: process_ms(limit_date, job.report, job.cancel_event)),
+                PipelineStage("delisted", lambda results, job: process_delisted(limit_date, job.report, job.cancel_event)),
+                PipelineStage("ipo_reference", lambda results, job: ipo_reference_update(limit_date, job.report, job.cancel_event)),
+                PipelineStage("daily_bars", lambda results, job: self.batch_fetcher.fetch_all(job.cancel_event),
+                              depends_on=["delisted"]),
+                PipelineStage("split_reverse", lambda results, job: process_delisted_reverse(results["splits"], job.report, job.cancel_event),
+                              depends_on=["splits", "daily_bars"]),
+                PipelineStage("ipo_backfill", lambda results, job: ipo_backfill(results["ipo_reference"], job.report, job.cancel_event),
+                              depends_on=["ipo_reference", "split_reverse"]),
+            ]
+            self.stage_status = {stage.name: "等待" for stage in stages}
+            self.pipeline_thread = RefreshPipelineThread(stages)
+            self.pipeline_thread.stage_started.connect(self.on_stage_started)
+            self.pipeline_thread.stage_progress.connect(self.on_stage_progress)
+            self.pipeline_thread.stage_finished.connect(self.on_stage_finished)
+            self.pipeline_thread.pipeline_finished.connect(self.on_pipeline_finished)
+            self.pipeline_thread.start()
+            self.ui.data_fetch_tab.cancel_button.setEnabled(True)
         except Exception as e:
             self.show_error(f"从数据库获取股票代码失败: {e}")
             print(e)
-            
-    def on_ms_finished(self, ms_filtered):
-        self.ms_filtered = ms_filtered
-        # 安全关闭 ms_thread
-        self.ms_thread.quit()
-        self.ms_thread.wait()
-        self.ms_thread = None
-        # Step 2: Run delisted thread
-        self.delisted_thread = DelistedProcessThread(self.limit_date)
-        self.delisted_thread.finished.connect(self.on_delisted_finished)
-        self.delisted_thread.start()
-    
-    def on_delisted_finished(self):
-        # 安全关闭 delisted_thread
-        self.delisted_thread.quit()
-        self.delisted_thread.wait()
-        self.delisted_thread = None
-        # Step 3: Now run batch fetcher
-        self.batch_fetcher = BatchDataFetcher(self.stock_symbols)
-        self.batch_fetcher.progress_updated.connect(self.update_progress)
-        self.batch_fetcher.fetch_complete.connect(self.on_batch_fetch_complete)
-        self.batch_fetcher.error_occurred.connect(self.show_error)
-        self.batch_fetcher.start()
-    
+
+    # 更新流水线各阶段状态
+    def show_stage_status(self):
+        self.ui.data_fetch_tab.stage_info.setText(" | ".join(f"{name}: {status}" for name, status in self.stage_status.items()))
+
+    def on_stage_started(self, name):
+        self.stage_status[name] = "运行中"
+        self.show_stage_status()
+
+    def on_stage_progress(self, name, current, total, message):
+        # Polygon 翻页不知道总页数，total 为 0 时只显示已完成的页数
+        self.stage_status[name] = f"{current}/{total}" if total else f"第 {current} 页"
+        self.show_stage_status()
+
+    # 取消刷新流水线
+    def cancel_batch_fetch(self):
+        if self.pipeline_thread and self.pipeline_thread.isRunning():
+            self.pipeline_thread.cancel()
+            self.ui.data_fetch_tab.cancel_button.setEnabled(False)
+            self.ui.data_fetch_tab.progress_info.setText("正在取消，等待运行中的阶段退出...")
+
+    def on_stage_finished(self, name, seconds, status):
+        self.stage_status[name] = f"{status} {seconds:.1f}s"
+        # 拆股反向调整和 IPO 回补会改写已有历史，缓存的 K 线全部失效
+        if name in ("split_reverse", "ipo_backfill") and status != "skipped":
+            self.frame_cache.clear()
+            self.prefetcher.forget_states()
+        self.show_stage_status()
+
     # 批量获取完成
     def on_batch_fetch_complete(self, message):
+        self.batch_fetch_message = message
+
+    # 流水线全部完成
+    def on_pipeline_finished(self, summary):
+        self.pipeline_thread.wait()
+        self.pipeline_thread = None
         self.ui.data_fetch_tab.batch_fetch_button.setEnabled(True)
-        QMessageBox.information(self.ui, "完成", message)    
-        process_delisted_reverse(self.ms_filtered)
-        ipo_incremental_update(self.limit_date)
+        self.ui.data_fetch_tab.cancel_button.setEnabled(False)
+        timings = "\n".join(f"{name}: {status}, {seconds:.1f}s" for name, (status, seconds) in summary.items())
+        QMessageBox.information(self.ui, "完成", f"{self.batch_fetch_message}\n\n各阶段耗时:\n{timings}")
         self.update_stock_selector()
     
     # 更新进度条
@@ -248,29 +316,35 @@ class MainWindowLogic:
     # 加载图表按钮    
     def load_stock_data(self):
         ticker = self.ui.visualization_tab.stock_selector.currentText()
-        period = int(self.ui.visualization_tab.period_selector.currentText())
+        period = self.ui.visualization_tab.period_selector.currentData()
         limit = period if period != 0 else None
-        if ticker in self.data_cache:
-            cached_data = self.data_cache[ticker]
-            if limit is None or len(cached_data) >= limit:
-                df = cached_data.tail(limit) if limit is not None else cached_data
-                self.plot_main_chart(df)
-                self.plot_subplots(df)
-                return
-        self.loader = DataLoader(ticker, self.engine, limit)
-        self.loader.data_loaded.connect(self.on_data_loaded)
-        self.loader.error_occurred.connect(self.show_error)
-        self.loader.start()
+        adjust = self.ui.visualization_tab.adjust_selector.currentData()
+        self.pending_load = (ticker, adjust, limit)
+        self.prefetcher.remember(ticker)
+        df = self.frame_cache.get(ticker, adjust, limit)
+        if df is not None:
+            self.on_data_loaded((ticker, adjust, limit), df)
+        else:
+            # 缓存未命中时在线程池中加载（已缓存部分数据时只加载缺少的更早 K 线）
+            self.prefetcher.load(ticker, limit, adjust)
+        # 提前加载接下来可能查看的 ticker
+        self.prefetcher.prefetch(self.prefetcher.predict(ticker, self.selector_symbols, self.search_results), limit, adjust)
 
     # 图表加载
-    def on_data_loaded(self, df):
-        ticker = self.ui.visualization_tab.stock_selector.currentText()
-        self.data_cache[ticker] = df
-        period = int(self.ui.visualization_tab.period_selector.currentText())
-        if period != 0:
-            df = df.tail(period)
+    def on_data_loaded(self, request, df):
+        # request 为 (ticker, adjust, limit)；加载期间用户已切换 ticker、周期或复权方式时丢弃结果
+        if request != self.pending_load:
+            return
+        # 存储的指标状态按 stock_daily 存储口径计算，只用于不做读时复权的数据
+        ticker, adjust, _ = request
+        self.current_anchors = state_anchors(df, self.prefetcher.states_for(ticker)) if adjust == "raw" else {}
         self.plot_main_chart(df)
         self.plot_subplots(df)
+
+    # 新数据写入或历史被改写后使缓存失效
+    def on_data_written(self, tickers):
+        self.frame_cache.invalidate(tickers)
+        self.prefetcher.forget_states(tickers)
         
     
     def plot_main_chart(self, df, auto_range=True):
@@ -279,11 +353,6 @@ class MainWindowLogic:
         enable_hover = self.ui.visualization_tab.hover_toggle.isChecked()
         print("toggle hover display:", enable_hover)
         plot_candlestick(self.ui.visualization_tab.main_plot, df, enable_hover, auto_range)
-        axis = pg.DateAxisItem(orientation='bottom')
-        self.ui.visualization_tab.main_plot.setAxisItems({'bottom': axis})
-        x = np.arange(len(df))
-        ticks = [(x[i], df["Date"].iloc[i].strftime('%Y%m%d')) for i in range(0, len(df), 5)]
-        axis.setTicks([ticks])
         
     def plot_subplots(self, df):
         splitter = self.ui.visualization_tab.splitter
@@ -299,8 +368,8 @@ class MainWindowLogic:
             subplot = pg.PlotWidget()
             if subplot_type == "Volume":
                 plot_volume(subplot, df)
-            elif subplot_type == "OBV":
-                plot_obv(subplot, df)
+            else:
+                plot_indicator(subplot, df, subplot_type, self.current_anchors)
             subplot.setXLink(self.ui.visualization_tab.main_plot)
             splitter.addWidget(subplot)
 
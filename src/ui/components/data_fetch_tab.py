@@ -36,6 +36,11 @@ class DataFetchTab(QWidget):
         timer.timeout.connect(update_et_time)
         timer.start(1000)
 
+        # 流水线各阶段状态
+        self.stage_info = QLabel()
+        self.stage_info.setWordWrap(True)
+        layout.addWidget(self.stage_info, 1, 0, 1, 2)
+
         # 进度信息
         self.progress_info = QLabel("准备中...")
         layout.addWidget(self.progress_info, 2, 0, 1, 2)
@@ -51,4 +56,10 @@ class DataFetchTab(QWidget):
         self.batch_fetch_button.setFixedHeight(40)
         layout.addWidget(self.batch_fetch_button, 4, 0, 1, 2)
 
+        # 取消按钮，仅在刷新流水线运行时可用
+        self.cancel_button = QPushButton("取消更新")
+        self.cancel_button.setFixedHeight(40)
+        self.cancel_button.setEnabled(False)
+        layout.addWidget(self.cancel_button, 5, 0, 1, 2)
+
         self.setLayout(layout)
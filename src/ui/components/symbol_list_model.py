@@ -0,0 +1,36 @@
+from PySide6.QtCore import QAbstractListModel, QModelIndex, Qt
+
+class SymbolListModel(QAbstractListModel):
+    """
+    股票选择器使用的列表模型：直接引用代码列表，不为每一项创建 QStandardItem，
+    视图只按需读取可见行，更新结果时整体重置一次。
+    """
+    def __init__(self, symbols=None, parent=None):
+        super().__init__(parent)
+        self._symbols = list(symbols or [])
+        self._name_lookup = None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._symbols)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < len(self._symbols):
+            return None
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            return self._symbols[index.row()]
+        # 悬停时显示公司名称
+        if role == Qt.ItemDataRole.ToolTipRole and self._name_lookup is not None:
+            return self._name_lookup(self._symbols[index.row()])
+        return None
+
+    def symbols(self):
+        return self._symbols
+
+    def set_name_lookup(self, name_lookup):
+        """name_lookup(ticker) 返回公司名称，用于提示"""
+        self._name_lookup = name_lookup
+
+    def set_symbols(self, symbols):
+        self.beginResetModel()
+        self._symbols = list(symbols)
+        self.endResetModel()
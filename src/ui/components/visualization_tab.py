@@ -6,6 +6,7 @@ from PySide6.QtWidgets import (
 from PySide6.QtCore import Qt
 import pyqtgraph as pg
 import numpy as np
+from src.ui.components.symbol_list_model import SymbolListModel
 
 # # 禁用 pyqtgraph 的 OpenGL 和多线程
 # pg.setConfigOption('useOpenGL', False)
@@ -43,6 +44,10 @@ class VisualizationTab(QWidget):
         # Stock selector
         self.stock_selector = QComboBox()
         self.stock_selector.setFixedHeight(40)
+        # 代码列表由模型提供，下拉列表按统一行高只绘制可见行
+        self.stock_model = SymbolListModel()
+        self.stock_selector.setModel(self.stock_model)
+        self.stock_selector.view().setUniformItemSizes(True)
         control_layout.addWidget(self.stock_selector, 1, 0, 1, 2)
 
         # Period selector and load button
@@ -51,13 +56,21 @@ class VisualizationTab(QWidget):
         control_layout.addWidget(self.period_label, 1, 2)
 
         self.period_selector = QComboBox()
-        self.period_selector.addItems(["50", "200", "500", "1000"])
+        for period in (50, 200, 500, 1000):
+            self.period_selector.addItem(str(period), period)
+        # 0 表示全部历史，长历史由 CandlestickLOD 按缩放聚合为周线、月线等
+        self.period_selector.addItem("All", 0)
         self.period_selector.setFixedHeight(40)
         control_layout.addWidget(self.period_selector, 1, 3)
 
+        # Price adjustment selector，选项由 main_logic 按 stock_daily 的存储复权方式填充
+        self.adjust_selector = QComboBox()
+        self.adjust_selector.setFixedHeight(40)
+        control_layout.addWidget(self.adjust_selector, 1, 4)
+
         self.load_button = QPushButton("Load")
         self.load_button.setFixedHeight(40)
-        control_layout.addWidget(self.load_button, 1, 4)
+        control_layout.addWidget(self.load_button, 1, 5)
 
         control_container.setLayout(control_layout)
         layout.addWidget(control_container, 0, 0, 1, 2)
@@ -68,7 +81,7 @@ class VisualizationTab(QWidget):
         # Subplot selector
         self.subplot_selector = QListWidget()
         self.subplot_selector.setSelectionMode(QAbstractItemView.MultiSelection)
-        self.subplot_selector.addItems(["Volume", "OBV"])
+        self.subplot_selector.addItems(["Volume", "OBV", "SMA", "EMA", "RSI", "MACD", "Bollinger", "ATR", "VWAP"])
         self.subplot_selector.item(0).setSelected(True)
         self.subplot_selector.setMaximumHeight(80)  # Limit width to keep it compact
         options_layout.addWidget(self.subplot_selector)
@@ -0,0 +1,124 @@
+import threading
+from collections import OrderedDict
+import pandas as pd
+from src.config.fetch_config import FRAME_CACHE_CONFIG
+from src.utils.logger import setup_logger
+
+logger = setup_logger("frame_cache")
+
+class FrameCache:
+    """
+    按 (ticker, adjust) 缓存 K 线 DataFrame 的 LRU 缓存，总大小不超过 max_bytes。
+
+    每个条目记录是否已包含该 ticker 的全部历史（complete）。请求的 K 线数不超过已缓存的数量、
+    或条目已完整时直接命中；否则 missing() 给出还缺的更早数据范围，加载后用 extend() 拼到前面，
+    例如先看 200 根再看 1000 根只需再查询更早的 800 根。
+    """
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes or FRAME_CACHE_CONFIG["max_bytes"]
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def frame_size(df):
+        return int(df.memory_usage(deep=True, index=True).sum())
+
+    def _store(self, key, df, complete):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[2]
+        size = self.frame_size(df)
+        self._entries[key] = (df, complete, size)
+        self._bytes += size
+        # 超出预算时从最久未使用的条目开始淘汰，刚写入的条目保留
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            evicted_key, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            logger.debug(f"Evicted {evicted_key} ({evicted_size} bytes)")
+
+    def get(self, ticker, adjust, limit=None):
+        """
+        返回最近 limit 根 K 线（limit 为 None 表示全部历史），缓存不足时返回 None
+        """
+        key = (ticker, adjust)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            df, complete, _ = entry
+            if not complete and (limit is None or len(df) < limit):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return df if limit is None else df.tail(limit)
+
+    def contains(self, ticker, adjust, limit=None):
+        """是否已缓存足够的数据，不影响 LRU 顺序和命中统计"""
+        with self._lock:
+            entry = self._entries.get((ticker, adjust))
+            return entry is not None and (entry[1] or limit is not None and len(entry[0]) >= limit)
+
+    def missing(self, ticker, adjust, limit=None):
+        """
+        缓存中已有部分数据时，返回还需加载的更早数据 (before, count)：
+        before 为已缓存的最早日期，count 为还缺的 K 线数（None 表示之前的全部）。
+        没有缓存或已经满足请求时返回 None。
+        """
+        with self._lock:
+            entry = self._entries.get((ticker, adjust))
+            if entry is None:
+                return None
+            df, complete, _ = entry
+            if complete or df.empty or (limit is not None and len(df) >= limit):
+                return None
+            return df["Date"].iloc[0], (limit - len(df) if limit is not None else None)
+
+    def put(self, ticker, adjust, df, complete):
+        """缓存一次完整查询的结果，complete 表示 df 已包含该 ticker 的全部历史"""
+        with self._lock:
+            self._store((ticker, adjust), df, complete)
+
+    def extend(self, ticker, adjust, older, complete, before):
+        """
+        把更早的一段数据拼到已缓存的数据前面
+
+        Args:
+            before: 查询 older 时 missing() 给出的最早日期
+
+        Returns:
+            是否已拼接；查询期间条目被失效、淘汰或替换（最早日期已不是 before）时丢弃 older 并返回 False，
+            不能把这段不含最新 K 线的数据单独存为条目
+        """
+        key = (ticker, adjust)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0].empty or entry[0]["Date"].iloc[0] != before:
+                return False
+            df = pd.concat([older, entry[0]], ignore_index=True) if not older.empty else entry[0]
+            self._store(key, df, complete)
+            return True
+
+    def invalidate(self, tickers):
+        """使这些 ticker 所有复权方式的缓存失效（新数据写入或历史被改写后调用）"""
+        tickers = set(tickers)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] in tickers]:
+                self._bytes -= self._entries.pop(key)[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+# 全局 K 线缓存实例
+frame_cache = FrameCache()
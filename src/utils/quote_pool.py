@@ -0,0 +1,135 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+from longport.openapi import QuoteContext, Config, OpenApiException
+from src.config.fetch_config import LONGPORT_POOL
+from src.utils.rate_limiter import longport_quota, ThrottledQuoteContext
+from src.utils.logger import setup_logger
+
+logger = setup_logger("quote_pool")
+
+class _PooledContext:
+    """池中的一个长连接、正在使用它的调用数和最近一次成功使用的时间"""
+    def __init__(self, ctx: ThrottledQuoteContext):
+        self.ctx = ctx
+        self.users = 0
+        self.checking = False
+        self.last_ok = time.monotonic()
+
+
+class QuoteContextPool:
+    """
+    长期存活的 LongPort QuoteContext 共享池。
+
+    一个 QuoteContext 本身就能在多个线程间复用同一条长连接并发请求，借出的连接不是独占的：
+    默认只创建一个（size=1），所有线程共用；LongPort 限制每个账号的行情长连接数，
+    只有显式配置 LONGPORT_POOL_SIZE 时才会创建更多连接，并把请求分给使用者最少的连接。
+
+    连接在第一次需要时才创建；超过 health_interval 秒没有成功使用的连接在借出前先做一次轻量探测，
+    探测失败的连接会被丢弃并按需重建。借出的都是经过 longport_quota 限流包装的上下文，
+    并发数和速率由各线程共用的配额控制。
+
+    用法：
+        with quote_pool.connection() as ctx:
+            ctx.candlesticks(...)
+    """
+    def __init__(self, size: Optional[int] = None, health_interval: Optional[float] = None,
+                 config_factory: Callable[[], Config] = Config.from_env):
+        self.size = max(size or LONGPORT_POOL["size"], 1)
+        self.health_interval = health_interval if health_interval is not None else LONGPORT_POOL["health_interval"]
+        self._config_factory = config_factory
+        self._config = None
+        self._contexts: List[_PooledContext] = []
+        self._creating = 0
+        self._lock = threading.Lock()
+        self._create_lock = threading.Lock()
+
+    def _create(self) -> _PooledContext:
+        with self._create_lock:
+            if self._config is None:
+                self._config = self._config_factory()
+            logger.info(f"创建 LongPort QuoteContext ({len(self._contexts) + 1}/{self.size})")
+            return _PooledContext(longport_quota.wrap(QuoteContext(self._config)))
+
+    def _healthy(self, pooled: _PooledContext) -> bool:
+        if time.monotonic() - pooled.last_ok < self.health_interval:
+            return True
+        try:
+            pooled.ctx.trading_session()
+            pooled.last_ok = time.monotonic()
+            return True
+        except Exception as e:
+            logger.warning(f"QuoteContext 健康检查失败，重建连接: {e}")
+            return False
+
+    def acquire(self) -> _PooledContext:
+        """
+        借出一个连接：复用使用者最少的已有连接，所有连接都在使用且未达上限时才新建
+        """
+        while True:
+            with self._lock:
+                pooled = min(self._contexts, key=lambda p: p.users, default=None)
+                create = pooled is None or (pooled.users > 0 and len(self._contexts) + self._creating < self.size)
+                if create:
+                    self._creating += 1
+                else:
+                    pooled.users += 1
+                    # 较久没有成功使用的连接由一个借出它的线程做健康检查，其他线程照常使用
+                    check = not pooled.checking and time.monotonic() - pooled.last_ok >= self.health_interval
+                    pooled.checking = pooled.checking or check
+            if create:
+                try:
+                    pooled = self._create()
+                finally:
+                    with self._lock:
+                        self._creating -= 1
+                with self._lock:
+                    pooled.users += 1
+                    self._contexts.append(pooled)
+                return pooled
+            if not check:
+                return pooled
+            healthy = self._healthy(pooled)
+            pooled.checking = False
+            if healthy:
+                return pooled
+            self.release(pooled)
+            self.discard(pooled)
+
+    def release(self, pooled: _PooledContext) -> None:
+        """归还连接"""
+        with self._lock:
+            pooled.users -= 1
+            pooled.last_ok = time.monotonic()
+
+    def discard(self, pooled: _PooledContext) -> None:
+        """丢弃损坏的连接（正在使用它的调用照常结束），之后按需重建"""
+        with self._lock:
+            if pooled in self._contexts:
+                self._contexts.remove(pooled)
+
+    @contextmanager
+    def connection(self):
+        """借出一个限流后的 QuoteContext，退出时归还；出现业务异常以外的错误时，下次借出前先做健康检查"""
+        pooled = self.acquire()
+        try:
+            yield pooled.ctx
+        except OpenApiException:
+            self.release(pooled)
+            raise
+        except Exception:
+            with self._lock:
+                pooled.users -= 1
+                pooled.last_ok = float("-inf")
+            raise
+        else:
+            self.release(pooled)
+
+    def close(self) -> None:
+        """丢弃所有连接（QuoteContext 在释放引用后断开）"""
+        with self._lock:
+            self._contexts.clear()
+
+# 全局 QuoteContext 连接池
+quote_pool = QuoteContextPool()
@@ -0,0 +1,183 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from src.config.fetch_config import FETCH_CONFIG, LONGPORT_QUOTAS
+from src.utils.logger import setup_logger
+
+logger = setup_logger("rate_limiter")
+
+class TokenBucket:
+    """
+    线程安全的令牌桶。
+
+    :param rate: 每秒补充的令牌数
+    :param capacity: 桶容量（允许的突发请求数），默认等于 rate
+    """
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.nominal_rate = float(rate)
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        预定令牌并返回调用方需要等待的秒数（不阻塞）。
+
+        :param tokens: 需要的令牌数
+        :return: 需要等待的秒数
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._paused_until - now, 0.0)
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        阻塞直到拿到令牌。
+
+        :param tokens: 需要的令牌数
+        :return: 实际等待的秒数
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def throttle(self, pause: float, min_rate: float) -> None:
+        """
+        服务端限流时调用：速率减半并暂停一段时间。
+
+        :param pause: 暂停秒数
+        :param min_rate: 速率下限
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.rate / 2, min_rate)
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+
+    def recover(self, step: float) -> None:
+        """
+        请求成功时调用：速率逐步恢复到额定值。
+
+        :param step: 每次恢复的速率
+        """
+        if self.rate >= self.nominal_rate:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = min(self.nominal_rate, self.rate + step)
+
+
+def is_throttled(error: Exception) -> bool:
+    """判断 LongPort 异常是否为服务端限流"""
+    code = getattr(error, "code", None)
+    if code in LONGPORT_QUOTAS["throttle_codes"]:
+        return True
+    message = str(error).lower()
+    return "rate limit" in message or "too many requests" in message
+
+
+class LongPortQuotaManager:
+    """
+    进程级 LongPort 请求配额管理器。
+
+    所有 QuoteContext 调用先经过全局令牌桶，再经过各接口自己的令牌桶，
+    同时用信号量限制并发数。被限流时速率减半并指数退避重试，成功后逐步恢复。
+    """
+    def __init__(self, quotas: Optional[Dict[str, Any]] = None):
+        quotas = quotas or LONGPORT_QUOTAS
+        self._global = TokenBucket(quotas["global_rate"])
+        self._endpoint_rates = dict(quotas["endpoints"])
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._semaphore = threading.BoundedSemaphore(quotas["max_concurrency"])
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def bucket(self, endpoint: str) -> TokenBucket:
+        """获取（或创建）指定接口的令牌桶"""
+        with self._lock:
+            if endpoint not in self._buckets:
+                rate = self._endpoint_rates.get(endpoint, self._endpoint_rates["default"])
+                self._buckets[endpoint] = TokenBucket(rate)
+                self._stats[endpoint] = {"calls": 0, "throttled": 0, "retries": 0, "failures": 0, "wait_seconds": 0.0}
+            return self._buckets[endpoint]
+
+    def _count(self, endpoint: str, key: str, value: float = 1) -> None:
+        with self._lock:
+            self._stats[endpoint][key] += value
+
+    def call(self, endpoint: str, func: Callable, *args, **kwargs):
+        """
+        在配额内执行一次 LongPort 调用。
+
+        :param endpoint: 接口名称，如 candlesticks / trading_days
+        :param func: 实际调用的函数
+        :return: func 的返回值
+        """
+        bucket = self.bucket(endpoint)
+        max_retries = FETCH_CONFIG["max_retries"]
+        backoff = FETCH_CONFIG["retry_backoff"]
+        for attempt in range(max_retries + 1):
+            waited = self._global.acquire() + bucket.acquire()
+            self._count(endpoint, "wait_seconds", waited)
+            self._count(endpoint, "calls")
+            try:
+                with self._semaphore:
+                    result = func(*args, **kwargs)
+                bucket.recover(LONGPORT_QUOTAS["recover_step"])
+                return result
+            except Exception as e:
+                if not is_throttled(e):
+                    self._count(endpoint, "failures")
+                    raise
+                self._count(endpoint, "throttled")
+                pause = backoff * (2 ** attempt)
+                bucket.throttle(pause, LONGPORT_QUOTAS["min_rate"])
+                self._global.throttle(pause, LONGPORT_QUOTAS["min_rate"])
+                if attempt == max_retries:
+                    self._count(endpoint, "failures")
+                    raise
+                self._count(endpoint, "retries")
+                logger.warning(f"LongPort {endpoint} 被限流，{pause:.1f} 秒后重试 ({attempt + 1}/{max_retries})")
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """返回各接口的调用计数（调用、限流、重试、失败次数和累计等待时间）"""
+        with self._lock:
+            snapshot = {endpoint: dict(counters) for endpoint, counters in self._stats.items()}
+            for endpoint, bucket in self._buckets.items():
+                snapshot[endpoint]["rate"] = bucket.rate
+            return snapshot
+
+    def wrap(self, ctx) -> "ThrottledQuoteContext":
+        """用配额管理器包装一个 QuoteContext"""
+        return ThrottledQuoteContext(ctx, self)
+
+
+class ThrottledQuoteContext:
+    """
+    QuoteContext 的代理，所有方法调用都按方法名计入对应接口的配额。
+    """
+    def __init__(self, ctx, manager: LongPortQuotaManager):
+        self._ctx = ctx
+        self._manager = manager
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._ctx, name)
+        if not callable(attr):
+            return attr
+
+        def throttled(*args, **kwargs):
+            return self._manager.call(name, attr, *args, **kwargs)
+        return throttled
+
+# 全局配额管理器实例
+longport_quota = LongPortQuotaManager()
@@ -0,0 +1,162 @@
+import heapq
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+# n-gram 索引的最大长度：不超过该长度的查询直接取倒排表，更长的查询取各 trigram 倒排表的交集
+GRAM_SIZE = 3
+
+# 计算两个字符串的编辑距离（含相邻交换），超过 max_distance 时提前返回 max_distance + 1
+def edit_distance(a, b, max_distance):
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class SymbolIndex:
+    """
+    股票代码搜索索引，一次构建后每次查询不再扫描全部代码，之后可以用 add 增量加入新代码。
+
+    - 小写代码的有序数组：二分查找得到完全匹配和前缀匹配的区间
+    - 1~3 字符 n-gram 倒排表：包含匹配只检查候选代码，拼写容错也从 bigram 倒排表取候选
+
+    结果按 完全匹配 > 前缀匹配 > 包含匹配 排序，包含匹配中匹配位置越靠前、代码越短越靠前。
+    """
+    def __init__(self, symbols=()):
+        self._symbols = []
+        self._lower = []
+        self._ids = {}
+        self._sorted = []
+        self._grams = defaultdict(list)
+        self.add(symbols)
+
+    def __len__(self):
+        return len(self._symbols)
+
+    def __contains__(self, symbol):
+        return symbol in self._ids
+
+    @property
+    def symbols(self):
+        """按加入顺序排列的全部代码"""
+        return self._symbols
+
+    def add(self, symbols):
+        """加入新代码（已存在的忽略），返回实际加入的数量"""
+        new_symbols = [s for s in dict.fromkeys(symbols) if s not in self._ids]
+        bulk = len(new_symbols) > len(self._sorted)
+        for symbol in new_symbols:
+            symbol_id = len(self._symbols)
+            lower = symbol.lower()
+            self._ids[symbol] = symbol_id
+            self._symbols.append(symbol)
+            self._lower.append(lower)
+            if bulk:
+                self._sorted.append((lower, symbol_id))
+            else:
+                insort(self._sorted, (lower, symbol_id))
+            grams = {lower[i:i + n] for n in range(1, GRAM_SIZE + 1) for i in range(len(lower) - n + 1)}
+            for gram in grams:
+                self._grams[gram].append(symbol_id)
+        if bulk:
+            self._sorted.sort()
+        return len(new_symbols)
+
+    def _prefix_ids(self, text):
+        lo = bisect_left(self._sorted, (text,))
+        hi = bisect_left(self._sorted, (text + "\uffff",), lo)
+        return [symbol_id for _, symbol_id in self._sorted[lo:hi]]
+
+    def _contains_candidates(self, text):
+        """包含 text 的代码 id"""
+        if len(text) <= GRAM_SIZE:
+            return self._grams.get(text, [])
+        postings = sorted(
+            (self._grams.get(text[i:i + GRAM_SIZE], []) for i in range(len(text) - GRAM_SIZE + 1)),
+            key=len,
+        )
+        if not postings[0]:
+            return []
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return []
+        return [symbol_id for symbol_id in candidates if text in self._lower[symbol_id]]
+
+    def prefix(self, text, limit=None):
+        """以 text 开头的代码（按字母顺序，完全匹配排在最前）"""
+        ids = self._prefix_ids(text.strip().lower())
+        return [self._symbols[i] for i in (ids if limit is None else ids[:limit])]
+
+    def search(self, text, limit=None):
+        """
+        Args:
+            text: 查询文本，不区分大小写；为空时返回全部代码
+            limit: 最多返回的结果数，None 表示不限制
+        """
+        text = text.strip().lower()
+        if not text:
+            return self._symbols[:limit] if limit is not None else list(self._symbols)
+        # 有序数组中完全匹配排在前缀区间的最前面
+        prefix_ids = self._prefix_ids(text)
+        results = [self._symbols[i] for i in (prefix_ids if limit is None else prefix_ids[:limit])]
+        remaining = None if limit is None else limit - len(results)
+        if remaining is not None and remaining <= 0:
+            return results
+
+        contains = [i for i in self._contains_candidates(text) if not self._lower[i].startswith(text)]
+        rank = lambda i: (self._lower[i].find(text), len(self._lower[i]), self._lower[i])
+        ranked = sorted(contains, key=rank) if remaining is None else heapq.nsmallest(remaining, contains, key=rank)
+        return results + [self._symbols[i] for i in ranked]
+
+    def similar(self, text, max_distance=1, limit=None):
+        """
+        拼写容错匹配：返回编辑距离不超过 max_distance 的代码，按距离排序
+
+        候选只取与 text 共享足够多 bigram 的代码，不逐个计算全部代码的编辑距离。
+        """
+        text = text.strip().lower()
+        if not text:
+            return []
+        # 每处编辑（含相邻交换）最多破坏三个 bigram；bigram 不足以筛选候选时（短文本）改用单字符
+        grams = {text[i:i + 2] for i in range(len(text) - 1)}
+        min_shared = len(grams) - 3 * max_distance
+        if min_shared < 1:
+            grams = set(text)
+            min_shared = max(1, len(grams) - 2 * max_distance)
+        counts = defaultdict(int)
+        if len(text) <= max_distance:
+            # 文本短到所有字符都可能被替换时，共享 gram 不能筛选候选，逐个计算编辑距离
+            counts.update(dict.fromkeys(range(len(self._symbols)), 0))
+            min_shared = 0
+        for gram in grams:
+            for symbol_id in self._grams.get(gram, []):
+                counts[symbol_id] += 1
+        matches = []
+        for symbol_id, shared in counts.items():
+            lower = self._lower[symbol_id]
+            if shared < min_shared or abs(len(lower) - len(text)) > max_distance:
+                continue
+            distance = edit_distance(text, lower, max_distance)
+            if distance <= max_distance:
+                matches.append((distance, -shared, len(lower), lower, symbol_id))
+        matches.sort()
+        if limit is not None:
+            matches = matches[:limit]
+        return [(self._symbols[m[-1]], m[0]) for m in matches]
+
+    def find(self, text):
+        """返回排名第一的匹配代码，没有匹配时返回 None"""
+        results = self.search(text, 1) if text.strip() else []
+        return results[0] if results else None
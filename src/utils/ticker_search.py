@@ -0,0 +1,184 @@
+import json
+import os
+import re
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from src.config.fetch_config import SEARCH_CONFIG
+from src.config.paths import TICKER_SEARCH_PATH
+from src.utils.symbol_index import SymbolIndex
+from src.utils.logger import setup_logger
+
+logger = setup_logger("ticker_search")
+
+# 名称中的单词（小写字母和数字）
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+# 拼写容错只用于不少于该长度的查询
+FUZZY_MIN_LENGTH = 3
+
+def tokenize(text):
+    return WORD_PATTERN.findall(text.lower())
+
+# 单词越长允许的编辑距离越大
+def max_edit_distance(word):
+    return 1 if len(word) < 8 else 2
+
+
+class TickerSearch:
+    """
+    股票代码和公司名称搜索服务，数据为 ticker_registry 中有数据的 ticker 及其 tickers_fundamental 名称。
+
+    启动时从磁盘快照（TICKER_SEARCH_PATH）加载，快照超过 ttl 或不存在时才查询一次数据库；
+    刷新后第一次有 K 线的 ticker（进入 ticker_registry）再用 add 增量加入索引并更新快照，不需要重新扫描 stock_daily。
+
+    结果排序：代码完全/前缀匹配 > 名称单词前缀匹配 > 代码包含匹配 > 代码拼写容错 > 名称拼写容错。
+    """
+    def __init__(self, path=TICKER_SEARCH_PATH, ttl_days=None):
+        self.path = path
+        self.ttl = timedelta(days=ttl_days if ttl_days is not None else SEARCH_CONFIG["snapshot_ttl_days"])
+        self.fetched_at = None
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._names = {}
+        self._symbols = SymbolIndex()
+        self._words = SymbolIndex()
+        self._word_tickers = defaultdict(set)
+
+    def _index(self, rows):
+        """把 (ticker, name) 加入索引，返回新加入的 ticker 数"""
+        rows = [(ticker, name or "") for ticker, name in rows if ticker]
+        for ticker, name in rows:
+            old_name = self._names.get(ticker)
+            if old_name is not None and old_name != name:
+                for word in tokenize(old_name):
+                    self._word_tickers[word].discard(ticker)
+            self._names[ticker] = name
+            for word in tokenize(name):
+                self._word_tickers[word].add(ticker)
+        self._words.add(word for _, name in rows for word in tokenize(name))
+        return self._symbols.add(ticker for ticker, _ in rows)
+
+    def _read_disk(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取搜索快照失败: {e}")
+            return None
+
+    def _write_disk(self):
+        data = {
+            "fetched_at": self.fetched_at.isoformat(),
+            "tickers": [[ticker, name] for ticker, name in self._names.items()],
+        }
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"写入搜索快照失败: {e}")
+
+    def load(self, fetch_rows, force=False):
+        """
+        加载索引
+
+        Args:
+            fetch_rows: 返回 [(ticker, name), ...] 的函数，快照过期或不存在时调用
+            force: 忽略快照，直接从数据库重建
+        """
+        with self._lock:
+            snapshot = None if force else self._read_disk()
+            if snapshot is not None and datetime.now() - datetime.fromisoformat(snapshot["fetched_at"]) < self.ttl:
+                self._reset()
+                self._index(snapshot["tickers"])
+                self.fetched_at = datetime.fromisoformat(snapshot["fetched_at"])
+                logger.info(f"从快照加载 {len(self._names)} 个 ticker ({snapshot['fetched_at']})")
+                return len(self._names)
+            try:
+                rows, fetched_at, stale = fetch_rows(), datetime.now(), False
+            except Exception as e:
+                if snapshot is None:
+                    raise
+                logger.warning(f"重建搜索索引失败，使用过期快照 ({snapshot['fetched_at']}): {e}")
+                rows, fetched_at, stale = snapshot["tickers"], datetime.fromisoformat(snapshot["fetched_at"]), True
+            self._reset()
+            self._index(rows)
+            self.fetched_at = fetched_at
+            if not stale:
+                self._write_disk()
+            logger.info(f"搜索索引已重建: {len(self._names)} 个 ticker")
+            return len(self._names)
+
+    def add(self, rows):
+        """增量加入新 ticker（或更新名称）并保存快照，返回新加入的 ticker 数"""
+        with self._lock:
+            added = self._index(rows)
+            if self.fetched_at is not None:
+                self._write_disk()
+            return added
+
+    def __contains__(self, ticker):
+        return ticker in self._names
+
+    def tickers(self):
+        """按字母顺序排列的全部 ticker"""
+        with self._lock:
+            return self._symbols.prefix("")
+
+    def name(self, ticker):
+        return self._names.get(ticker)
+
+    def _name_matches(self, words, fuzzy):
+        """名称中每个查询单词都能匹配到某个单词（前缀，或 fuzzy 时拼写容错）的 ticker"""
+        matched = None
+        for word in words:
+            if fuzzy:
+                candidates = [w for w, _ in self._words.similar(word, max_edit_distance(word))] if len(word) >= FUZZY_MIN_LENGTH else self._words.prefix(word)
+            else:
+                candidates = self._words.prefix(word)
+            tickers = set().union(*(self._word_tickers[w] for w in candidates)) if candidates else set()
+            matched = tickers if matched is None else matched & tickers
+            if not matched:
+                return []
+        return sorted(matched or [], key=lambda t: (len(self._names[t]), t))
+
+    def search(self, text, limit=None):
+        """
+        Args:
+            text: 代码或公司名称（可包含多个单词），不区分大小写；为空时返回全部 ticker
+            limit: 最多返回的结果数，None 表示不限制
+        """
+        text = text.strip()
+        if not text:
+            tickers = self.tickers()
+            return tickers if limit is None else tickers[:limit]
+        with self._lock:
+            results = dict.fromkeys(self._symbols.prefix(text, limit))
+            words = tokenize(text)
+
+            def full():
+                return limit is not None and len(results) >= limit
+
+            if not full():
+                results.update(dict.fromkeys(self._name_matches(words, fuzzy=False)))
+            if not full():
+                results.update(dict.fromkeys(self._symbols.search(text, limit)))
+            if not full() and len(text) >= FUZZY_MIN_LENGTH:
+                results.update(dict.fromkeys(t for t, _ in self._symbols.similar(text, 1, limit)))
+                if not full():
+                    results.update(dict.fromkeys(self._name_matches(words, fuzzy=True)))
+            results = list(results)
+            return results if limit is None else results[:limit]
+
+    def find(self, text):
+        """返回排名第一的匹配 ticker，没有匹配时返回 None"""
+        results = self.search(text, 1) if text.strip() else []
+        return results[0] if results else None
+
+# 全局搜索服务实例
+ticker_search = TickerSearch()
@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta, date, time
+from pytz import timezone
+from longport.openapi import Market, TradeSession
+from src.config.fetch_config import TRADING_CALENDAR_CONFIG
+from src.config.paths import TRADING_CALENDAR_PATH
+from src.utils.quote_pool import quote_pool
+from src.utils.logger import setup_logger
+
+logger = setup_logger("trading_calendar")
+
+ET = timezone('US/Eastern')
+# 提前收盘日的常规交易结束时间
+HALF_DAY_CLOSE = time(13, 0)
+# 常规交易时段在 requirements 锁定的 longport 2.x 中叫 Normal，其他版本为 Intraday
+REGULAR_SESSION = getattr(TradeSession, "Intraday", None) or TradeSession.Normal
+# TradeSession 不可哈希，按相等比较查找名称
+SESSION_NAMES = ((TradeSession.Pre, "Pre"), (REGULAR_SESSION, "Intraday"), (TradeSession.Post, "Post"))
+
+def session_name(trade_session):
+    return next((name for session, name in SESSION_NAMES if session == trade_session), str(trade_session))
+
+class TradingCalendar:
+    """
+    美股交易日历，缓存交易日和交易时段。
+
+    日历保存在内存和磁盘（TRADING_CALENDAR_PATH）中，超过 ttl 或不再覆盖今天时才向 LongPort
+    重新获取（trading_days + trading_session 两次调用），其余查询都在内存中完成。
+    LongPort 不可用时退回使用过期的磁盘缓存。
+    """
+    def __init__(self, path=TRADING_CALENDAR_PATH, ttl_hours=None):
+        self.path = path
+        self.ttl = timedelta(hours=ttl_hours if ttl_hours is not None else TRADING_CALENDAR_CONFIG["ttl_hours"])
+        self._data = None
+        self._lock = threading.Lock()
+
+    def _fresh(self, data, now):
+        fetched_at = datetime.fromisoformat(data["fetched_at"])
+        return now - fetched_at < self.ttl and date.fromisoformat(data["end"]) >= now.date()
+
+    def _read_disk(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取交易日历缓存失败: {e}")
+            return None
+
+    def _write_disk(self, data):
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"写入交易日历缓存失败: {e}")
+
+    def _fetch(self, now):
+        """从 LongPort 获取最近的交易日和美股交易时段"""
+        today = now.date()
+        start_date = today - timedelta(days=TRADING_CALENDAR_CONFIG["lookback_days"])
+        with quote_pool.connection() as ctx:
+            resp_tradingdays = ctx.trading_days(Market.US, start_date, today)
+            resp_trading_session = ctx.trading_session()
+
+        def to_date(d):
+            return d if isinstance(d, date) else datetime.strptime(d, "%Y-%B-%d").date()
+
+        sessions = []
+        for market_session in resp_trading_session:
+            if getattr(market_session, "market", None) == Market.US:
+                for session in getattr(market_session, "trade_sessions", []):
+                    sessions.append([
+                        session.begin_time.isoformat(),
+                        session.end_time.isoformat(),
+                        session_name(session.trade_session),
+                    ])
+                break
+        logger.info(f"交易日历已从 LongPort 更新: {start_date} ~ {today}")
+        return {
+            "fetched_at": now.replace(tzinfo=None).isoformat(),
+            "start": start_date.isoformat(),
+            "end": today.isoformat(),
+            "trading_days": sorted(to_date(d).isoformat() for d in resp_tradingdays.trading_days),
+            "half_trading_days": sorted(to_date(d).isoformat() for d in getattr(resp_tradingdays, "half_trading_days", [])),
+            "sessions": sessions,
+        }
+
+    def calendar(self, now=None):
+        """返回当前有效的日历数据，必要时从磁盘或 LongPort 加载"""
+        now = (now or datetime.now(ET)).replace(tzinfo=None)
+        with self._lock:
+            if self._data is not None and self._fresh(self._data, now):
+                return self._data
+            disk = self._read_disk()
+            if disk is not None and self._fresh(disk, now):
+                self._data = disk
+                return self._data
+            try:
+                self._data = self._fetch(now)
+                self._write_disk(self._data)
+            except Exception as e:
+                stale = self._data or disk
+                if stale is None:
+                    raise
+                logger.warning(f"从 LongPort 更新交易日历失败，使用过期缓存 ({stale['fetched_at']}): {e}")
+                self._data = stale
+            return self._data
+
+    def trading_days(self, now=None):
+        return [date.fromisoformat(d) for d in self.calendar(now)["trading_days"]]
+
+    def is_trading_day(self, day, now=None):
+        return day.isoformat() in self.calendar(now)["trading_days"]
+
+    def regular_close(self, day, now=None):
+        """day 当天常规交易时段的结束时间"""
+        data = self.calendar(now)
+        if day.isoformat() in data["half_trading_days"]:
+            return HALF_DAY_CLOSE
+        for begin, end, name in data["sessions"]:
+            if name == "Intraday":
+                return time.fromisoformat(end)
+        return time(16, 0)
+
+    def latest_session_date(self, now=None):
+        """
+        最近一个已收盘的常规交易日
+
+        今天是交易日且已过常规收盘时间时返回今天，否则返回上一个交易日。
+        """
+        now = now or datetime.now(ET)
+        today = now.date()
+        if self.is_trading_day(today, now) and now.time() >= self.regular_close(today, now):
+            return today
+        previous = [d for d in self.trading_days(now) if d < today]
+        if not previous:
+            return None
+        return max(previous)
+
+    def invalidate(self):
+        """清空内存和磁盘缓存，下次查询重新获取"""
+        with self._lock:
+            self._data = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+# 全局交易日历实例
+trading_calendar = TradingCalendar()
@@ -0,0 +1,5 @@
+import os
+
+# 测试不打开窗口；pyqtgraph 与程序一样使用 PySide6（环境中可能同时装有 PyQt）
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ.setdefault("PYQTGRAPH_QT_LIB", "PySide6")
@@ -0,0 +1,109 @@
+import pandas as pd
+from src.data_fetcher import prefetcher
+from src.utils.frame_cache import FrameCache
+
+
+# 从 2020-01-01 开始的 n 根日线，start 为起始偏移
+def bars(n, start=0):
+    dates = pd.date_range("2020-01-01", periods=start + n)[start:]
+    return pd.DataFrame({"Date": dates, "Close": [float(i) for i in range(start, start + n)]})
+
+
+def test_get_serves_requests_up_to_cached_length():
+    cache = FrameCache(max_bytes=1 << 20)
+    cache.put("A", "raw", bars(10, 90), complete=False)
+    assert cache.get("A", "raw", 5)["Close"].tolist() == [95.0, 96.0, 97.0, 98.0, 99.0]
+    assert len(cache.get("A", "raw", 10)) == 10
+    # 更长的请求或全部历史需要回查数据库
+    assert cache.get("A", "raw", 11) is None
+    assert cache.get("A", "raw") is None
+    assert cache.get("A", "forward", 5) is None
+
+def test_complete_entry_serves_any_length():
+    cache = FrameCache(max_bytes=1 << 20)
+    cache.put("A", "raw", bars(10), complete=True)
+    assert len(cache.get("A", "raw", 1000)) == 10
+    assert len(cache.get("A", "raw")) == 10
+    assert cache.contains("A", "raw")
+
+def test_missing_and_extend_prepend_older_rows():
+    cache = FrameCache(max_bytes=1 << 20)
+    cache.put("A", "raw", bars(10, 90), complete=False)
+    assert cache.missing("A", "raw", 5) is None
+    before, count = cache.missing("A", "raw", 30)
+    assert before == pd.Timestamp("2020-03-31") and count == 20
+    assert cache.extend("A", "raw", bars(20, 70), False, before)
+    assert cache.get("A", "raw", 30)["Close"].tolist() == [float(i) for i in range(70, 100)]
+    assert cache.missing("A", "raw")[1] is None
+
+def test_extend_is_dropped_after_invalidate():
+    cache = FrameCache(max_bytes=1 << 20)
+    cache.put("A", "raw", bars(10, 90), complete=False)
+    before, _ = cache.missing("A", "raw", 30)
+    cache.invalidate(["A"])
+    assert not cache.extend("A", "raw", bars(20, 70), False, before)
+    assert not cache.contains("A", "raw", 1)
+
+def test_extend_is_dropped_when_entry_was_replaced():
+    cache = FrameCache(max_bytes=1 << 20)
+    cache.put("A", "raw", bars(10, 90), complete=False)
+    before, _ = cache.missing("A", "raw", 30)
+    cache.put("A", "raw", bars(5, 96), complete=False)
+    assert not cache.extend("A", "raw", bars(20, 70), False, before)
+    assert len(cache.get("A", "raw", 5)) == 5
+
+def test_invalidate_drops_every_adjust_mode():
+    cache = FrameCache(max_bytes=1 << 20)
+    for ticker in ("A", "B"):
+        for adjust in ("raw", "forward"):
+            cache.put(ticker, adjust, bars(3), complete=True)
+    cache.invalidate(["A"])
+    assert not cache.contains("A", "raw") and not cache.contains("A", "forward")
+    assert cache.contains("B", "raw") and cache.contains("B", "forward")
+    assert cache.stats()["bytes"] == 2 * FrameCache.frame_size(bars(3))
+
+def test_least_recently_used_entries_are_evicted_first():
+    size = FrameCache.frame_size(bars(10))
+    cache = FrameCache(max_bytes=3 * size)
+    for ticker in ("A", "B", "C"):
+        cache.put(ticker, "raw", bars(10), complete=True)
+    # 读取 A 之后 B 成为最久未使用的条目
+    cache.get("A", "raw")
+    cache.put("D", "raw", bars(10), complete=True)
+    assert [cache.contains(t, "raw") for t in "ABCD"] == [True, False, True, True]
+    assert cache.stats()["bytes"] == 3 * size
+
+def test_newest_entry_is_kept_even_if_over_budget():
+    cache = FrameCache(max_bytes=1)
+    cache.put("A", "raw", bars(10), complete=True)
+    cache.put("B", "raw", bars(10), complete=True)
+    assert not cache.contains("A", "raw")
+    assert cache.contains("B", "raw")
+
+def test_hit_and_miss_counters():
+    cache = FrameCache(max_bytes=1 << 20)
+    cache.get("A", "raw")
+    cache.put("A", "raw", bars(3), complete=True)
+    cache.get("A", "raw")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_load_frame_only_queries_the_missing_older_rows(monkeypatch):
+    history = bars(100)
+    queries = []
+
+    # 模拟 fetch_data_from_db：返回 before 之前最近的 limit 根 K 线
+    def fetch_data_from_db(ticker, engine, limit=None, adjust="raw", before=None):
+        queries.append((limit, before))
+        df = history if before is None else history[history["Date"] < before]
+        return (df if limit is None else df.tail(limit)).reset_index(drop=True)
+
+    monkeypatch.setattr(prefetcher, "fetch_data_from_db", fetch_data_from_db)
+    cache = FrameCache(max_bytes=1 << 20)
+    assert len(prefetcher.load_frame("A", None, 20, cache=cache)) == 20
+    assert prefetcher.load_frame("A", None, 50, cache=cache)["Close"].tolist() == [float(i) for i in range(50, 100)]
+    # 请求全部历史时查到最早的 K 线，条目变为完整
+    assert len(prefetcher.load_frame("A", None, cache=cache)) == 100
+    assert len(prefetcher.load_frame("A", None, 500, cache=cache)) == 100
+    assert queries == [(20, None), (30, history["Date"].iloc[80]), (None, history["Date"].iloc[50])]
@@ -0,0 +1,126 @@
+import threading
+import pytest
+from src.data_fetcher.pipeline import PipelineScheduler, PipelineStage, StageCancelled, raise_if_cancelled
+
+
+# 返回固定值的阶段函数，同时记录执行顺序
+def stage(name, log, value=None, error=None):
+    def func(results, job):
+        log.append(name)
+        if error is not None:
+            raise error
+        return value
+    return func
+
+def statuses(summary):
+    return {name: status for name, (status, _) in summary.items()}
+
+
+def test_stages_run_after_their_dependencies_and_see_results():
+    log = []
+
+    def total(results, job):
+        log.append("total")
+        return results["a"] + results["b"]
+
+    scheduler = PipelineScheduler([
+        PipelineStage("total", total, depends_on=["a", "b"]),
+        PipelineStage("a", stage("a", log, 1)),
+        PipelineStage("b", stage("b", log, 2), depends_on=["a"]),
+    ])
+    summary = scheduler.run()
+    assert log == ["a", "b", "total"]
+    assert scheduler.results["total"] == 3
+    assert statuses(summary) == {"total": "done", "a": "done", "b": "done"}
+
+def test_failure_skips_downstream_but_not_independent_stages():
+    log = []
+    finished = []
+    scheduler = PipelineScheduler([
+        PipelineStage("fetch", stage("fetch", log, error=RuntimeError("boom"))),
+        PipelineStage("adjust", stage("adjust", log), depends_on=["fetch"]),
+        PipelineStage("states", stage("states", log), depends_on=["adjust"]),
+        PipelineStage("reference", stage("reference", log)),
+    ], max_workers=1)
+    summary = scheduler.run(on_stage_finished=lambda name, secs, status: finished.append((name, status)))
+    assert statuses(summary) == {"fetch": "failed", "adjust": "skipped", "states": "skipped", "reference": "done"}
+    assert "adjust" not in log and "states" not in log
+    assert sorted(finished) == sorted(statuses(summary).items())
+
+def test_cancel_marks_pending_stages_cancelled():
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow(results, job):
+        started.set()
+        release.wait(5)
+        # 取消请求之后才做完，仍记为 done
+        return "slow"
+
+    scheduler = PipelineScheduler([
+        PipelineStage("slow", slow),
+        PipelineStage("after", stage("after", []), depends_on=["slow"]),
+    ])
+    runner = threading.Thread(target=lambda: setattr(scheduler, "summary", scheduler.run()))
+    runner.start()
+    assert started.wait(5)
+    scheduler.cancel()
+    release.set()
+    runner.join(5)
+    assert statuses(scheduler.summary) == {"slow": "done", "after": "cancelled"}
+
+def test_stage_interrupted_at_safe_point_is_cancelled():
+    started = threading.Event()
+
+    def interruptible(results, job):
+        started.set()
+        job.cancel_event.wait(5)
+        job.check_cancelled()
+        return "unreachable"
+
+    scheduler = PipelineScheduler([
+        PipelineStage("long", interruptible),
+        PipelineStage("after", stage("after", []), depends_on=["long"]),
+    ])
+    runner = threading.Thread(target=lambda: setattr(scheduler, "summary", scheduler.run()))
+    runner.start()
+    assert started.wait(5)
+    scheduler.cancel()
+    runner.join(5)
+    assert statuses(scheduler.summary) == {"long": "cancelled", "after": "cancelled"}
+    assert "long" not in scheduler.results
+
+def test_downstream_of_interrupted_stage_is_skipped():
+    scheduler = PipelineScheduler([
+        PipelineStage("a", stage("a", [], error=StageCancelled("stop"))),
+        PipelineStage("b", stage("b", []), depends_on=["a"]),
+    ])
+    assert statuses(scheduler.run()) == {"a": "cancelled", "b": "skipped"}
+
+def test_progress_is_reported_with_stage_name():
+    progress = []
+
+    def reporting(results, job):
+        job.report(1, 2, "half")
+
+    PipelineScheduler([PipelineStage("a", reporting)]).run(on_stage_progress=lambda *args: progress.append(args))
+    assert progress == [("a", 1, 2, "half")]
+
+def test_unknown_dependency_is_rejected():
+    with pytest.raises(ValueError):
+        PipelineScheduler([PipelineStage("a", stage("a", []), depends_on=["missing"])])
+
+def test_cycle_is_rejected():
+    with pytest.raises(ValueError):
+        PipelineScheduler([
+            PipelineStage("a", stage("a", []), depends_on=["b"]),
+            PipelineStage("b", stage("b", []), depends_on=["a"]),
+        ])
+
+def test_raise_if_cancelled():
+    event = threading.Event()
+    raise_if_cancelled(None)
+    raise_if_cancelled(event)
+    event.set()
+    with pytest.raises(StageCancelled):
+        raise_if_cancelled(event, "stop")
@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+from longport.openapi import AdjustType
+from src.database import price_adjustment
+from src.database.price_adjustment import adjust_prices
+
+# 2020-06-01 一拆二，2021-06-01 一拆三；forward_factor 为该次及之后所有拆股的乘积
+FACTORS = pd.DataFrame({
+    "execution_date": pd.to_datetime(["2020-06-01", "2021-06-01"]),
+    "ratio": [2.0, 3.0],
+    "forward_factor": [6.0, 3.0],
+})
+
+
+# 同一只股票在三个阶段的原始 K 线，拆股后价格按比例下降、成交量按比例上升
+def raw_bars():
+    close = [60.0, 30.0, 30.0, 10.0]
+    return pd.DataFrame({
+        "Date": pd.to_datetime(["2020-01-02", "2020-06-01", "2020-12-01", "2021-12-01"]),
+        "Open": close, "High": close, "Low": close, "Close": close,
+        "Volume": [100, 200, 200, 600],
+    })
+
+
+def test_forward_adjust_divides_earlier_bars_by_later_splits():
+    df = adjust_prices(raw_bars(), FACTORS, "forward")
+    assert df["Close"].tolist() == pytest.approx([10.0, 10.0, 10.0, 10.0])
+    assert df["Volume"].tolist() == [600, 600, 600, 600]
+
+def test_bar_on_execution_date_is_already_post_split():
+    df = adjust_prices(raw_bars(), FACTORS, "forward")
+    # 2020-06-01 当天的 K 线只受之后的 2021 拆股影响
+    assert df["Close"].iloc[1] == pytest.approx(30.0 / 3.0)
+
+def test_backward_adjust_keeps_the_earliest_prices():
+    df = adjust_prices(raw_bars(), FACTORS, "backward")
+    assert df["Close"].tolist() == pytest.approx([60.0, 60.0, 60.0, 60.0])
+    assert df["Volume"].tolist() == [100, 100, 100, 100]
+
+def test_raw_and_missing_factors_return_input_unchanged():
+    bars = raw_bars()
+    assert adjust_prices(bars, FACTORS, "raw") is bars
+    assert adjust_prices(bars, FACTORS.iloc[0:0], "forward") is bars
+
+def test_input_frame_is_not_modified():
+    bars = raw_bars()
+    adjust_prices(bars, FACTORS, "forward")
+    assert bars["Close"].tolist() == [60.0, 30.0, 30.0, 10.0]
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        adjust_prices(raw_bars(), FACTORS, "split")
+
+
+@pytest.mark.parametrize("mode, adjust_type, options, default", [
+    ("forward", AdjustType.ForwardAdjust, ["raw"], "raw"),
+    ("raw", AdjustType.NoAdjust, ["raw", "forward", "backward"], "forward"),
+])
+def test_recorded_storage_mode_decides_writes_and_read_options(monkeypatch, mode, adjust_type, options, default):
+    monkeypatch.setattr(price_adjustment, "_storage_mode", mode)
+    assert price_adjustment.storage_adjust_type() == adjust_type
+    assert [adjust for _, adjust in price_adjustment.read_adjust_options()] == options
+    assert price_adjustment.default_read_adjust() == default
+
+def test_storage_mode_wins_over_the_flag(monkeypatch):
+    # 已有前复权数据时打开 adjust_on_read 不会改变写入方式，避免新旧数据口径混在一起
+    monkeypatch.setattr(price_adjustment, "_storage_mode", "forward")
+    monkeypatch.setitem(price_adjustment.FETCH_CONFIG, "adjust_on_read", True)
+    assert not price_adjustment.adjust_on_read()
+    assert price_adjustment.storage_adjust_type() == AdjustType.ForwardAdjust
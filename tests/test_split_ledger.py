@@ -0,0 +1,119 @@
+import threading
+from datetime import date
+import pytest
+from src.data_fetcher import incremental_ms
+from src.data_fetcher.pipeline import StageCancelled
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        self.last_sql = sql
+
+    def fetchall(self):
+        # 只有查询台账的 SELECT 会读取结果
+        return [(split_id,) for split_id in self.conn.applied_ids]
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """记录提交和回滚，台账中已应用的 split_id 由 applied_ids 给出"""
+    def __init__(self, applied_ids=()):
+        self.applied_ids = set(applied_ids)
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def ledger(monkeypatch):
+    """替换数据库访问，返回记录每个事务内容的对象"""
+    state = type("Ledger", (), {})()
+    state.conn = FakeConnection()
+    state.adjusted = []
+    state.ledger_rows = []
+    state.invalidated = []
+    state.fail_on = None
+
+    def apply_split_adjustments(tickers_info, conn=None):
+        if state.fail_on is not None and any(info[0] == state.fail_on for info in tickers_info):
+            raise RuntimeError("boom")
+        state.adjusted.append(list(tickers_info))
+        return len(tickers_info)
+
+    def execute_values(cursor, sql, rows, *args, **kwargs):
+        if "split_adjustment_ledger" in sql:
+            state.ledger_rows.extend(rows)
+
+    monkeypatch.setattr(incremental_ms, "get_db_connection", lambda: state.conn)
+    monkeypatch.setattr(incremental_ms, "apply_split_adjustments", apply_split_adjustments)
+    monkeypatch.setattr(incremental_ms, "execute_values", execute_values)
+    monkeypatch.setattr(incremental_ms, "invalidate_indicator_states", lambda cursor, tickers: state.invalidated.append(set(tickers)))
+    return state
+
+def split(split_id, ticker, day=1):
+    return (split_id, ticker, date(2024, 1, day), 1.0, 2.0)
+
+
+def test_already_applied_splits_are_skipped(ledger):
+    ledger.conn.applied_ids = {"s1"}
+    applied = incremental_ms.apply_pending_splits([split("s1", "A"), split("s2", "B")])
+    assert applied == 1
+    assert ledger.adjusted == [[("B", date(2024, 1, 1), 1.0, 2.0)]]
+    assert [row[0] for row in ledger.ledger_rows] == ["s2"]
+
+def test_rerun_with_everything_applied_changes_nothing(ledger):
+    ledger.conn.applied_ids = {"s1", "s2"}
+    assert incremental_ms.apply_pending_splits([split("s1", "A"), split("s2", "B")]) == 0
+    assert ledger.adjusted == []
+    assert ledger.ledger_rows == []
+
+def test_each_ticker_batch_is_one_transaction(ledger):
+    splits = [split("a1", "A", 1), split("a2", "A", 2), split("b1", "B"), split("c1", "C")]
+    applied = incremental_ms.apply_pending_splits(splits, tickers_per_txn=2)
+    assert applied == 4
+    # 同一 ticker 的拆股在同一个事务内，按 ticker 分批
+    assert [[info[0] for info in batch] for batch in ledger.adjusted] == [["A", "A", "B"], ["C"]]
+    assert ledger.invalidated == [{"A", "B"}, {"C"}]
+    # 建表一次 + 每批一次
+    assert ledger.conn.commits == 3
+
+def test_failed_batch_is_rolled_back_and_earlier_batches_kept(ledger):
+    ledger.fail_on = "B"
+    with pytest.raises(RuntimeError):
+        incremental_ms.apply_pending_splits([split("a1", "A"), split("b1", "B")], tickers_per_txn=1)
+    assert [row[0] for row in ledger.ledger_rows] == ["a1"]
+    assert ledger.conn.rollbacks == 1
+
+def test_cancel_stops_between_transactions(ledger):
+    cancel_event = threading.Event()
+    progress = []
+
+    def on_progress(current, total, message):
+        progress.append((current, total))
+        cancel_event.set()
+
+    with pytest.raises(StageCancelled):
+        incremental_ms.apply_pending_splits(
+            [split("a1", "A"), split("b1", "B"), split("c1", "C")],
+            tickers_per_txn=1, progress_callback=on_progress, cancel_event=cancel_event,
+        )
+    # 第一个事务已提交，其余留到下次运行
+    assert progress == [(1, 3)]
+    assert [row[0] for row in ledger.ledger_rows] == ["a1"]
@@ -0,0 +1,73 @@
+import random
+from datetime import datetime, timedelta
+import pytest
+from src.data_fetcher.incremental_ms import build_split_segments
+
+D = datetime
+
+
+# 按分段计算每根 K 线的调整因子（与 apply_split_adjustments 的 UPDATE 条件一致）
+def segment_factor(segments, ticker, timestamp):
+    factors = [
+        factor for seg_ticker, seg_start, seg_end, factor in segments
+        if seg_ticker == ticker and (seg_start is None or timestamp >= seg_start) and timestamp < seg_end
+    ]
+    assert len(factors) <= 1, "每根 K 线最多被一条分段命中"
+    return factors[0] if factors else 1.0
+
+# 逐次拆股调整的参考实现：每次拆股把 execution_date 之前的 K 线除以 ratio
+def sequential_factor(splits, ticker, timestamp):
+    factor = 1.0
+    for split_ticker, execution_date, split_from, split_to in splits:
+        if split_ticker == ticker and timestamp < execution_date:
+            factor *= split_to / split_from
+    return factor
+
+
+def test_single_split_covers_all_earlier_rows():
+    assert build_split_segments([("AAPL", D(2020, 8, 31), 1, 4)]) == [("AAPL", None, D(2020, 8, 31), 4.0)]
+
+def test_multiple_splits_accumulate_factors_backwards():
+    segments = build_split_segments([
+        ("X", D(2021, 6, 1), 1, 3),
+        ("X", D(2020, 6, 1), 1, 2),
+    ])
+    assert sorted(segments, key=lambda s: s[2]) == [
+        ("X", None, D(2020, 6, 1), 6.0),
+        ("X", D(2020, 6, 1), D(2021, 6, 1), 3.0),
+    ]
+
+def test_same_day_splits_are_merged_into_one_segment():
+    segments = build_split_segments([
+        ("X", D(2020, 6, 1), 1, 2),
+        ("X", D(2020, 6, 1), 1, 5),
+    ])
+    assert segments == [("X", None, D(2020, 6, 1), 10.0)]
+
+def test_reverse_split_factor_is_below_one():
+    assert build_split_segments([("X", D(2022, 1, 3), 10, 1)]) == [("X", None, D(2022, 1, 3), 0.1)]
+
+def test_tickers_are_segmented_independently():
+    segments = build_split_segments([
+        ("A", D(2020, 1, 2), 1, 2),
+        ("B", D(2020, 1, 2), 1, 3),
+    ])
+    assert sorted(segments) == [("A", None, D(2020, 1, 2), 2.0), ("B", None, D(2020, 1, 2), 3.0)]
+
+def test_empty_input():
+    assert build_split_segments([]) == []
+
+@pytest.mark.parametrize("seed", range(20))
+def test_segments_match_sequential_adjustment(seed):
+    rng = random.Random(seed)
+    start = D(2015, 1, 1)
+    splits = [
+        (ticker, start + timedelta(days=rng.randrange(0, 3000)), rng.choice([1, 2, 10]), rng.choice([1, 3, 4, 20]))
+        for ticker in ("A", "B")
+        for _ in range(rng.randrange(1, 6))
+    ]
+    segments = build_split_segments(splits)
+    for ticker in ("A", "B"):
+        for days in range(0, 3100, 7):
+            timestamp = start + timedelta(days=days)
+            assert segment_factor(segments, ticker, timestamp) == pytest.approx(sequential_factor(splits, ticker, timestamp))
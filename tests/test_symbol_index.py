@@ -0,0 +1,99 @@
+import random
+import pytest
+from src.utils.symbol_index import SymbolIndex, edit_distance
+
+SYMBOLS = ["AAPL", "AA", "AAL", "MAA", "BAAX", "GOOG", "GOOGL", "MSFT", "TSLA", "BRK.B", "APLE", "PLAY"]
+
+
+@pytest.fixture
+def index():
+    return SymbolIndex(SYMBOLS)
+
+
+# 逐个扫描的参考实现，排序规则与 SymbolIndex.search 一致
+def scan_search(symbols, text):
+    text = text.strip().lower()
+    prefix = sorted((s for s in symbols if s.lower().startswith(text)), key=lambda s: (s.lower() != text, s.lower()))
+    contains = sorted(
+        (s for s in symbols if text in s.lower() and not s.lower().startswith(text)),
+        key=lambda s: (s.lower().find(text), len(s), s.lower()),
+    )
+    return prefix + contains
+
+
+def test_exact_then_prefix_then_contains(index):
+    # 包含匹配中位置相同时较短的代码在前
+    assert index.search("aa") == ["AA", "AAL", "AAPL", "MAA", "BAAX"]
+
+def test_search_is_case_insensitive_and_trims(index):
+    assert index.search("  GoOg ") == ["GOOG", "GOOGL"]
+
+def test_contains_longer_than_gram_size(index):
+    # 超过 trigram 的查询由多个 trigram 倒排表求交集
+    assert index.search("ooGL") == ["GOOGL"]
+    assert index.search("lay") == ["PLAY"]
+    assert index.search("xyzw") == []
+
+def test_limit_and_empty_query(index):
+    assert index.search("a", 2) == ["AA", "AAL"]
+    assert index.search("") == SYMBOLS
+    assert index.search("", 3) == SYMBOLS[:3]
+
+def test_find_returns_best_match(index):
+    assert index.find("brk") == "BRK.B"
+    assert index.find("zzz") is None
+    assert index.find(" ") is None
+
+def test_prefix_is_alphabetical(index):
+    assert index.prefix("goo") == ["GOOG", "GOOGL"]
+    assert index.prefix("") == sorted(SYMBOLS, key=str.lower)
+
+def test_add_ignores_duplicates_and_is_searchable():
+    index = SymbolIndex(["MSFT"])
+    assert index.add(["NVDA", "MSFT", "NVDA"]) == 1
+    assert len(index) == 2 and "NVDA" in index
+    assert index.search("vd") == ["NVDA"]
+
+@pytest.mark.parametrize("seed", range(5))
+def test_search_matches_linear_scan(seed):
+    rng = random.Random(seed)
+    symbols = list(dict.fromkeys("".join(rng.choice("ABCD") for _ in range(rng.randint(1, 5))) for _ in range(200)))
+    # 一次性构建和逐个加入得到相同的索引
+    index = SymbolIndex(symbols[:100])
+    for symbol in symbols[100:]:
+        index.add([symbol])
+    for _ in range(50):
+        text = "".join(rng.choice("abcd") for _ in range(rng.randint(1, 5)))
+        assert index.search(text) == scan_search(symbols, text)
+
+
+def test_edit_distance_counts_transposition_as_one_edit():
+    assert edit_distance("aapl", "aapl", 2) == 0
+    assert edit_distance("aapl", "apal", 2) == 1
+    assert edit_distance("msft", "msf", 2) == 1
+    assert edit_distance("tsla", "tsxa", 2) == 1
+    assert edit_distance("goog", "gogle", 3) == 3
+
+def test_edit_distance_stops_beyond_max():
+    assert edit_distance("aapl", "msft", 1) == 2
+    assert edit_distance("a", "abcdef", 2) == 3
+
+def test_similar_orders_by_distance(index):
+    # 距离相同时共享 bigram 多的在前
+    assert index.similar("apal") == [("AAPL", 1), ("AAL", 1)]
+    assert index.similar("gogl", 1) == [("GOOGL", 1)]
+    assert index.similar("googl", 2, limit=1) == [("GOOGL", 0)]
+    assert [symbol for symbol, distance in index.similar("msfr", 1)] == ["MSFT"]
+    assert index.similar("zzzz") == []
+    assert index.similar("") == []
+
+@pytest.mark.parametrize("seed", range(5))
+def test_similar_finds_every_symbol_within_distance(seed):
+    rng = random.Random(seed)
+    symbols = list(dict.fromkeys("".join(rng.choice("ABCDE") for _ in range(rng.randint(2, 6))) for _ in range(300)))
+    index = SymbolIndex(symbols)
+    for _ in range(30):
+        text = "".join(rng.choice("abcde") for _ in range(rng.randint(2, 6)))
+        for max_distance in (1, 2):
+            expected = {s for s in symbols if edit_distance(text, s.lower(), max_distance) <= max_distance}
+            assert {s for s, _ in index.similar(text, max_distance)} == expected
@@ -0,0 +1,94 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+from src.utils.ticker_search import TickerSearch
+
+ROWS = [
+    ("AAPL", "Apple Inc."),
+    ("APLE", "Apple Hospitality REIT, Inc."),
+    ("MSFT", "Microsoft Corporation"),
+    ("GOOGL", "Alphabet Inc. Class A"),
+    ("GOOG", "Alphabet Inc. Class C"),
+    ("NVDA", "NVIDIA Corporation"),
+    ("BRK.B", None),
+]
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    return str(tmp_path / "ticker_search.json")
+
+@pytest.fixture
+def search(snapshot_path):
+    search = TickerSearch(path=snapshot_path, ttl_days=7)
+    search.load(lambda: ROWS)
+    return search
+
+def write_snapshot(path, rows, age_days):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"fetched_at": (datetime.now() - timedelta(days=age_days)).isoformat(), "tickers": rows}, f)
+
+def fail():
+    raise RuntimeError("database unavailable")
+
+
+def test_symbol_matches_rank_before_name_matches(search):
+    # 代码前缀匹配 > 名称单词前缀匹配（名称短的在前）
+    assert search.search("apple") == ["AAPL", "APLE"]
+    assert search.search("goog") == ["GOOG", "GOOGL"]
+
+def test_multi_word_name_query_requires_every_word(search):
+    assert search.search("apple hosp") == ["APLE"]
+    # 单个字母也按单词前缀匹配，"c" 同时命中 Class 和 Corporation
+    assert search.search("alphabet class c") == ["GOOG", "GOOGL"]
+    assert search.search("alph corp") == []
+
+def test_fuzzy_name_and_symbol_matches(search):
+    assert search.search("mircosoft") == ["MSFT"]
+    assert search.search("nvdia") == ["NVDA"]
+    assert search.find("msfr") == "MSFT"
+
+def test_empty_query_and_lookups(search):
+    assert search.search("") == sorted(ticker for ticker, _ in ROWS)
+    assert search.search("", 2) == ["AAPL", "APLE"]
+    assert search.name("MSFT") == "Microsoft Corporation"
+    assert search.name("BRK.B") == ""
+    assert "NVDA" in search and "TSLA" not in search
+    assert search.find("zzzz") is None
+
+def test_add_indexes_new_tickers_and_renames(search, snapshot_path):
+    assert search.add([("TSLA", "Tesla, Inc."), ("MSFT", "Contoso Ltd")]) == 1
+    assert search.search("tesla") == ["TSLA"]
+    # 改名后旧名称的单词不再命中
+    assert "MSFT" not in search.search("microsoft")
+    assert search.search("contoso") == ["MSFT"]
+    with open(snapshot_path, encoding="utf-8") as f:
+        assert ["TSLA", "Tesla, Inc."] in json.load(f)["tickers"]
+
+
+def test_fresh_snapshot_is_loaded_without_fetching(snapshot_path):
+    write_snapshot(snapshot_path, [["AAPL", "Apple Inc."]], age_days=1)
+    search = TickerSearch(path=snapshot_path, ttl_days=7)
+    assert search.load(fail) == 1
+    assert search.find("apple") == "AAPL"
+
+def test_expired_snapshot_is_rebuilt_and_rewritten(snapshot_path):
+    write_snapshot(snapshot_path, [["AAPL", "Apple Inc."]], age_days=30)
+    search = TickerSearch(path=snapshot_path, ttl_days=7)
+    assert search.load(lambda: ROWS) == len(ROWS)
+    # 新快照在 ttl 内可以直接加载
+    assert TickerSearch(path=snapshot_path, ttl_days=7).load(fail) == len(ROWS)
+
+def test_failed_rebuild_falls_back_to_stale_snapshot(snapshot_path):
+    write_snapshot(snapshot_path, [["AAPL", "Apple Inc."]], age_days=30)
+    search = TickerSearch(path=snapshot_path, ttl_days=7)
+    assert search.load(fail) == 1
+    assert search.fetched_at < datetime.now() - timedelta(days=7)
+
+def test_failed_rebuild_without_snapshot_raises(snapshot_path):
+    with pytest.raises(RuntimeError):
+        TickerSearch(path=snapshot_path, ttl_days=7).load(fail)
+
+def test_force_ignores_fresh_snapshot(snapshot_path):
+    write_snapshot(snapshot_path, [["AAPL", "Apple Inc."]], age_days=0)
+    assert TickerSearch(path=snapshot_path, ttl_days=7).load(lambda: ROWS, force=True) == len(ROWS)